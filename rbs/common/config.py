@@ -17,6 +17,7 @@ import json
 import os
 
 import boto3
+from botocore.exceptions import ClientError
 
 import rbs.schemas.validate
 import aws_util
@@ -29,6 +30,57 @@ def config_filename():
       default=os.path.expanduser("~/.bazel_bf/config.json"))
 
 
+def config_cache_filename():
+  """Returns the name of the file the remote configuration is cached in."""
+  return os.getenv(
+      "INFRA_CONFIG_CACHE",
+      default=os.path.expanduser("~/.bazel_bf/config_cache.json"))
+
+
+def read_config_cache(local_config, path=None):
+  """Returns the cached remote configuration entry for the S3 object given in the
+  local configuration, or `None`."""
+  path = path or config_cache_filename()
+  try:
+    with open(path, 'r') as f:
+      entry = json.load(f)
+  except (IOError, ValueError):
+    return None
+  if (entry.get("s3_bucket") != local_config["s3_bucket"] or
+      entry.get("s3_key") != local_config["s3_key"]):
+    return None
+  return entry
+
+
+def write_config_cache(entry, path=None):
+  """Caches a remote configuration entry."""
+  path = path or config_cache_filename()
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path + ".tmp", 'w') as f:
+    json.dump(entry, f, sort_keys=True)
+  os.rename(path + ".tmp", path)
+
+
+def clear_config_cache(path=None):
+  """Forgets the cached remote configuration."""
+  path = path or config_cache_filename()
+  try:
+    os.remove(path)
+  except OSError as e:
+    if e.errno != 2:  # No such file or directory
+      raise
+
+
+def _parse_config(config_str):
+  """Parses a JSON remote configuration."""
+  try:
+    return json.loads(config_str)
+  except ValueError as e:
+    raise Exception("cannot read JSON config:\n%s\nValueError: %s\n" %
+                    (config_str, e.message))
+
+
 def write_local_config(region, s3_bucket, s3_key, path=None, validate=True):
   """Commits the local configuration."""
   if not path:
@@ -63,27 +115,54 @@ def read_local_config(path=None, validate=True):
 
 
 def read_config(s3=None, local_config=None, validate=True):
-  """Reads the remote configuration."""
+  """Reads the remote configuration.
+
+  The configuration is cached locally along with the ETag of the S3 object, and
+  is downloaded and validated again only if the S3 object changed.
+  """
   config_str = os.getenv("INFRA_CONFIG")
-  if not config_str:
-    if not local_config:
-      local_config = read_local_config()
-    if not s3:
-      s3 = boto3.client("s3", region_name=local_config["region"])
+  if config_str:
+    main_config = _parse_config(config_str)
+    if validate:
+      rbs.schemas.validate.validate(main_config, "main_config")
+    return main_config
 
-    config_str = s3.get_object(
-        Bucket=local_config["s3_bucket"],
-        Key=local_config["s3_key"])["Body"].read()
+  if not local_config:
+    local_config = read_local_config()
+  if not s3:
+    s3 = boto3.client("s3", region_name=local_config["region"])
 
+  entry = read_config_cache(local_config)
+  kwargs = {}
+  if entry:
+    kwargs["IfNoneMatch"] = entry["etag"]
   try:
-    main_config = json.loads(config_str)
-    print "Remote configuration: %s" % main_config
-  except ValueError as e:
-    raise Exception("cannot read JSON config:\n%s\nValueError: %s\n" %
-                    (config_str, e.message))
-
+    obj = s3.get_object(
+        Bucket=local_config["s3_bucket"], Key=local_config["s3_key"], **kwargs)
+  except ClientError as e:
+    if not entry or e.response["Error"]["Code"] not in ["304", "NotModified"]:
+      raise e
+    if validate and not entry["validated"]:
+      rbs.schemas.validate.validate(entry["config"], "main_config")
+      entry["validated"] = True
+      write_config_cache(entry)
+    return entry["config"]
+
+  main_config = _parse_config(obj["Body"].read())
+  print "Remote configuration: s3://%s/%s (version: %s)" % (
+      local_config["s3_bucket"], local_config["s3_key"],
+      obj.get("VersionId", "<none>"))
   if validate:
     rbs.schemas.validate.validate(main_config, "main_config")
+  if obj.get("ETag"):
+    write_config_cache({
+        "s3_bucket": local_config["s3_bucket"],
+        "s3_key": local_config["s3_key"],
+        "etag": obj["ETag"],
+        "version_id": obj.get("VersionId"),
+        "validated": validate,
+        "config": main_config,
+    })
   return main_config
 
 
@@ -101,6 +180,7 @@ def write_config(next_config, s3=None, local_config=None, validate=True):
       key=local_config["s3_key"],
       content=json.dumps(next_config, indent=2, sort_keys=True),
       desc="Remote config")
+  clear_config_cache()
   return {
       "bucket": local_config["s3_bucket"],
       "key": local_config["s3_key"],
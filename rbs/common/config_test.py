@@ -26,6 +26,14 @@ class ConfigTest(unittest.TestCase):
 
   def setUp(self):
     self.tmpdir = os.getenv("TEST_TMPDIR")
+    self.cache_path = os.path.join(
+        tempfile.mkdtemp(dir=self.tmpdir), "config_cache.json")
+    os.environ["INFRA_CONFIG_CACHE"] = self.cache_path
+    self.local_config = {
+        "region": "eu-west-1",
+        "s3_bucket": "bucket",
+        "s3_key": "key",
+    }
 
   def test_write_local_config(self):
     with tempfile.NamedTemporaryFile(dir=self.tmpdir) as f:
@@ -65,6 +73,98 @@ class ConfigTest(unittest.TestCase):
     }
     cfg = config.read_config(s3, local_config=local_config, validate=False)
     self.assertEqual(cfg, {"foo": "bar"})
+    self.assertFalse(os.path.exists(self.cache_path))
+
+  def _add_get_object_response(self, stubber, content, etag):
+    body = lambda: 0
+    body.read = lambda: content
+    stubber.add_response(
+        'get_object',
+        service_response={
+            "Body": body,
+            "ETag": etag,
+            "VersionId": "v_" + etag,
+        },
+        expected_params={
+            "Bucket": "bucket",
+            "Key": "key"
+        })
+
+  def test_read_config_not_modified(self):
+    s3 = boto3.client('s3')
+    stubber = Stubber(s3)
+    self._add_get_object_response(stubber, "{\"foo\": \"bar\"}", "etag1")
+    stubber.add_client_error(
+        'get_object',
+        service_error_code="304",
+        service_message="Not Modified",
+        http_status_code=304,
+        expected_params={
+            "Bucket": "bucket",
+            "Key": "key",
+            "IfNoneMatch": "etag1",
+        })
+    stubber.activate()
+
+    cfg = config.read_config(
+        s3, local_config=self.local_config, validate=False)
+    self.assertEqual(cfg, {"foo": "bar"})
+    entry = config.read_config_cache(self.local_config)
+    self.assertEqual(entry["etag"], "etag1")
+    self.assertEqual(entry["version_id"], "v_etag1")
+
+    cfg = config.read_config(
+        s3, local_config=self.local_config, validate=False)
+    self.assertEqual(cfg, {"foo": "bar"})
+    stubber.assert_no_pending_responses()
+
+  def test_read_config_modified(self):
+    s3 = boto3.client('s3')
+    stubber = Stubber(s3)
+    config.write_config_cache({
+        "s3_bucket": "bucket",
+        "s3_key": "key",
+        "etag": "etag1",
+        "version_id": None,
+        "validated": False,
+        "config": {
+            "foo": "bar"
+        },
+    })
+    body = lambda: 0
+    body.read = lambda: "{\"foo\": \"baz\"}"
+    stubber.add_response(
+        'get_object',
+        service_response={
+            "Body": body,
+            "ETag": "etag2",
+        },
+        expected_params={
+            "Bucket": "bucket",
+            "Key": "key",
+            "IfNoneMatch": "etag1",
+        })
+    stubber.activate()
+
+    cfg = config.read_config(
+        s3, local_config=self.local_config, validate=False)
+    self.assertEqual(cfg, {"foo": "baz"})
+    self.assertEqual(
+        config.read_config_cache(self.local_config)["etag"], "etag2")
+
+  def test_read_config_cache_other_object(self):
+    config.write_config_cache({
+        "s3_bucket": "bucket",
+        "s3_key": "other_key",
+        "etag": "etag1",
+        "version_id": None,
+        "validated": False,
+        "config": {},
+    })
+    self.assertIsNone(config.read_config_cache(self.local_config))
+    config.clear_config_cache()
+    config.clear_config_cache()
+    self.assertFalse(os.path.exists(self.cache_path))
 
 
 if __name__ == '__main__':
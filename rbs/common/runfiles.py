@@ -20,6 +20,9 @@ import atexit
 import shutil
 import sys
 import platform
+import hashlib
+import zipfile
+import fcntl
 
 _manifest = None
 
@@ -77,32 +80,182 @@ def go_bin_folder():
   }[platform.system()]
 
 
-_extraction_dir_set = False
+def cache_dir():
+  """Returns the directory in which extracted runfiles persist across runs."""
+  return os.getenv(
+      "BAZEL_BF_CACHE", default=os.path.expanduser("~/.cache/bazel_bf"))
 
 
-def ensure_extraction_dir():
-  """Set a safe extraction dir (the default is unsafe) for runfiles during bundling."""
+# How many versions of the `.par` bundle to keep extracted in the cache.
+MAX_EXTRACTIONS = 3
+
+_extraction_dir = None
+# Shared lock on the extraction dir, held for the lifetime of the process so that
+# concurrent invocations do not garbage-collect it.
+_extraction_lock = None
+
+
+def ensure_extraction_dir(par_path=None):
+  """Set a safe extraction dir (the default is unsafe) for runfiles during bundling.
+
+  The extraction dir persists across runs: it is content-addressed by the
+  `.par` bundle, and is shared by all the invocations of the same bundle.
+  Returns the extraction dir, or `None` if the runfiles do not need extraction.
+  """
   if not is_bundled():
-    return
+    return None
 
-  global _extraction_dir_set  # pylint: disable=global-statement
-  if not _extraction_dir_set:
-    _extraction_dir_set = True
-    extraction_tmpdir = tempfile.mkdtemp()
-    atexit.register(
-        lambda: shutil.rmtree(extraction_tmpdir, ignore_errors=True))
+  global _extraction_dir, _extraction_lock  # pylint: disable=global-statement
+  if _extraction_dir is None:
+    par_path = par_path or sys.argv[0]
+    if zipfile.is_zipfile(par_path):
+      with zipfile.ZipFile(par_path) as par:
+        dirname = os.path.join(cache_dir(), zip_digest(par))
+      _extraction_lock = _lock_extraction_dir(dirname)
+      _extraction_dir = dirname
+      gc_extraction_dirs()
+    else:
+      _extraction_dir = tempfile.mkdtemp()
+      atexit.register(
+          lambda: shutil.rmtree(_extraction_dir, ignore_errors=True))
     import pkg_resources
-    pkg_resources.set_extraction_path(extraction_tmpdir)
+    pkg_resources.set_extraction_path(_extraction_dir)
+  return _extraction_dir
+
+
+def zip_digest(par):
+  """Digest of the content of a zip file, derived from the CRCs in its central
+  directory (nothing needs to be decompressed)."""
+  h = hashlib.sha1()
+  for info in sorted(par.infolist(), key=lambda info: info.filename):
+    h.update("%s %d %d\n" % (info.filename, info.CRC, info.file_size))
+  return h.hexdigest()
+
+
+def _makedirs(dirname):
+  """Creates a directory and its parents, if they do not exist already."""
+  try:
+    os.makedirs(dirname)
+  except OSError:
+    if not os.path.isdir(dirname):
+      raise
+
+
+def _open_lock(dirname):
+  """Opens the lock file of an extraction dir."""
+  return open(dirname + ".lock", 'a')
+
 
+def _lock_extraction_dir(dirname):
+  """Creates an extraction dir if necessary, marks it as recently used, and
+  returns a shared lock on it."""
+  _makedirs(os.path.dirname(dirname))
+  while True:
+    lock = _open_lock(dirname)
+    fcntl.flock(lock, fcntl.LOCK_SH)
+    # The lock file could have been removed by `gc_extraction_dirs` in the
+    # meantime.
+    try:
+      if os.path.samestat(os.fstat(lock.fileno()), os.stat(lock.name)):
+        break
+    except OSError:
+      pass
+    lock.close()
+  _makedirs(dirname)
+  # The modification time of the extraction dirs is used for LRU eviction.
+  os.utime(dirname, None)
+  return lock
 
-def extract_botocore_data():
-  """Extracts the `botocore` data folder if the current Python executable is bundled."""
+
+def gc_extraction_dirs(keep=MAX_EXTRACTIONS):
+  """Removes the least recently used extraction dirs, keeping `keep` of them.
+
+  The extraction dirs that are in use are never removed.
+  """
+  root = cache_dir()
+  dirs = [
+      os.path.join(root, name)
+      for name in os.listdir(root)
+      if os.path.isdir(os.path.join(root, name))
+  ]
+  dirs.sort(key=os.path.getmtime, reverse=True)
+  for dirname in dirs[keep:]:
+    if dirname == _extraction_dir:
+      continue
+    lock = _open_lock(dirname)
+    try:
+      fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+      # In use.
+      lock.close()
+      continue
+    shutil.rmtree(dirname, ignore_errors=True)
+    os.remove(lock.name)
+    lock.close()
+
+
+BOTOCORE_DATA = "botocore/data/"
+
+
+def botocore_data_entries(par):
+  """Returns the entries of the `botocore` data folder in the given `.par` zip
+  file, along with the prefix of the folder."""
+  entries = []
+  prefix = None
+  for info in par.infolist():
+    if prefix is None:
+      i = info.filename.find(BOTOCORE_DATA)
+      if i == 0 or (i > 0 and info.filename[i - 1] == "/"):
+        prefix = info.filename[:i + len(BOTOCORE_DATA)]
+    if prefix is not None and info.filename.startswith(prefix):
+      entries.append(info)
+  return (prefix, entries)
+
+
+def extract_botocore_data(par_path=None):
+  """Extracts the `botocore` data folder if the current Python executable is bundled.
+
+  The folder is extracted once into the extraction dir, and the extraction is
+  reused by subsequent runs.
+  """
   if not is_bundled():
     return
 
-  ensure_extraction_dir()
+  par_path = par_path or sys.argv[0]
+  if not zipfile.is_zipfile(par_path):
+    # Not running from a zip file: botocore finds its data on its own.
+    return
 
-  import pkg_resources
-  botocore = pkg_resources.Requirement.parse("botocore==1.9.3")
-  dirname = pkg_resources.resource_filename(botocore, "")
+  dirname = os.path.join(ensure_extraction_dir(par_path), "botocore_data")
+  if not os.path.isdir(dirname):
+    with zipfile.ZipFile(par_path) as par:
+      (prefix, entries) = botocore_data_entries(par)
+      if not entries:
+        return
+      _extract_atomically(par, prefix, entries, dirname)
   os.environ["AWS_DATA_PATH"] = dirname
+
+
+def _extract_atomically(par, prefix, entries, dirname):
+  """Extracts zip entries below `prefix` into `dirname`, renaming a temporary
+  directory into place so that concurrent runs never see a partial extraction."""
+  _makedirs(os.path.dirname(dirname))
+  tmpdir = tempfile.mkdtemp(dir=os.path.dirname(dirname))
+  try:
+    for info in entries:
+      relpath = info.filename[len(prefix):]
+      if not relpath or relpath.endswith("/"):
+        continue
+      path = os.path.join(tmpdir, relpath)
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'wb') as f:
+        f.write(par.read(info))
+    try:
+      os.rename(tmpdir, dirname)
+    except OSError:
+      # Another process was faster.
+      if not os.path.isdir(dirname):
+        raise
+  finally:
+    shutil.rmtree(tmpdir, ignore_errors=True)
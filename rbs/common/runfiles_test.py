@@ -0,0 +1,120 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import tempfile
+import zipfile
+
+import mock
+
+import runfiles
+
+
+def _write_par(path, botocore_content):
+  with zipfile.ZipFile(path, 'w') as par:
+    par.writestr("__main__.py", "")
+    par.writestr("pypi__botocore_1_9_3/botocore/__init__.py", "")
+    par.writestr("pypi__botocore_1_9_3/botocore/data/s3/service-2.json",
+                 botocore_content)
+    par.writestr("pypi__botocore_1_9_3/botocore/data/endpoints.json", "{}")
+
+
+class RunfilesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp(dir=os.getenv("TEST_TMPDIR"))
+    self.cache_dir = os.path.join(self.tmpdir, "cache")
+    os.environ["BAZEL_BF_CACHE"] = self.cache_dir
+    os.environ.pop("AWS_DATA_PATH", None)
+    self._reset()
+    patcher = mock.patch("pkg_resources.set_extraction_path")
+    self.set_extraction_path = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.addCleanup(self._reset)
+
+  def _reset(self):  # pylint: disable=no-self-use
+    if runfiles._extraction_lock:  # pylint: disable=protected-access
+      runfiles._extraction_lock.close()  # pylint: disable=protected-access
+    runfiles._extraction_dir = None  # pylint: disable=protected-access
+    runfiles._extraction_lock = None  # pylint: disable=protected-access
+
+  @mock.patch("runfiles.is_bundled", return_value=True)
+  def test_ensure_extraction_dir(self, _is_bundled):
+    par_path = os.path.join(self.tmpdir, "bazel_bf.par")
+    _write_par(par_path, "{\"v\": 1}")
+
+    dirname = runfiles.ensure_extraction_dir(par_path)
+    self.assertEqual(os.path.dirname(dirname), self.cache_dir)
+    self.assertTrue(os.path.isdir(dirname))
+    self.set_extraction_path.assert_called_once_with(dirname)
+    self.assertEqual(runfiles.ensure_extraction_dir(par_path), dirname)
+
+    # The same bundle is extracted in the same dir.
+    self._reset()
+    self.assertEqual(runfiles.ensure_extraction_dir(par_path), dirname)
+
+    # Another bundle is extracted somewhere else.
+    self._reset()
+    _write_par(par_path, "{\"v\": 2}")
+    self.assertNotEqual(runfiles.ensure_extraction_dir(par_path), dirname)
+
+  def test_gc_extraction_dirs(self):
+    dirs = [os.path.join(self.cache_dir, str(i)) for i in range(5)]
+    for i, dirname in enumerate(dirs):
+      os.makedirs(dirname)
+      os.utime(dirname, (1000 + i, 1000 + i))
+    # "0" is the least recently used, but is in use.
+    lock = runfiles._lock_extraction_dir(dirs[0])  # pylint: disable=protected-access
+    os.utime(dirs[0], (0, 0))
+
+    runfiles.gc_extraction_dirs(keep=2)
+    self.assertEqual(
+        sorted(os.listdir(self.cache_dir)), ["0", "0.lock", "3", "4"])
+
+    lock.close()
+    runfiles.gc_extraction_dirs(keep=2)
+    self.assertEqual(sorted(os.listdir(self.cache_dir)), ["3", "4"])
+
+  @mock.patch("runfiles.is_bundled", return_value=True)
+  def test_extract_botocore_data(self, _is_bundled):
+    par_path = os.path.join(self.tmpdir, "bazel_bf.par")
+    _write_par(par_path, "{\"v\": 1}")
+
+    runfiles.extract_botocore_data(par_path)
+    dirname = os.environ["AWS_DATA_PATH"]
+    self.assertTrue(dirname.startswith(os.environ["BAZEL_BF_CACHE"]))
+    with open(os.path.join(dirname, "s3", "service-2.json")) as f:
+      self.assertEqual(f.read(), "{\"v\": 1}")
+    self.assertTrue(os.path.exists(os.path.join(dirname, "endpoints.json")))
+    self.assertFalse(os.path.exists(os.path.join(dirname, "__init__.py")))
+
+    # The extraction is reused.
+    self._reset()
+    with mock.patch("runfiles._extract_atomically") as extract:
+      runfiles.extract_botocore_data(par_path)
+      extract.assert_not_called()
+    self.assertEqual(os.environ["AWS_DATA_PATH"], dirname)
+
+  @mock.patch("runfiles.is_bundled", return_value=True)
+  def test_extract_botocore_data_not_zip(self, _is_bundled):
+    path = os.path.join(self.tmpdir, "bazel_bf.py")
+    with open(path, 'w') as f:
+      f.write("")
+    runfiles.extract_botocore_data(path)
+    self.assertNotIn("AWS_DATA_PATH", os.environ)
+
+
+if __name__ == '__main__':
+  unittest.main()
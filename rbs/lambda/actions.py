@@ -13,19 +13,74 @@
 # limitations under the License.
 """Actual actions performed by the API."""
 import os
+import time
 
-import boto3
+from concurrent import futures
 import attr
 
 import service
 import containers
 import auth
+import clients
+import activity
+import autoscaling
+import metrics
+import warm_pool
+import worker_pools
+
+
+_templates = {}
 
 
 def template(name):
-  """Returns the body of a template found on the local filesystem."""
-  with open(os.path.join('./cfn', name)) as f:
-    return f.read()
+  """Returns the body of a template found on the local filesystem.
+
+  The body is cached for as long as the modification time of the file is the same.
+  """
+  path = os.path.join('./cfn', name)
+  mtime = os.path.getmtime(path)
+  cached = _templates.get(path)
+  if cached is not None and cached[0] == mtime:
+    return cached[1]
+  with open(path) as f:
+    body = f.read()
+  _templates[path] = (mtime, body)
+  return body
+
+
+def server_parameters(config):
+  """Returns the parameters of the CloudFormation stack of the build servers."""
+  auth_info = auth.get_authenticator(config).get_server_auth_info()
+  return {
+      "StackName": config["stacks"]["infra"],
+      "ServerImage": config["server_image"],
+      "LogsRegion": config["awslogs_region"],
+      "LogsGroup": config["awslogs_group"],
+      "CertChain": auth_info["server_crt"],
+      "PrivateKey": auth_info["server_pkcs8_key"],
+      "ClientCertChain": auth_info["ca_crt"],
+  }
+
+
+def worker_parameters(config, server_ip, pool=None):
+  """Returns the parameters of the CloudFormation stack of a pool of build
+  workers (by default, the default pool)."""
+  pool = pool or worker_pools.get_pool(config)
+  auth_info = auth.get_authenticator(config).get_server_auth_info()
+  return {
+      "StackName": config["stacks"]["infra"],
+      "ServerIP": server_ip,
+      "WorkerImage": config["worker_image"],
+      "WorkerContainerCpu": pool.cpu,
+      "WorkerContainerMemory": pool.memory,
+      "WorkerConfig": worker_pools.render_config(
+          template('worker.config'), pool),
+      "LogsRegion": config["awslogs_region"],
+      "LogsGroup": config["awslogs_group"],
+      "TrustCertCollection": auth_info["ca_crt"],
+      "ClientPrivateKey": auth_info["client_pkcs8_key"],
+      "WorkerCertChain": auth_info["client_crt"],
+  }
 
 
 # pylint: disable=too-many-arguments
@@ -36,20 +91,11 @@ def ensure_servers(cfn,
                    upper_count=-1,
                    force_update=False):
   """Ensure that the build servers conform to spec."""
-  auth_info = auth.get_authenticator(config).get_server_auth_info()
   return service.ensure(
       cfn,
       stack_name=config["stacks"]["server"],
       template_body=template('server.yaml'),
-      parameters={
-          "StackName": config["stacks"]["infra"],
-          "ServerImage": config["server_image"],
-          "LogsRegion": config["awslogs_region"],
-          "LogsGroup": config["awslogs_group"],
-          "CertChain": auth_info["server_crt"],
-          "PrivateKey": auth_info["server_pkcs8_key"],
-          "ClientCertChain": auth_info["ca_crt"],
-      },
+      parameters=server_parameters(config),
       current_count=current_count,
       lower_count=lower_count,
       upper_count=upper_count,
@@ -63,31 +109,31 @@ def ensure_workers(cfn,
                    current_count,
                    lower_count=-1,
                    upper_count=-1,
-                   force_update=False):
-  "Ensures that the build workers conform to spec."
+                   force_update=False,
+                   pool=None):
+  """Ensures that the build workers of a pool (by default, the default pool)
+  conform to spec."""
+  pool = pool or worker_pools.get_pool(config)
   if server_ip == "NULL":
     if upper_count == 0:
       return service.Response.UpToDate
     return service.Response.WaitingForPrecondition
-  auth_info = auth.get_authenticator(config).get_server_auth_info()
+  scaler = None
+  if config.get("fast_scaling", True):
+    scaler = service.EcsScaler(
+        ecs=clients.get_client("ecs", config["region"]),
+        cluster=config["cluster"],
+        service_name=pool.family())
   return service.ensure(
       cfn,
-      stack_name=config["stacks"]["workers"],
+      stack_name=pool.stack_name,
       template_body=template('worker.yaml'),
-      parameters={
-          "StackName": config["stacks"]["infra"],
-          "ServerIP": server_ip,
-          "WorkerImage": config["worker_image"],
-          "LogsRegion": config["awslogs_region"],
-          "LogsGroup": config["awslogs_group"],
-          "TrustCertCollection": auth_info["ca_crt"],
-          "ClientPrivateKey": auth_info["client_pkcs8_key"],
-          "WorkerCertChain": auth_info["client_crt"],
-      },
+      parameters=worker_parameters(config, server_ip, pool=pool),
       current_count=current_count,
       lower_count=lower_count,
       upper_count=upper_count,
-      force_update=force_update)
+      force_update=force_update,
+      scaler=scaler)
 
 
 # pylint: disable=too-few-public-methods
@@ -102,56 +148,326 @@ class Status(object):
   running_workers = attr.ib()
   remote_executor = attr.ib()
   server_ip = attr.ib()
+  # State of the warm pool (see `warm_pool.get_state`), if any.
+  warm_pool = attr.ib(default=None)
+  # Running and pending workers of the pools other than the default one, by
+  # name, if any.
+  worker_pools = attr.ib(default=None)
+
+
+def get_pool_workers(status, name):
+  """Returns the number of running and pending workers of a pool other than the
+  default one."""
+  workers = (status.worker_pools or {}).get(name) or {}
+  return (workers.get("running_workers", 0), workers.get("pending_workers", 0))
+
+
+def stop_pools(cfn, config, status):
+  """Stops the workers of the pools other than the default one.  Returns the
+  responses by pool name."""
+  ans = {}
+  for pool in worker_pools.get_pools(config)[1:]:
+    current_count = sum(get_pool_workers(status, pool.name))
+    if current_count > 0:
+      ans[pool.name] = str(
+          ensure_workers(
+              cfn,
+              config,
+              server_ip=status.server_ip,
+              current_count=current_count,
+              upper_count=0,
+              pool=pool))
+  return ans
+
+
+# Maximum number of ECS/EC2 calls in flight when collecting the status.
+STATUS_MAX_WORKERS = 4
+# Maximum time, in seconds, to collect the status.
+STATUS_DEADLINE = 20
+# How long, in seconds, the counts of stopped tasks are reused by default.
+DEFAULT_STOPPED_COUNT_TTL = 60
+# Maximum time, in seconds, a `/wait` request blocks (see the timeout of the
+# Lambda function in `rbs/local/cfn/lambda.yaml`).
+WAIT_MAX_TIMEOUT = 20
+# Maximum time, in seconds, a `/wait` request takes in total, including the
+# initial status.  This is below the 29s timeout of the API gateway and the 30s
+# timeout of the Lambda function.
+REQUEST_DEADLINE = 25
+# Period, in seconds, with which the status is polled during a `/wait` request.
+WAIT_POLL_PERIOD = 2
+
+
+class StatusTimeoutException(Exception):
+  """Raised when the status cannot be collected before the deadline."""
+
+
+class StatusCollector(object):
+  """Collects the status of the remote build system.
 
+  The queries for the server family and the worker family are independent, so
+  they are run concurrently on a bounded thread pool, within `deadline` seconds.
+  The duration of each call, in seconds, is recorded in `timings`.  The counts
+  of stopped tasks are reused for `stopped_count_ttl` seconds (see
+  `containers.count_stopped_tasks`).
+  """
+
+  def __init__(self,
+               cont,
+               max_workers=STATUS_MAX_WORKERS,
+               deadline=STATUS_DEADLINE,
+               stopped_count_ttl=0):
+    self.cont = cont
+    self.max_workers = max_workers
+    self.deadline = deadline
+    self.stopped_count_ttl = stopped_count_ttl
+    self.timings = {}
+
+  def _timed(self, name, fn, *args, **kwargs):
+    """Calls `fn` and records the duration of the call under `name`."""
+    start = time.time()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      self.timings[name] = time.time() - start
+
+  def _running_tasks(self, family, with_network=False):
+    """Returns the tasks with a desired "RUNNING" status, and those of them that
+    are actually running."""
+    task_arns = self._timed(
+        family + "/list_tasks",
+        self.cont.list_tasks,
+        family=family,
+        desiredStatus="RUNNING")
+    if with_network:
+      tasks = self._timed(family + "/describe_tasks_with_network",
+                          self.cont.describe_tasks_with_network, task_arns)
+    else:
+      tasks = self._timed(family + "/describe_tasks",
+                          lambda: list(self.cont.describe_tasks(task_arns)))
+    return (task_arns, [task for task in tasks if task.is_running()])
+
+  def _servers(self, family):
+    """Returns the server tasks and the network info of the running server."""
+    (task_arns, running) = self._running_tasks(family, with_network=True)
+    network = running[-1].network() if running else None
+    return (task_arns, running, network)
+
+  def _stopped_count(self, family):
+    """Counts the stopped tasks of a family."""
+    return self._timed(
+        family + "/count_tasks",
+        containers.count_stopped_tasks,
+        self.cont,
+        family,
+        ttl=self.stopped_count_ttl)
+
+  def collect(self, server_family, worker_family, pool_families=None):
+    """Collects the status, as a `Status` object.
 
-def do_status(config, cont=None):
-  """Gets the status of the remote build system."""
+    `pool_families` gives the task families of the pools other than the default
+    one, by name.
+    """
+    pool_families = pool_families or {}
+    executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+    try:
+      servers = executor.submit(self._servers, server_family)
+      workers = executor.submit(self._running_tasks, worker_family)
+      stopped_servers = executor.submit(self._stopped_count, server_family)
+      stopped_workers = executor.submit(self._stopped_count, worker_family)
+      pools = dict((name, executor.submit(self._running_tasks, family))
+                   for (name, family) in pool_families.items())
+      (_, not_done) = futures.wait(
+          [servers, workers, stopped_servers, stopped_workers] +
+          pools.values(),
+          timeout=self.deadline)
+      if not_done:
+        raise StatusTimeoutException(
+            "status could not be collected within %ss" % self.deadline)
+    finally:
+      executor.shutdown(wait=False)
+
+    (all_servers, running_servers, network) = servers.result()
+    (all_workers, running_workers) = workers.result()
+    server_ip = network.public_ip if network else "NULL"
+    pool_workers = None
+    if pools:
+      pool_workers = {}
+      for (name, result) in pools.items():
+        (all_pool_workers, running_pool_workers) = result.result()
+        pool_workers[name] = {
+            "pending_workers":
+                len(all_pool_workers) - len(running_pool_workers),
+            "running_workers":
+                len(running_pool_workers),
+        }
+    return Status(
+        stopped_servers=stopped_servers.result(),
+        pending_servers=len(all_servers) - len(running_servers),
+        running_servers=len(running_servers),
+        stopped_workers=stopped_workers.result(),
+        pending_workers=len(all_workers) - len(running_workers),
+        running_workers=len(running_workers),
+        remote_executor="NULL" if server_ip == "NULL" else
+        server_ip + ":" + str(8098),
+        server_ip=server_ip,
+        worker_pools=pool_workers,
+    )
+
+
+def do_status(config, cont=None, deadline=STATUS_DEADLINE):
+  """Gets the status of the remote build system, within `deadline` seconds."""
   if not cont:
     cont = containers.ContainerService(
-        cluster=config["cluster"], region=config["region"])
+        cluster=config["cluster"],
+        region=config["region"],
+        ecs=clients.get_client("ecs", config["region"]),
+        ec2=clients.get_client("ec2", config["region"]))
   server_family = config["stacks"]["server"] + "-BuildFarm-Server"
-  worker_family = config["stacks"]["workers"] + "-BuildFarm-Worker"
-
-  server_ip = "NULL"
-  remote_executor = "NULL"
-  all_servers = cont.list_tasks(family=server_family, desiredStatus="RUNNING")
-  running_servers = 0
-  for server in cont.describe_tasks(all_servers):
-    if server.is_running():
-      server_ip = server.network().public_ip
-      remote_executor = server_ip + ":" + str(8098)
-      running_servers += 1
-
-  all_workers = cont.list_tasks(family=worker_family, desiredStatus="RUNNING")
-  running_workers = 0
-  for worker in cont.describe_tasks(all_workers):
-    if worker.is_running():
-      running_workers += 1
-
-  return Status(
-      stopped_servers=cont.count_tasks(
-          family=server_family, desiredStatus="STOPPED"),
-      pending_servers=len(all_servers) - running_servers,
-      running_servers=running_servers,
-      stopped_workers=cont.count_tasks(
-          family=worker_family, desiredStatus="STOPPED"),
-      pending_workers=len(all_workers) - running_workers,
-      running_workers=running_workers,
-      remote_executor=remote_executor,
-      server_ip=server_ip,
-  )
+  pools = worker_pools.get_pools(config)
+  worker_family = pools[0].family()
+  pool_families = dict((pool.name, pool.family()) for pool in pools[1:])
+
+  collector = StatusCollector(
+      cont,
+      deadline=deadline,
+      stopped_count_ttl=config.get("stopped_count_ttl",
+                                   DEFAULT_STOPPED_COUNT_TTL))
+  status = collector.collect(server_family, worker_family, pool_families)
+  status.warm_pool = warm_pool.get_state(config, status.running_workers)
+  if config.get("debug"):
+    print "Status timings: %s" % collector.timings
+  return status
+
+
+def is_ready(status, worker_count, pools=None):
+  """Whether the remote build system has a running server, at least
+  `worker_count` running workers, and, for each pool in `pools`, at least the
+  given number of running workers."""
+  return (status.remote_executor != "NULL" and status.running_servers >= 1 and
+          status.running_workers >= worker_count and
+          all(get_pool_workers(status, name)[0] >= count
+              for (name, count) in (pools or {}).items()))
+
+
+def is_settled(config, pools=None, cfn=None):
+  """Whether the stacks of the server, of the workers and of the pools in `pools`
+  are stable and their ECS services run all their desired tasks, which is when
+  `/connect` reports them as up-to-date."""
+  cfn = cfn or clients.get_client('cloudformation', config["region"])
+  worker_stacks = [worker_pools.get_pool(config)] + [
+      worker_pools.get_pool(config, name) for name in sorted(pools or {})
+  ]
+  for stack_name in [config["stacks"]["server"]
+                    ] + [pool.stack_name for pool in worker_stacks]:
+    if (service.get_state(service.describe_stack(cfn, stack_name)) !=
+        service.State.Stable):
+      return False
+  if not config.get("fast_scaling", True):
+    return True
+  ecs = clients.get_client("ecs", config["region"])
+  for pool in worker_stacks:
+    counts = service.EcsScaler(
+        ecs=ecs, cluster=config["cluster"],
+        service_name=pool.family()).get_counts()
+    if counts is not None and counts[1] < counts[0]:
+      return False
+  return True
+
+
+# pylint: disable=too-many-arguments
+def do_wait(config,
+            status,
+            worker_count,
+            timeout=WAIT_MAX_TIMEOUT,
+            cont=None,
+            started=None,
+            pools=None,
+            cfn=None):
+  """Waits until the remote build system is ready, or the build server has just
+  started, or the timeout expires.
+
+  The remote build system is ready when it has enough running tasks (see
+  `is_ready`) and its stacks are settled (see `is_settled`): the `bazel_bf`
+  client then finds it ready with its next call to `/connect`.  This lets the
+  client long-poll the remote build system instead of calling `/connect` over
+  and over again.  When the build server has just started, the client must call
+  `/connect` again so that the workers are created.
+
+  `started` is the time the request started: the request, including the
+  collection of the status, never takes more than `REQUEST_DEADLINE` seconds.
+  """
+  now = time.time()
+  deadline = min(now + min(timeout, WAIT_MAX_TIMEOUT),
+                 (started or now) + REQUEST_DEADLINE)
+
+  def ready(status):
+    # The stacks are only described once there are enough running tasks.
+    return (is_ready(status, worker_count, pools) and
+            is_settled(config, pools, cfn=cfn))
+
+  initial_server_ip = status.server_ip
+  is_up = ready(status)
+  while (not is_up and status.server_ip == initial_server_ip and
+         time.time() + WAIT_POLL_PERIOD < deadline):
+    time.sleep(WAIT_POLL_PERIOD)
+    try:
+      status = do_status(config, cont=cont, deadline=deadline - time.time())
+    except StatusTimeoutException:
+      break
+    is_up = ready(status)
+
+  ans = attr.asdict(status)
+  ans["ready"] = is_up
+  return ans
+
+
+def is_activity_recorded(config):
+  """Whether the `/connect` requests are recorded in the activity log."""
+  return (autoscaling.get_settings(config)["enabled"] or
+          get_idle_shutdown_settings(config)["enabled"])
+
 
+def record_connect(config, worker_count, log=None):
+  """Records a `/connect` request in the activity log.
 
+  The activity log is only used for scheduled actions: failing to record the
+  request must not fail the request itself.
+  """
+  try:
+    log = log or activity.get_activity_log(config)
+    log.load()
+    log.record_connect(worker_count)
+    log.save()
+  except Exception as e:  # pylint: disable=broad-except
+    print "Could not record the request in the activity log: %s" % e
+
+
+# pylint: disable=too-many-arguments
 def do_connect(config,
                status,
                worker_count,
                force_update=False,
                auth_info=None,
-               cfn=None):
+               cfn=None,
+               log=None,
+               pools=None):
   """Gets connection info to the remote build system and ensures a minimal
   service level.
+
+  The worker count never goes below that of the warm pool: the pool covers the
+  first `worker_count` workers.  `pools` gives the minimum worker count of the
+  pools other than the default one, by name.
   """
-  cfn = cfn or boto3.client('cloudformation', region_name=config["region"])
+  # The pools are validated before anything is recorded or scaled.
+  requested_pools = {}
+  for name in sorted(pools or {}):
+    requested_pools[name] = worker_pools.get_pool(config, name)
+    if requested_pools[name] is None:
+      raise Exception("unknown worker pool '%s'" % name)
+
+  cfn = cfn or clients.get_client('cloudformation', config["region"])
+  if is_activity_recorded(config):
+    record_connect(config, worker_count, log=log)
 
   ans = {
       "status": {},
@@ -172,8 +488,23 @@ def do_connect(config,
           config,
           server_ip=status.server_ip,
           current_count=status.running_workers,
-          lower_count=worker_count,
+          lower_count=max(worker_count, warm_pool.get_baseline(config)),
           force_update=force_update))
+  if pools:
+    ans["status"]["worker_pools_status"] = {}
+    for (name, count) in sorted(pools.items()):
+      ans["status"]["worker_pools_status"][name] = str(
+          ensure_workers(
+              cfn,
+              config,
+              server_ip=status.server_ip,
+              current_count=get_pool_workers(status, name)[0],
+              lower_count=count,
+              force_update=force_update,
+              pool=requested_pools[name]))
+  ans["worker_pools"] = [
+      attr.asdict(each_pool) for each_pool in worker_pools.get_pools(config)
+  ]
 
   ans["auth_info"] = auth_info or auth.get_authenticator(config).get_auth_info()
 
@@ -182,7 +513,7 @@ def do_connect(config,
 
 def do_down(config, status, worker_count, cfn=None):
   """Downsizes the remote build system."""
-  cfn = cfn or boto3.client('cloudformation', region_name=config["region"])
+  cfn = cfn or clients.get_client('cloudformation', config["region"])
 
   ans = {}
   ans.update(attr.asdict(status))
@@ -202,5 +533,235 @@ def do_down(config, status, worker_count, cfn=None):
           server_ip=status.server_ip,
           current_count=status.running_workers,
           upper_count=worker_count))
+  if worker_count == 0:
+    ans["worker_pools_status"] = stop_pools(cfn, config, status)
+
+  return ans
+
+
+def get_worker_cpu_utilization(config, status, window, now, cloudwatch=None):
+  """Returns the average CPU utilization, in percent, of the running workers of
+  the default pool over the last `window` seconds, or `None` if it is unknown."""
+  if status.running_workers == 0:
+    return None
+  cloudwatch = cloudwatch or clients.get_client("cloudwatch", config["region"])
+  return metrics.get_cpu_utilization(
+      cloudwatch,
+      config["cluster"],
+      worker_pools.get_pool(config).family(),
+      window,
+      now=now)
+
+
+# pylint: disable=too-many-arguments
+def do_autoscale(config,
+                 status,
+                 queued=None,
+                 now=None,
+                 log=None,
+                 cfn=None,
+                 cloudwatch=None):
+  """Scales the build workers to the demand (see the `autoscaling` module).
+
+  This action runs on a schedule.  `queued` is the number of operations queued
+  on the build server, if known.  The load of the running workers is read from
+  CloudWatch, so that the builds count towards the demand even when they do
+  not call `/connect`.
+  """
+  settings = autoscaling.get_settings(config)
+  now = now or time.time()
+  settings["min_workers"] = max(settings["min_workers"],
+                                warm_pool.get_baseline(config, now=now))
+  log = log or activity.get_activity_log(config)
+  log.load()
+
+  recent = log.recent_demand(settings["recent_window"], now=now)
+  cpu_utilization = get_worker_cpu_utilization(
+      config, status, settings["load_window"], now, cloudwatch=cloudwatch)
+  busy = autoscaling.get_busy_workers(settings, status.running_workers,
+                                      cpu_utilization)
+  # The history only records the observed demand, not the predicted one.
+  observed = autoscaling.get_demand(
+      settings, recent, 0, queued=queued, busy=busy)
+  demand = autoscaling.get_demand(
+      settings,
+      recent,
+      log.predicted_demand(now=now),
+      queued=queued,
+      busy=busy)
+  current = status.running_workers + status.pending_workers
+  decision = autoscaling.decide(
+      settings, current, demand, log.last_scale_time(), now=now)
+
+  ans = {}
+  ans.update(attr.asdict(status))
+  ans["autoscaling"] = attr.asdict(decision)
+  ans["autoscaling"]["cpu_utilization"] = cpu_utilization
+  if decision.target > 0 and status.server_ip == "NULL":
+    cfn = cfn or clients.get_client('cloudformation', config["region"])
+    ans["server_status"] = str(
+        ensure_servers(
+            cfn,
+            config,
+            current_count=status.running_servers,
+            lower_count=1,
+            upper_count=1))
+  if decision.target != current:
+    cfn = cfn or clients.get_client('cloudformation', config["region"])
+    ans["workers_status"] = str(
+        ensure_workers(
+            cfn,
+            config,
+            server_ip=status.server_ip,
+            current_count=current,
+            lower_count=decision.target,
+            upper_count=decision.target))
+    if ans["workers_status"] != service.Response.WaitingForPrecondition:
+      log.record_scale(decision.target, now=now)
+
+  log.record_demand(observed, now=now)
+  log.save()
+  return ans
+
+
+# Default settings, overridden by the "idle_shutdown" key of the configuration.
+DEFAULT_IDLE_SHUTDOWN_SETTINGS = {
+    "enabled": False,
+    "idle_timeout": 3600,
+    "stage_delay": 300,
+    "dry_run": False,
+    "busy_cpu_utilization": 10,
+    "busy_window": 600,
+}
+
+
+def get_idle_shutdown_settings(config):
+  """Returns the idle shutdown settings of a configuration object."""
+  settings = dict(DEFAULT_IDLE_SHUTDOWN_SETTINGS)
+  settings.update(config.get("idle_shutdown") or {})
+  return settings
+
+
+# pylint: disable=too-many-arguments
+def do_idle_shutdown(config,
+                     status,
+                     dry_run=None,
+                     now=None,
+                     log=None,
+                     cfn=None,
+                     cloudwatch=None):
+  """Stops the remote build system when, for `idle_timeout` seconds, no
+  `/connect` request was made and the workers were not busy.
 
+  The builds that reuse the status cache of `bazel_bf` do not call `/connect`:
+  the workers count as busy when their average CPU utilization over the last
+  `busy_window` seconds is at least `busy_cpu_utilization` percent.
+
+  This action runs on a schedule.  The build system is stopped in stages: the
+  workers first, then the server, `stage_delay` seconds after the workers are
+  gone, so that the operations in flight can complete.  With `dry_run`, the
+  stage is reported but nothing is changed.
+  """
+  settings = get_idle_shutdown_settings(config)
+  if dry_run is None:
+    dry_run = settings["dry_run"]
+  now = now or time.time()
+  log = log or activity.get_activity_log(config)
+  log.load()
+  log.touch(now=now)
+  cpu_utilization = get_worker_cpu_utilization(
+      config, status, settings["busy_window"], now, cloudwatch=cloudwatch)
+  if (cpu_utilization is not None and
+      cpu_utilization >= settings["busy_cpu_utilization"]):
+    log.record_busy(now=now)
+
+  # The warm pool keeps the remote build system running, idle or not.
+  pool_active = warm_pool.get_baseline(config, now=now) > 0
+  idle_for = now - log.last_activity()
+  workers = status.running_workers + status.pending_workers
+  pool_workers = sum(
+      sum(get_pool_workers(status, pool.name))
+      for pool in worker_pools.get_pools(config)[1:])
+  servers = status.running_servers + status.pending_servers
+  ans = {}
+  ans.update(attr.asdict(status))
+  ans["idle_shutdown"] = {
+      "idle": idle_for >= settings["idle_timeout"] and not pool_active,
+      "idle_for": idle_for,
+      "cpu_utilization": cpu_utilization,
+      "dry_run": dry_run,
+  }
+
+  if pool_active:
+    stage = "warm pool"
+    log.clear_workers_stopped()
+  elif idle_for < settings["idle_timeout"]:
+    stage = "active"
+    log.clear_workers_stopped()
+  elif workers > 0 or pool_workers > 0:
+    stage = "stopping workers"
+    if not dry_run:
+      cfn = cfn or clients.get_client('cloudformation', config["region"])
+      ans["workers_status"] = str(
+          ensure_workers(
+              cfn,
+              config,
+              server_ip=status.server_ip,
+              current_count=workers,
+              upper_count=0))
+      if pool_workers > 0:
+        ans["worker_pools_status"] = stop_pools(cfn, config, status)
+      log.record_workers_stopped(now=now)
+  elif servers == 0:
+    stage = "stopped"
+  elif log.workers_stopped_at() is None:
+    stage = "draining"
+    log.record_workers_stopped(now=now)
+  elif now - log.workers_stopped_at() < settings["stage_delay"]:
+    stage = "draining"
+  else:
+    stage = "stopping server"
+    if not dry_run:
+      cfn = cfn or clients.get_client('cloudformation', config["region"])
+      ans["server_status"] = str(
+          ensure_servers(
+              cfn,
+              config,
+              current_count=servers,
+              lower_count=0,
+              upper_count=0))
+
+  ans["idle_shutdown"]["stage"] = stage
+  if not dry_run:
+    log.save()
+  return ans
+
+
+def do_warm_pool(config, status, now=None, cfn=None):
+  """Keeps the warm pool running (see the `warm_pool` module).
+
+  This action runs on a schedule.  It only ever starts the server and workers:
+  stopping them outside of the windows of the pool is left to the idle shutdown
+  and the autoscaler.
+  """
+  baseline = warm_pool.get_baseline(config, now=now)
+  ans = {}
+  ans.update(attr.asdict(status))
+  if baseline == 0:
+    return ans
+  cfn = cfn or clients.get_client('cloudformation', config["region"])
+  ans["server_status"] = str(
+      ensure_servers(
+          cfn,
+          config,
+          current_count=status.running_servers,
+          lower_count=1,
+          upper_count=1))
+  ans["workers_status"] = str(
+      ensure_workers(
+          cfn,
+          config,
+          server_ip=status.server_ip,
+          current_count=status.running_workers,
+          lower_count=baseline))
   return ans
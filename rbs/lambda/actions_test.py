@@ -12,21 +12,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import os
+import datetime
+import json
+import tempfile
+import time
 import unittest
+import threading
+import attr
+import boto3
+from botocore.stub import Stubber
 import mock
 
 import containers
 import actions
+import activity
+import clients
+import service
+import worker_pools
 
 
 class MockContainerService(object):
 
   def __init__(self, task_lists, task_counts, tasks):
+    self.cluster = "my_cluster"
     self.task_lists = task_lists
     self.task_counts = task_counts
     self.tasks = tasks
 
   def list_tasks(self, family, desiredStatus):
+    if (family, desiredStatus) in self.task_counts:
+      return ["task"] * self.task_counts[(family, desiredStatus)]
     return self.task_lists[(family, desiredStatus)]
 
   def count_tasks(self, family, desiredStatus):
@@ -51,6 +68,74 @@ class MockContainerService(object):
           return_value=self.tasks[task_id]["is_running"])
       yield task
 
+  def describe_tasks_with_network(self, task_ids):
+    return list(self.describe_tasks(task_ids))
+
+
+def _activity_log(state):
+  """Returns an activity log backed by a mock S3 client."""
+  s3 = mock.Mock()
+  s3.get_object.return_value = {"Body": io.BytesIO(json.dumps(state))}
+  return activity.ActivityLog(s3, "my_bucket", "my_key")
+
+
+def _cloudwatch(cpu_utilization):
+  """Returns a mock CloudWatch client with a given CPU utilization."""
+  cloudwatch = mock.Mock()
+  cloudwatch.get_metric_statistics.return_value = {
+      "Datapoints": [{
+          "Average": cpu_utilization
+      }]
+  }
+  return cloudwatch
+
+
+class _FakeS3(object):
+  """Fake S3 client that holds a single object."""
+
+  def __init__(self, state):
+    self.body = json.dumps(state)
+
+  def get_object(self, **_kwargs):
+    return {"Body": io.BytesIO(self.body)}
+
+  def put_object(self, **kwargs):
+    self.body = kwargs["Body"]
+
+
+def _status(servers, workers):
+  """Returns the status of a remote build system with running tasks."""
+  server_ip = "1.2.3.4" if servers else "NULL"
+  return actions.Status(
+      stopped_servers=0,
+      stopped_workers=0,
+      pending_servers=0,
+      pending_workers=0,
+      running_servers=servers,
+      running_workers=workers,
+      remote_executor=server_ip + ":8098" if servers else "NULL",
+      server_ip=server_ip,
+  )
+
+
+def _stack_description(stack_name, desired_count, parameters):
+  """Returns the description of a stable stack created by `service.ensure`."""
+  return {
+      "StackName":
+          stack_name,
+      "StackStatus":
+          "UPDATE_COMPLETE",
+      "CreationTime":
+          datetime.datetime.today(),
+      "Parameters":
+          service.get_stack_args(stack_name, "my_template_body", desired_count,
+                                 parameters)["Parameters"],
+      "Tags": [{
+          "Key": service.DIGEST_TAG,
+          "Value": service.get_digest("my_template_body", parameters),
+      }],
+  }
+
 
 class ActionsTest(unittest.TestCase):
 
@@ -62,11 +147,13 @@ class ActionsTest(unittest.TestCase):
             "workers": "workers_stack",
         },
         "region": "eu-west-1",
+        "cluster": "my_cluster",
         "server_image": "some_server_image",
         "worker_image": "some_worker_image",
         "awslogs_region": "some_awslogs_region",
         "awslogs_group": "some_awslogs_group",
     }
+    containers.clear_stopped_counts()
 
   def test_status(self):
     cont = MockContainerService(
@@ -119,6 +206,27 @@ class ActionsTest(unittest.TestCase):
                          server_ip="my_server_ip",
                      ))
 
+    self.config["warm_pool"] = {"min_workers": 2}
+    status = actions.do_status(self.config, cont=cont)
+    self.assertEqual(status.warm_pool, {
+        "active": True,
+        "min_workers": 2,
+        "ready": True,
+    })
+
+    # The stopped tasks are counted again only after `stopped_count_ttl`
+    # seconds, but the running tasks are always listed.
+    cont.task_lists[("workers_stack-BuildFarm-Worker", "RUNNING")] = [
+        "worker_2"
+    ]
+    cont.task_counts[("workers_stack-BuildFarm-Worker", "STOPPED")] = 7
+    status = actions.do_status(self.config, cont=cont)
+    self.assertEqual(status.running_workers, 1)
+    self.assertEqual(status.stopped_workers, 5)
+    self.config["stopped_count_ttl"] = 0
+    status = actions.do_status(self.config, cont=cont)
+    self.assertEqual(status.stopped_workers, 7)
+
   def test_status_no_running_server(self):
     cont = MockContainerService(
         task_lists={
@@ -159,8 +267,209 @@ class ActionsTest(unittest.TestCase):
                          server_ip="NULL",
                      ))
 
+  def test_status_timings(self):
+    cont = MockContainerService(
+        task_lists={
+            ("server_stack-BuildFarm-Server", "RUNNING"): [],
+            ("workers_stack-BuildFarm-Worker", "RUNNING"): [],
+        },
+        task_counts={
+            ("server_stack-BuildFarm-Server", "STOPPED"): 0,
+            ("workers_stack-BuildFarm-Worker", "STOPPED"): 0,
+        },
+        tasks={})
+
+    collector = actions.StatusCollector(cont)
+    collector.collect("server_stack-BuildFarm-Server",
+                      "workers_stack-BuildFarm-Worker")
+    self.assertItemsEqual(collector.timings.keys(), [
+        "server_stack-BuildFarm-Server/list_tasks",
+        "server_stack-BuildFarm-Server/describe_tasks_with_network",
+        "server_stack-BuildFarm-Server/count_tasks",
+        "workers_stack-BuildFarm-Worker/list_tasks",
+        "workers_stack-BuildFarm-Worker/describe_tasks",
+        "workers_stack-BuildFarm-Worker/count_tasks",
+    ])
+
+  def test_status_deadline(self):
+    released = threading.Event()
+
+    def _slow_list_tasks(**_kwargs):
+      released.wait(5)
+      return []
+
+    cont = mock.Mock()
+    cont.list_tasks.side_effect = _slow_list_tasks
+    cont.count_tasks.return_value = 0
+    collector = actions.StatusCollector(cont, deadline=0.01)
+    try:
+      self.assertRaises(actions.StatusTimeoutException, collector.collect,
+                        "server_family", "worker_family")
+    finally:
+      released.set()
+
+  def test_template_cache(self):
+    with tempfile.NamedTemporaryFile(dir=os.getenv("TEST_TMPDIR")) as f:
+      f.write("first")
+      f.flush()
+      os.utime(f.name, (1, 1))
+      with mock.patch("os.path.join", return_value=f.name):
+        self.assertEqual(actions.template("some.yaml"), "first")
+        with mock.patch("__builtin__.open") as builtin_open:
+          self.assertEqual(actions.template("some.yaml"), "first")
+          builtin_open.assert_not_called()
+        f.seek(0)
+        f.write("second")
+        f.flush()
+        os.utime(f.name, (2, 2))
+        self.assertEqual(actions.template("some.yaml"), "second")
+
+  @mock.patch("actions.is_settled", return_value=True)
+  @mock.patch("time.sleep", return_value=None)
+  @mock.patch("actions.do_status")
+  def test_wait(self, actions_do_status, time_sleep, _is_settled):
+    pending = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=0,
+        pending_workers=2,
+        running_servers=1,
+        running_workers=0,
+        remote_executor="foo:8098",
+        server_ip="foo",
+    )
+    actions_do_status.side_effect = [
+        pending,
+        attr.evolve(pending, pending_workers=0, running_workers=2),
+    ]
+    response = actions.do_wait(self.config, pending, worker_count=2)
+    self.assertTrue(response["ready"])
+    self.assertEqual(response["running_workers"], 2)
+    self.assertEqual(time_sleep.call_count, 2)
+
+  @mock.patch("actions.is_settled", return_value=True)
+  @mock.patch("time.sleep", return_value=None)
+  @mock.patch("actions.do_status")
+  def test_wait_deadline(self, actions_do_status, _time_sleep, _is_settled):
+    pending = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=0,
+        pending_workers=2,
+        running_servers=1,
+        running_workers=0,
+        remote_executor="foo:8098",
+        server_ip="foo",
+    )
+    response = actions.do_wait(
+        self.config,
+        pending,
+        worker_count=2,
+        started=time.time() - actions.REQUEST_DEADLINE)
+    self.assertFalse(response["ready"])
+    actions_do_status.assert_not_called()
+
+    actions_do_status.side_effect = actions.StatusTimeoutException("timeout")
+    response = actions.do_wait(self.config, pending, worker_count=2)
+    self.assertFalse(response["ready"])
+    self.assertEqual(actions_do_status.call_count, 1)
+    self.assertLessEqual(actions_do_status.call_args[1]["deadline"],
+                         actions.WAIT_MAX_TIMEOUT)
+
+  @mock.patch("actions.is_settled")
+  @mock.patch("time.sleep", return_value=None)
+  @mock.patch("actions.do_status")
+  def test_wait_not_settled(self, actions_do_status, time_sleep, is_settled):
+    # Enough tasks are running, but a stack is still being updated, and a pool
+    # is still short of workers.
+    status = attr.evolve(
+        _status(servers=1, workers=2),
+        worker_pools={"large": {
+            "running_workers": 0,
+            "pending_workers": 1
+        }})
+    actions_do_status.return_value = attr.evolve(
+        status,
+        worker_pools={"large": {
+            "running_workers": 1,
+            "pending_workers": 0
+        }})
+    is_settled.side_effect = [False, True]
+    response = actions.do_wait(
+        self.config, status, worker_count=2, pools={"large": 1})
+    self.assertTrue(response["ready"])
+    self.assertEqual(time_sleep.call_count, 2)
+    self.assertEqual(is_settled.call_count, 2)
+
+  def test_is_settled(self):
+    cfn = boto3.client("cloudformation", region_name="eu-west-1")
+    cfn_stubber = Stubber(cfn)
+    clients.clear()
+    ecs_stubber = Stubber(clients.get_client("ecs", "eu-west-1"))
+    for (stack_name, stack_status) in [
+        ("server_stack", "UPDATE_COMPLETE"),
+        ("workers_stack", "UPDATE_COMPLETE"),
+        ("server_stack", "UPDATE_COMPLETE"),
+        ("workers_stack", "UPDATE_IN_PROGRESS"),
+    ]:
+      cfn_stubber.add_response(
+          "describe_stacks",
+          service_response={
+              "Stacks": [{
+                  "StackName": stack_name,
+                  "StackStatus": stack_status,
+                  "CreationTime": datetime.datetime(2018, 1, 1),
+              }]
+          },
+          expected_params={"StackName": stack_name})
+    ecs_stubber.add_response(
+        "describe_services",
+        service_response={
+            "services": [{
+                "status": "ACTIVE",
+                "desiredCount": 3,
+                "runningCount": 2
+            }]
+        },
+        expected_params={
+            "cluster": "my_cluster",
+            "services": ["workers_stack-BuildFarm-Worker"]
+        })
+    with cfn_stubber, ecs_stubber:
+      # The workers are still starting.
+      self.assertFalse(actions.is_settled(self.config, cfn=cfn))
+      # The stack of the workers is being updated.
+      self.assertFalse(actions.is_settled(self.config, cfn=cfn))
+    cfn_stubber.assert_no_pending_responses()
+    ecs_stubber.assert_no_pending_responses()
+
+  @mock.patch("actions.is_settled", return_value=True)
+  @mock.patch("time.sleep", return_value=None)
+  @mock.patch("actions.do_status")
+  def test_wait_server_started(self, actions_do_status, _time_sleep,
+                               _is_settled):
+    status = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=1,
+        pending_workers=0,
+        running_servers=0,
+        running_workers=0,
+        remote_executor="NULL",
+        server_ip="NULL",
+    )
+    actions_do_status.return_value = attr.evolve(
+        status,
+        pending_servers=0,
+        running_servers=1,
+        remote_executor="foo:8098",
+        server_ip="foo")
+    response = actions.do_wait(self.config, status, worker_count=2)
+    self.assertFalse(response["ready"])
+    self.assertEqual(response["server_ip"], "foo")
+
   @mock.patch("service.ensure", return_value="mocked_service_ensure")
-  @mock.patch("actions.template")
+  @mock.patch("actions.template", return_value="my_template_body")
   def test_connect_without_server(self, _actions_template, _service_ensure):
     status = actions.Status(
         stopped_servers=0,
@@ -179,7 +488,7 @@ class ActionsTest(unittest.TestCase):
                      'Response.WaitingForPrecondition')
 
   @mock.patch("service.ensure", return_value="mocked_service_ensure")
-  @mock.patch("actions.template")
+  @mock.patch("actions.template", return_value="my_template_body")
   def test_connect(self, _actions_template, _service_ensure):
     status = actions.Status(
         stopped_servers=0,
@@ -197,7 +506,7 @@ class ActionsTest(unittest.TestCase):
     self.assertEqual(next_status["workers_status"], "mocked_service_ensure")
 
   @mock.patch("service.ensure", return_value="mocked_service_ensure")
-  @mock.patch("actions.template")
+  @mock.patch("actions.template", return_value="my_template_body")
   def test_down(self, _actions_template, _service_ensure):
     status = actions.Status(
         stopped_servers=0,
@@ -214,6 +523,498 @@ class ActionsTest(unittest.TestCase):
     self.assertEqual(next_status["server_status"], "mocked_service_ensure")
     self.assertEqual(next_status["workers_status"], "mocked_service_ensure")
 
+  @mock.patch("service.ensure", return_value="mocked_service_ensure")
+  @mock.patch("actions.template", return_value="my_template_body")
+  def test_connect_records_activity(self, _actions_template, _service_ensure):
+    status = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=0,
+        pending_workers=0,
+        running_servers=1,
+        running_workers=3,
+        remote_executor="foo:bar",
+        server_ip="foo",
+    )
+    self.config["autoscaling"] = {"enabled": True}
+    log = _activity_log({})
+    actions.do_connect(
+        self.config, status=status, worker_count=5, cfn=lambda: 0, log=log)
+    self.assertEqual(log.recent_demand(60), 5)
+    self.assertEqual(log.s3.put_object.call_count, 1)
+
+    # Failing to record the request does not fail the request.
+    log.s3.get_object.side_effect = Exception("S3 is down")
+    response = actions.do_connect(
+        self.config, status=status, worker_count=5, cfn=lambda: 0, log=log)
+    self.assertEqual(response["status"]["workers_status"],
+                     "mocked_service_ensure")
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_autoscale(self, ensure_servers, ensure_workers):
+    status = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=0,
+        pending_workers=1,
+        running_servers=1,
+        running_workers=2,
+        remote_executor="foo:bar",
+        server_ip="foo",
+    )
+    self.config["autoscaling"] = {
+        "enabled": True,
+        "max_workers": 10,
+        "actions_per_worker": 2,
+    }
+    now = 1514800800
+    log = _activity_log({"connects": [[now - 60, 4]]})
+    response = actions.do_autoscale(
+        self.config,
+        status,
+        queued=12,
+        now=now,
+        log=log,
+        cfn="cfn",
+        cloudwatch=_cloudwatch(10.0))
+    self.assertEqual(response["autoscaling"]["target"], 6)
+    ensure_servers.assert_not_called()
+    ensure_workers.assert_called_once_with(
+        "cfn",
+        self.config,
+        server_ip="foo",
+        current_count=3,
+        lower_count=6,
+        upper_count=6)
+    self.assertEqual(log.last_scale_time(), now)
+    self.assertEqual(log.predicted_demand(now=now), 6)
+    self.assertEqual(log.s3.put_object.call_count, 1)
+
+    # The queue is drained, but the history still predicts the demand.
+    ensure_workers.reset_mock()
+    status = attr.evolve(status, pending_workers=0, running_workers=6)
+    log.s3.get_object.return_value = {
+        "Body": io.BytesIO(json.dumps(log.state))
+    }
+    response = actions.do_autoscale(
+        self.config,
+        status,
+        queued=0,
+        now=now + 300,
+        log=log,
+        cfn="cfn",
+        cloudwatch=_cloudwatch(10.0))
+    self.assertEqual(response["autoscaling"]["reason"], "steady")
+    ensure_workers.assert_not_called()
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  def test_autoscale_load(self, ensure_workers):
+    self.config["autoscaling"] = {"enabled": True}
+    now = 1514800800
+    cloudwatch = _cloudwatch(90.0)
+    response = actions.do_autoscale(
+        self.config,
+        _status(servers=1, workers=2),
+        now=now,
+        log=_activity_log({}),
+        cfn="cfn",
+        cloudwatch=cloudwatch)
+    self.assertEqual(response["autoscaling"]["cpu_utilization"], 90.0)
+    self.assertEqual(response["autoscaling"]["target"], 4)
+    self.assertEqual(ensure_workers.call_args[1]["lower_count"], 4)
+    self.assertEqual(
+        cloudwatch.get_metric_statistics.call_args[1]["Dimensions"][1],
+        {
+            "Name": "ServiceName",
+            "Value": "workers_stack-BuildFarm-Worker"
+        })
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_autoscale_without_server(self, ensure_servers, _ensure_workers):
+    status = actions.Status(
+        stopped_servers=0,
+        stopped_workers=0,
+        pending_servers=0,
+        pending_workers=0,
+        running_servers=0,
+        running_workers=0,
+        remote_executor="NULL",
+        server_ip="NULL",
+    )
+    self.config["autoscaling"] = {"enabled": True, "min_workers": 1}
+    response = actions.do_autoscale(
+        self.config, status, log=_activity_log({}), cfn="cfn")
+    self.assertEqual(response["server_status"], "mocked_ensure_servers")
+    ensure_servers.assert_called_once_with(
+        "cfn", self.config, current_count=0, lower_count=1, upper_count=1)
+
+  @mock.patch("actions.template", return_value="my_template_body")
+  def test_idle_shutdown_simulation(self, _actions_template):
+    self.config["idle_shutdown"] = {
+        "enabled": True,
+        "idle_timeout": 3600,
+        "stage_delay": 300,
+    }
+    last_connect = 1514800800
+    log = activity.ActivityLog(
+        _FakeS3({
+            "last_connect": last_connect
+        }), "my_bucket", "my_key")
+    cfn = boto3.client("cloudformation", region_name="eu-west-1")
+    cfn_stubber = Stubber(cfn)
+    clients.clear()
+    ecs_stubber = Stubber(clients.get_client("ecs", "eu-west-1"))
+
+    def idle_shutdown(status, elapsed, dry_run=None):
+      with cfn_stubber, ecs_stubber:
+        ans = actions.do_idle_shutdown(
+            self.config,
+            status,
+            dry_run=dry_run,
+            now=last_connect + elapsed,
+            log=log,
+            cfn=cfn,
+            cloudwatch=_cloudwatch(1.0))
+      cfn_stubber.assert_no_pending_responses()
+      ecs_stubber.assert_no_pending_responses()
+      return ans
+
+    # Still active.
+    response = idle_shutdown(_status(servers=1, workers=3), elapsed=600)
+    self.assertEqual(response["idle_shutdown"]["stage"], "active")
+    self.assertFalse(response["idle_shutdown"]["idle"])
+
+    # Idle, but in dry-run mode: nothing is changed.
+    response = idle_shutdown(
+        _status(servers=1, workers=3), elapsed=4000, dry_run=True)
+    self.assertEqual(response["idle_shutdown"]["stage"], "stopping workers")
+    self.assertTrue(response["idle_shutdown"]["dry_run"])
+    self.assertNotIn("workers_status", response)
+
+    # The workers are stopped first.
+    cfn_stubber.add_response(
+        "describe_stacks",
+        service_response={
+            "Stacks": [
+                _stack_description(
+                    "workers_stack", 3,
+                    actions.worker_parameters(self.config, "1.2.3.4"))
+            ]
+        },
+        expected_params={"StackName": "workers_stack"})
+    ecs_stubber.add_response(
+        "describe_services",
+        service_response={
+            "services": [{
+                "status": "ACTIVE",
+                "desiredCount": 3,
+                "runningCount": 3
+            }]
+        },
+        expected_params={
+            "cluster": "my_cluster",
+            "services": ["workers_stack-BuildFarm-Worker"]
+        })
+    ecs_stubber.add_response(
+        "update_service",
+        service_response={},
+        expected_params={
+            "cluster": "my_cluster",
+            "service": "workers_stack-BuildFarm-Worker",
+            "desiredCount": 0
+        })
+    response = idle_shutdown(_status(servers=1, workers=3), elapsed=4000)
+    self.assertEqual(response["idle_shutdown"]["stage"], "stopping workers")
+    self.assertEqual(response["workers_status"], service.Response.Scaling)
+
+    # The server is left running while the operations in flight complete.
+    response = idle_shutdown(_status(servers=1, workers=0), elapsed=4100)
+    self.assertEqual(response["idle_shutdown"]["stage"], "draining")
+
+    # Then the server is stopped.
+    server_parameters = actions.server_parameters(self.config)
+    cfn_stubber.add_response(
+        "describe_stacks",
+        service_response={
+            "Stacks": [
+                _stack_description("server_stack", 1, server_parameters)
+            ]
+        },
+        expected_params={"StackName": "server_stack"})
+    stack_args = service.get_stack_args("server_stack", "my_template_body", 0,
+                                        server_parameters)
+    stack_args["Tags"] = [{
+        "Key": service.DIGEST_TAG,
+        "Value": service.get_digest("my_template_body", server_parameters),
+    }]
+    cfn_stubber.add_response(
+        "update_stack",
+        service_response={"StackId": "server_stack_id"},
+        expected_params=stack_args)
+    response = idle_shutdown(_status(servers=1, workers=0), elapsed=4400)
+    self.assertEqual(response["idle_shutdown"]["stage"], "stopping server")
+    self.assertEqual(response["server_status"], service.Response.Updating)
+
+    response = idle_shutdown(_status(servers=0, workers=0), elapsed=4500)
+    self.assertEqual(response["idle_shutdown"]["stage"], "stopped")
+
+    # A new request makes the remote build system active again.
+    log.load()
+    log.record_connect(2, now=last_connect + 5000)
+    log.save()
+    response = idle_shutdown(_status(servers=1, workers=2), elapsed=5100)
+    self.assertEqual(response["idle_shutdown"]["stage"], "active")
+    self.assertIsNone(log.workers_stopped_at())
+
+  def test_idle_shutdown_without_marker(self):
+    self.config["idle_shutdown"] = {"enabled": True, "idle_timeout": 3600}
+    log = activity.ActivityLog(_FakeS3({}), "my_bucket", "my_key")
+    response = actions.do_idle_shutdown(
+        self.config,
+        _status(servers=1, workers=3),
+        now=1514800800,
+        log=log,
+        cloudwatch=_cloudwatch(1.0))
+    self.assertEqual(response["idle_shutdown"]["stage"], "active")
+    self.assertEqual(log.last_connect(), 1514800800)
+
+  def test_idle_shutdown_busy_workers(self):
+    self.config["idle_shutdown"] = {"enabled": True, "idle_timeout": 3600}
+    last_connect = 1514800800
+    log = activity.ActivityLog(
+        _FakeS3({
+            "last_connect": last_connect
+        }), "my_bucket", "my_key")
+    # The builds reuse the status cache and do not call `/connect`, but keep
+    # the workers busy.
+    response = actions.do_idle_shutdown(
+        self.config,
+        _status(servers=1, workers=3),
+        now=last_connect + 4000,
+        log=log,
+        cloudwatch=_cloudwatch(80.0))
+    self.assertEqual(response["idle_shutdown"]["stage"], "active")
+    self.assertEqual(response["idle_shutdown"]["cpu_utilization"], 80.0)
+    self.assertEqual(log.last_activity(), last_connect + 4000)
+
+    response = actions.do_idle_shutdown(
+        self.config,
+        _status(servers=1, workers=3),
+        now=last_connect + 4000 + 3600,
+        log=log,
+        cloudwatch=_cloudwatch(1.0),
+        dry_run=True)
+    self.assertEqual(response["idle_shutdown"]["stage"], "stopping workers")
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_connect_warm_pool(self, _ensure_servers, ensure_workers):
+    self.config["warm_pool"] = {"min_workers": 3}
+    actions.do_connect(
+        self.config,
+        _status(servers=1, workers=3),
+        worker_count=2,
+        auth_info={},
+        cfn="cfn")
+    self.assertEqual(ensure_workers.call_args[1]["lower_count"], 3)
+    actions.do_connect(
+        self.config,
+        _status(servers=1, workers=3),
+        worker_count=5,
+        auth_info={},
+        cfn="cfn")
+    self.assertEqual(ensure_workers.call_args[1]["lower_count"], 5)
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_warm_pool(self, ensure_servers, ensure_workers):
+    response = actions.do_warm_pool(
+        self.config, _status(servers=0, workers=0), cfn="cfn")
+    self.assertNotIn("server_status", response)
+    ensure_servers.assert_not_called()
+
+    self.config["warm_pool"] = {"min_workers": 2}
+    response = actions.do_warm_pool(
+        self.config, _status(servers=1, workers=1), cfn="cfn")
+    self.assertEqual(response["workers_status"], "mocked_ensure_workers")
+    ensure_servers.assert_called_once_with(
+        "cfn", self.config, current_count=1, lower_count=1, upper_count=1)
+    ensure_workers.assert_called_once_with(
+        "cfn",
+        self.config,
+        server_ip="1.2.3.4",
+        current_count=1,
+        lower_count=2)
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  def test_autoscale_warm_pool(self, ensure_workers):
+    self.config["autoscaling"] = {"enabled": True}
+    self.config["warm_pool"] = {"min_workers": 2}
+    response = actions.do_autoscale(
+        self.config,
+        _status(servers=1, workers=0),
+        log=_activity_log({}),
+        cfn="cfn")
+    self.assertEqual(response["autoscaling"]["target"], 2)
+    self.assertEqual(ensure_workers.call_args[1]["lower_count"], 2)
+
+  def test_idle_shutdown_warm_pool(self):
+    self.config["idle_shutdown"] = {"enabled": True, "idle_timeout": 3600}
+    self.config["warm_pool"] = {"min_workers": 2}
+    log = activity.ActivityLog(
+        _FakeS3({
+            "last_connect": 1514800800
+        }), "my_bucket", "my_key")
+    response = actions.do_idle_shutdown(
+        self.config,
+        _status(servers=1, workers=3),
+        now=1514900000,
+        log=log,
+        cloudwatch=_cloudwatch(1.0))
+    self.assertEqual(response["idle_shutdown"]["stage"], "warm pool")
+    self.assertFalse(response["idle_shutdown"]["idle"])
+
+  @mock.patch("actions.template", return_value="width: ${execute_stage_width}")
+  def test_worker_parameters(self, _actions_template):
+    self.config["worker_pools"] = [{
+        "name": "large",
+        "cpu": 4096,
+        "memory": 16384,
+        "execute_stage_width": 4,
+    }]
+    parameters = actions.worker_parameters(self.config, "1.2.3.4")
+    self.assertEqual(parameters["WorkerContainerCpu"], 256)
+    self.assertEqual(parameters["WorkerContainerMemory"], 512)
+    self.assertEqual(parameters["WorkerConfig"], "width: 1\n")
+    parameters = actions.worker_parameters(
+        self.config,
+        "1.2.3.4",
+        pool=worker_pools.get_pool(self.config, "large"))
+    self.assertEqual(parameters["WorkerContainerCpu"], 4096)
+    self.assertEqual(parameters["WorkerContainerMemory"], 16384)
+    self.assertEqual(parameters["WorkerConfig"], "width: 4\n")
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_connect_worker_pools(self, _ensure_servers, ensure_workers):
+    self.config["worker_pools"] = [{"name": "large", "cpu": 4096}]
+    status = attr.evolve(
+        _status(servers=1, workers=3),
+        worker_pools={
+            "large": {
+                "running_workers": 1,
+                "pending_workers": 0
+            }
+        })
+    response = actions.do_connect(
+        self.config,
+        status,
+        worker_count=2,
+        auth_info={},
+        cfn="cfn",
+        pools={"large": 2})
+    self.assertEqual(response["status"]["worker_pools_status"],
+                     {"large": "mocked_ensure_workers"})
+    self.assertEqual([pool["name"] for pool in response["worker_pools"]],
+                     ["default", "large"])
+    self.assertEqual(ensure_workers.call_count, 2)
+    ensure_workers.assert_called_with(
+        "cfn",
+        self.config,
+        server_ip="1.2.3.4",
+        current_count=1,
+        lower_count=2,
+        force_update=False,
+        pool=worker_pools.get_pool(self.config, "large"))
+
+  @mock.patch("actions.record_connect")
+  @mock.patch("actions.ensure_workers")
+  @mock.patch("actions.ensure_servers")
+  def test_connect_unknown_worker_pool(self, ensure_servers, ensure_workers,
+                                       record_connect):
+    self.config["worker_pools"] = [{"name": "large"}]
+    self.config["idle_shutdown"] = {"enabled": True}
+    with self.assertRaisesRegexp(Exception, "unknown worker pool 'xlarge'"):
+      actions.do_connect(
+          self.config,
+          _status(servers=1, workers=3),
+          worker_count=2,
+          auth_info={},
+          cfn="cfn",
+          pools={"large": 2, "xlarge": 1})
+    record_connect.assert_not_called()
+    ensure_servers.assert_not_called()
+    ensure_workers.assert_not_called()
+
+  @mock.patch("actions.ensure_workers", return_value="mocked_ensure_workers")
+  @mock.patch("actions.ensure_servers", return_value="mocked_ensure_servers")
+  def test_down_worker_pools(self, _ensure_servers, ensure_workers):
+    self.config["worker_pools"] = [{"name": "large"}, {"name": "xlarge"}]
+    status = attr.evolve(
+        _status(servers=1, workers=3),
+        worker_pools={
+            "large": {
+                "running_workers": 1,
+                "pending_workers": 1
+            },
+            "xlarge": {
+                "running_workers": 0,
+                "pending_workers": 0
+            },
+        })
+    response = actions.do_down(self.config, status, worker_count=0, cfn="cfn")
+    self.assertEqual(response["worker_pools_status"],
+                     {"large": "mocked_ensure_workers"})
+    ensure_workers.assert_called_with(
+        "cfn",
+        self.config,
+        server_ip="1.2.3.4",
+        current_count=2,
+        upper_count=0,
+        pool=worker_pools.get_pool(self.config, "large"))
+
+  def test_status_worker_pools(self):
+    self.config["worker_pools"] = [{"name": "large"}]
+    cont = MockContainerService(
+        task_lists={
+            ("server_stack-BuildFarm-Server", "RUNNING"): ["server_1"],
+            ("workers_stack-BuildFarm-Worker", "RUNNING"): [],
+            ("workers_stack-large-BuildFarm-Worker", "RUNNING"): [
+                "worker_1", "worker_2"
+            ],
+        },
+        task_counts={
+            ("server_stack-BuildFarm-Server", "STOPPED"): 0,
+            ("workers_stack-BuildFarm-Worker", "STOPPED"): 0,
+            ("workers_stack-large-BuildFarm-Worker", "STOPPED"): 0,
+        },
+        tasks={
+            "server_1": {
+                "is_running":
+                    True,
+                "network":
+                    containers.Network(
+                        public_ip="my_server_ip",
+                        public_dns_name="my_public_dns_name",
+                    ),
+            },
+            "worker_1": {
+                "is_running": False
+            },
+            "worker_2": {
+                "is_running": True
+            },
+        })
+    status = actions.do_status(self.config, cont=cont)
+    self.assertEqual(status.worker_pools, {
+        "large": {
+            "running_workers": 1,
+            "pending_workers": 1,
+        },
+    })
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,175 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Log of the activity of the remote build system.
+
+The Lambda function is stateless, so the activity is kept in a small JSON object
+on S3.  It records the recent `/connect` requests, the last time the workers were
+busy, the history of the demand for each hour of the week, the last time the
+workers were scaled, and the progress of the idle shutdown.
+
+The object is read and written back without any locking: concurrent requests
+may lose an entry, which only makes the autoscaler slightly less accurate.
+"""
+import json
+import time
+
+from botocore.exceptions import ClientError
+
+import clients
+
+# Number of seconds in an hour, and number of hours in a week.
+HOUR = 3600
+HOURS_PER_WEEK = 7 * 24
+# How long, in seconds, the `/connect` requests are kept in the log.
+CONNECTS_TTL = 24 * HOUR
+# Weight of the latest observation in the history of the demand (exponential
+# moving average).
+HISTORY_WEIGHT = 0.3
+
+
+def get_location(config):
+  """Returns the S3 bucket and key of the activity log.
+
+  By default, the log is stored next to the code of the Lambda function.
+  """
+  if config.get("activity"):
+    return (config["activity"]["bucket"], config["activity"]["key"])
+  return (config["lambda"]["code_bucket"],
+          config["lambda"]["code_key"] + ".activity.json")
+
+
+def get_activity_log(config):
+  """Returns the activity log for a configuration object."""
+  (bucket, key) = get_location(config)
+  return ActivityLog(clients.get_client("s3", config["region"]), bucket, key)
+
+
+def get_slot(timestamp):
+  """Returns the hour of the week (UTC) of a timestamp, as a string, so that it
+  can be used as a JSON key."""
+  return str(int(timestamp // HOUR) % HOURS_PER_WEEK)
+
+
+class ActivityLog(object):
+  """Activity log stored in an S3 object.  Call `load` before use and `save`
+  to write back the changes."""
+
+  def __init__(self, s3, bucket, key):
+    self.s3 = s3
+    self.bucket = bucket
+    self.key = key
+    self.state = None
+
+  def load(self):
+    """Reads the log.  A missing object gives an empty log."""
+    try:
+      body = self.s3.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+      self.state = json.loads(body)
+    except ClientError as e:
+      if e.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+        raise e
+      self.state = {}
+    self.state.setdefault("connects", [])
+    self.state.setdefault("history", {})
+    return self
+
+  def save(self):
+    """Writes back the log."""
+    self.s3.put_object(
+        Bucket=self.bucket,
+        Key=self.key,
+        Body=json.dumps(self.state, sort_keys=True),
+        ContentType="application/json")
+
+  def record_connect(self, worker_count, now=None):
+    """Records a `/connect` request for `worker_count` workers."""
+    now = now or time.time()
+    self.state["connects"] = [
+        entry for entry in self.state["connects"]
+        if entry[0] >= now - CONNECTS_TTL
+    ] + [[now, worker_count]]
+    self.state["last_connect"] = now
+
+  def last_connect(self):
+    """Returns the time of the last `/connect` request, or `None`."""
+    return self.state.get("last_connect")
+
+  def record_busy(self, now=None):
+    """Records that the workers were busy, whether or not their builds called
+    `/connect`."""
+    self.state["last_busy"] = now or time.time()
+
+  def last_activity(self):
+    """Returns the time of the last `/connect` request or of the last time the
+    workers were busy, whichever is later, or `None`."""
+    times = [
+        t for t in [self.state.get("last_connect"),
+                    self.state.get("last_busy")] if t is not None
+    ]
+    return max(times) if times else None
+
+  def touch(self, now=None):
+    """Sets the time of the last `/connect` request if it is unknown, so that
+    the idle period starts now."""
+    self.state.setdefault("last_connect", now or time.time())
+
+  def recent_demand(self, window, now=None):
+    """Returns the largest worker count requested within the last `window`
+    seconds."""
+    now = now or time.time()
+    return max(
+        [count for (ts, count) in self.state["connects"] if ts >= now - window
+        ] + [0])
+
+  def record_demand(self, demand, now=None):
+    """Folds an observed demand into the history of the current hour of the
+    week."""
+    slot = get_slot(now or time.time())
+    previous = self.state["history"].get(slot)
+    if previous is None:
+      self.state["history"][slot] = demand
+    else:
+      self.state["history"][slot] = (
+          HISTORY_WEIGHT * demand + (1 - HISTORY_WEIGHT) * previous)
+
+  def predicted_demand(self, lookahead=HOUR, now=None):
+    """Returns the demand predicted by the history, from now until `lookahead`
+    seconds from now."""
+    now = now or time.time()
+    slots = set([get_slot(now), get_slot(now + lookahead)])
+    return max([self.state["history"].get(slot, 0) for slot in slots])
+
+  def record_scale(self, worker_count, now=None):
+    """Records that the workers were scaled to `worker_count`."""
+    self.state["last_scale"] = {
+        "time": now or time.time(),
+        "workers": worker_count,
+    }
+
+  def last_scale_time(self):
+    """Returns the time the workers were last scaled, or `None`."""
+    return self.state.get("last_scale", {}).get("time")
+
+  def record_workers_stopped(self, now=None):
+    """Records that the workers were stopped because the remote build system
+    was idle."""
+    self.state["workers_stopped_at"] = now or time.time()
+
+  def workers_stopped_at(self):
+    """Returns the time the idle workers were stopped, or `None`."""
+    return self.state.get("workers_stopped_at")
+
+  def clear_workers_stopped(self):
+    """Forgets that the idle workers were stopped."""
+    self.state.pop("workers_stopped_at", None)
@@ -0,0 +1,133 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+import json
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+
+import activity
+
+# Monday 2018-01-01, 10:00 UTC.
+_NOW = 1514800800
+
+
+class ActivityTest(unittest.TestCase):
+
+  def setUp(self):
+    self.s3 = boto3.client("s3", region_name="eu-west-1")
+    self.stubber = Stubber(self.s3)
+    self.log = activity.ActivityLog(self.s3, "my_bucket", "my_key")
+
+  def _add_get_object_response(self, state):
+    self.stubber.add_response(
+        "get_object",
+        service_response={"Body": io.BytesIO(json.dumps(state))},
+        expected_params={
+            "Bucket": "my_bucket",
+            "Key": "my_key"
+        })
+
+  def test_get_location(self):
+    config = {
+        "lambda": {
+            "code_bucket": "code_bucket",
+            "code_key": "code_key",
+        },
+    }
+    self.assertEqual(
+        activity.get_location(config),
+        ("code_bucket", "code_key.activity.json"))
+    config["activity"] = {"bucket": "my_bucket", "key": "my_key"}
+    self.assertEqual(activity.get_location(config), ("my_bucket", "my_key"))
+
+  def test_load_missing(self):
+    self.stubber.add_client_error("get_object", service_error_code="NoSuchKey")
+    with self.stubber:
+      self.log.load()
+    self.assertEqual(self.log.state, {"connects": [], "history": {}})
+    self.assertIsNone(self.log.last_connect())
+    self.assertIsNone(self.log.last_scale_time())
+
+  def test_record_connect(self):
+    self._add_get_object_response({
+        "connects": [[_NOW - 2 * activity.CONNECTS_TTL, 8], [_NOW - 600, 3]],
+    })
+    self.stubber.add_response(
+        "put_object",
+        service_response={},
+        expected_params={
+            "Bucket":
+                "my_bucket",
+            "Key":
+                "my_key",
+            "ContentType":
+                "application/json",
+            "Body":
+                json.dumps(
+                    {
+                        "connects": [[_NOW - 600, 3], [_NOW, 2]],
+                        "history": {},
+                        "last_connect": _NOW,
+                    },
+                    sort_keys=True),
+        })
+    with self.stubber:
+      self.log.load()
+      self.log.record_connect(2, now=_NOW)
+      self.assertEqual(self.log.recent_demand(1800, now=_NOW), 3)
+      self.assertEqual(self.log.recent_demand(300, now=_NOW), 2)
+      self.assertEqual(self.log.recent_demand(300, now=_NOW + 600), 0)
+      self.log.save()
+    self.stubber.assert_no_pending_responses()
+
+  def test_history(self):
+    self._add_get_object_response({})
+    with self.stubber:
+      self.log.load()
+    self.assertEqual(self.log.predicted_demand(now=_NOW), 0)
+    self.log.record_demand(10, now=_NOW)
+    self.log.record_demand(0, now=_NOW + 60)
+    self.assertAlmostEqual(self.log.predicted_demand(now=_NOW), 7)
+    # The next hour is looked ahead.
+    self.assertAlmostEqual(
+        self.log.predicted_demand(now=_NOW - activity.HOUR), 7)
+    self.assertEqual(
+        self.log.predicted_demand(now=_NOW - 2 * activity.HOUR), 0)
+    # The same hour, a week later.
+    self.assertAlmostEqual(
+        self.log.predicted_demand(now=_NOW + 7 * 24 * activity.HOUR), 7)
+
+  def test_record_scale(self):
+    self._add_get_object_response({})
+    with self.stubber:
+      self.log.load()
+    self.log.record_scale(4, now=_NOW)
+    self.assertEqual(self.log.last_scale_time(), _NOW)
+
+  def test_last_activity(self):
+    self._add_get_object_response({})
+    with self.stubber:
+      self.log.load()
+    self.assertIsNone(self.log.last_activity())
+    self.log.record_connect(2, now=_NOW)
+    self.assertEqual(self.log.last_activity(), _NOW)
+    self.log.record_busy(now=_NOW + 600)
+    self.assertEqual(self.log.last_activity(), _NOW + 600)
+    self.assertEqual(self.log.last_connect(), _NOW)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -64,3 +64,25 @@ class Params(object):
       return False
     raise InvalidArgumentException(
         "invalid '%s' parameter: expected either 'true' or 'false'" % name)
+
+  def get_counts(self, name, keys):
+    """Gets a map from keys within a set of allowed values to positive integers,
+    given as "key1=count1,key2=count2"."""
+    ans = {}
+    for item in filter(None, self.params.get(name, "").split(",")):
+      (key, _, count) = item.partition("=")
+      if key not in keys:
+        raise InvalidArgumentException(
+            "invalid '%s' parameter: expected keys among: %s" %
+            (name, ", ".join(keys)))
+      try:
+        ans[key] = int(count)
+      except ValueError:
+        raise InvalidArgumentException(
+            "invalid '%s' parameter: expected an integer for '%s'" % (name,
+                                                                     key))
+      if ans[key] < 0:
+        raise InvalidArgumentException(
+            "invalid '%s' parameter: expected a positive integer or zero for "
+            "'%s'" % (name, key))
+    return ans
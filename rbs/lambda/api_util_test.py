@@ -46,6 +46,21 @@ class ApiUtilTest(unittest.TestCase):
     self.assertRaises(api_util.InvalidArgumentException,
                       api_util.Params({}).get_one_of, "foo", options)
 
+  def test_get_counts(self):
+    params = api_util.Params({"foo": "a=1,b=0"})
+    self.assertEqual(params.get_counts("foo", ["a", "b"]), {"a": 1, "b": 0})
+    self.assertEqual(params.get_counts("bar", ["a", "b"]), {})
+    self.assertRaises(api_util.InvalidArgumentException, params.get_counts,
+                      "foo", ["a"])
+    self.assertRaises(api_util.InvalidArgumentException,
+                      api_util.Params({
+                          "foo": "a=x"
+                      }).get_counts, "foo", ["a"])
+    self.assertRaises(api_util.InvalidArgumentException,
+                      api_util.Params({
+                          "foo": "a=-1"
+                      }).get_counts, "foo", ["a"])
+
   def test_get_bool(self):
     self.assertEqual(api_util.Params({"foo": "true"}).get_bool("foo"), True)
     self.assertEqual(api_util.Params({}).get_bool("foo"), False)
@@ -12,17 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Deals with authentication."""
-import os
 import json
-import boto3
+import threading
+import time
+
+import clients
 
 # https://bbengfort.github.io/programmer/2017/03/03/secure-grpc.html
 # https://github.com/grpc/grpc-java/blob/701c127f4ca4e61d649db4e1a02538061e3db3ad/examples/src/main/java/io/grpc/examples/helloworldtls/HelloWorldClientTls.java
 # https://github.com/awslabs/serverless-application-model/issues/25
 
 
+# How long, in seconds, the authentication info fetched from S3 is reused.
+AUTH_INFO_TTL = 300
+
+_authenticators = {}
+_authenticators_lock = threading.Lock()
+
+
 def get_authenticator(config):
-  """Returns the authenticator implementation, given a configuration object."""
+  """Returns the authenticator implementation, given a configuration object.
+
+  The authenticator is kept across invocations of the Lambda function, as long as
+  the authentication configuration does not change.
+  """
+  key = json.dumps([config.get("auth"), config.get("region")], sort_keys=True)
+  with _authenticators_lock:
+    authenticator = _authenticators.get(key)
+    if authenticator is None:
+      # The configuration changed: the previous authenticators are stale.
+      _authenticators.clear()
+      authenticator = _new_authenticator(config)
+      _authenticators[key] = authenticator
+    return authenticator
+
+
+def invalidate_authenticators():
+  """Forgets all the authenticators, and the authentication info they hold."""
+  with _authenticators_lock:
+    _authenticators.clear()
+
+
+def _new_authenticator(config):
+  """Creates the authenticator implementation, given a configuration object."""
   if config.get("auth") is None:
     return NoOpAuthenticator()
   keys = config["auth"].keys()
@@ -59,11 +91,14 @@ class SimpleAuthenticator(object):
   The JSON file must obviously has restricted access, and it is probably a good
   idea to use a KMS encryption-at-rest."""
 
-  def __init__(self, config, region):
+  def __init__(self, config, region, ttl=AUTH_INFO_TTL, s3=None):
     self.s3_bucket = config["bucket"]
     self.s3_key = config["key"]
     self.config = None
+    self.fetched_at = None
     self.region = region
+    self.ttl = ttl
+    self.s3 = s3
 
   def get_auth_info(self):
     """Returns the authentication info that is forwarded to the `bazel_bf` client."""
@@ -79,13 +114,21 @@ class SimpleAuthenticator(object):
     with the proper credentials and trust chains."""
     return self._config()
 
+  def invalidate(self):
+    """Forgets the authentication info, so that it is fetched again on next use."""
+    self.config = None
+
   def _config(self):
-    """Fetches the authentication info from the S3 object."""
-    if self.config is None:
-      s3 = boto3.client("s3", region_name=self.region)
+    """Fetches the authentication info from the S3 object.
+
+    The authentication info is reused for `ttl` seconds.
+    """
+    if self.config is None or time.time() - self.fetched_at >= self.ttl:
+      s3 = self.s3 or clients.get_client("s3", self.region)
       config_str = s3.get_object(
           Bucket=self.s3_bucket, Key=self.s3_key)["Body"].read()
       self.config = json.loads(config_str)
+      self.fetched_at = time.time()
       # TODO: make it work by changing how the Lambda function is packaged
       # from infra.rbs.schemas.validate import validate
       # validate(self.config, "simple_auth_config")
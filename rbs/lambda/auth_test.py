@@ -0,0 +1,72 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+
+import auth
+
+
+class AuthTest(unittest.TestCase):
+
+  def setUp(self):
+    auth.invalidate_authenticators()
+    self.config = {
+        "region": "eu-west-1",
+        "auth": {
+            "simple": {
+                "bucket": "my_bucket",
+                "key": "my_key",
+            },
+        },
+    }
+
+  def test_get_authenticator(self):
+    authenticator = auth.get_authenticator(self.config)
+    self.assertIsInstance(authenticator, auth.SimpleAuthenticator)
+    self.assertIs(auth.get_authenticator(dict(self.config)), authenticator)
+    self.assertIsInstance(
+        auth.get_authenticator({
+            "region": "eu-west-1"
+        }), auth.NoOpAuthenticator)
+    self.assertIsNot(auth.get_authenticator(self.config), authenticator)
+
+  def test_invalidate_authenticators(self):
+    authenticator = auth.get_authenticator(self.config)
+    auth.invalidate_authenticators()
+    self.assertIsNot(auth.get_authenticator(self.config), authenticator)
+
+  @mock.patch("time.time")
+  def test_simple_authenticator_ttl(self, time_time):
+    body = lambda: 0
+    body.read = lambda: "{\"ca_crt\": \"some_ca_crt\"}"
+    s3 = mock.Mock()
+    s3.get_object.return_value = {"Body": body}
+
+    authenticator = auth.SimpleAuthenticator(
+        self.config["auth"]["simple"], region="eu-west-1", ttl=60, s3=s3)
+    time_time.return_value = 1000
+    self.assertEqual(authenticator.get_server_auth_info(),
+                     {"ca_crt": "some_ca_crt"})
+    time_time.return_value = 1059
+    authenticator.get_server_auth_info()
+    s3.get_object.assert_called_once_with(Bucket="my_bucket", Key="my_key")
+    time_time.return_value = 1060
+    authenticator.get_server_auth_info()
+    self.assertEqual(s3.get_object.call_count, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
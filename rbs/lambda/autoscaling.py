@@ -0,0 +1,98 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Decides on the number of build workers from the demand.
+
+The demand is the largest of:
+
+* the worker count of the recent `/connect` requests;
+* the demand predicted by the history for the current and next hour of the week;
+* the number of workers needed for the operations queued on the build server;
+* the number of workers kept busy by the builds, from the CPU utilization of the
+  running workers.
+
+Scaling up is immediate, as idle developers are more expensive than idle workers.
+Scaling down only happens when the surplus is at least `scale_down_hysteresis`
+workers, and not within `cooldown` seconds of the last scaling, so that the
+workers do not flap.
+"""
+import math
+
+import attr
+
+# Default settings, overridden by the "autoscaling" key of the configuration.
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "min_workers": 0,
+    "max_workers": 10,
+    "cooldown": 900,
+    "scale_down_hysteresis": 1,
+    "recent_window": 1800,
+    "actions_per_worker": 1,
+    "target_cpu_utilization": 50,
+    "load_window": 600,
+}
+
+
+def get_settings(config):
+  """Returns the autoscaling settings of a configuration object."""
+  settings = dict(DEFAULT_SETTINGS)
+  settings.update(config.get("autoscaling") or {})
+  return settings
+
+
+def get_busy_workers(settings, running_workers, cpu_utilization):
+  """Returns the number of workers needed to bring the CPU utilization of
+  `running_workers` workers to the target, or 0 if it is unknown."""
+  if cpu_utilization is None:
+    return 0
+  return int(
+      round(running_workers * cpu_utilization /
+            settings["target_cpu_utilization"]))
+
+
+def get_demand(settings, recent, predicted, queued=None, busy=0):
+  """Returns the demand, in number of workers."""
+  demand = max(recent, int(math.ceil(predicted)), busy)
+  if queued:
+    demand = max(demand,
+                 int(math.ceil(float(queued) / settings["actions_per_worker"])))
+  return demand
+
+
+# pylint: disable=too-few-public-methods
+@attr.s
+class Decision(object):
+  """Outcome of the autoscaler."""
+  current = attr.ib()
+  demand = attr.ib()
+  target = attr.ib()
+  reason = attr.ib()
+
+
+def decide(settings, current, demand, last_scale_time, now):
+  """Decides on the number of workers, given the `current` number of workers and
+  the `demand`."""
+  target = min(max(demand, settings["min_workers"]), settings["max_workers"])
+  if target > current:
+    return Decision(current, demand, target, "scale up")
+  if target == current:
+    return Decision(current, demand, current, "steady")
+  if current > settings["max_workers"]:
+    return Decision(current, demand, target, "above maximum")
+  if current - target < settings["scale_down_hysteresis"]:
+    return Decision(current, demand, current, "within hysteresis")
+  if (last_scale_time is not None and
+      now - last_scale_time < settings["cooldown"]):
+    return Decision(current, demand, current, "cooldown")
+  return Decision(current, demand, target, "scale down")
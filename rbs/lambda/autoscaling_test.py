@@ -0,0 +1,78 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import autoscaling
+
+
+class AutoscalingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.settings = autoscaling.get_settings({
+        "autoscaling": {
+            "enabled": True,
+            "min_workers": 1,
+            "max_workers": 8,
+            "cooldown": 600,
+            "scale_down_hysteresis": 2,
+            "actions_per_worker": 4,
+        },
+    })
+
+  def test_get_settings(self):
+    settings = autoscaling.get_settings({})
+    self.assertFalse(settings["enabled"])
+    self.assertEqual(settings, autoscaling.DEFAULT_SETTINGS)
+    self.assertEqual(self.settings["recent_window"],
+                     autoscaling.DEFAULT_SETTINGS["recent_window"])
+
+  def test_get_demand(self):
+    self.assertEqual(autoscaling.get_demand(self.settings, 2, 0), 2)
+    self.assertEqual(autoscaling.get_demand(self.settings, 2, 2.1), 3)
+    self.assertEqual(autoscaling.get_demand(self.settings, 2, 0, queued=13), 4)
+    self.assertEqual(autoscaling.get_demand(self.settings, 2, 0, queued=0), 2)
+    self.assertEqual(autoscaling.get_demand(self.settings, 2, 0, busy=5), 5)
+
+  def test_get_busy_workers(self):
+    self.assertEqual(autoscaling.get_busy_workers(self.settings, 4, None), 0)
+    self.assertEqual(autoscaling.get_busy_workers(self.settings, 4, 1.0), 0)
+    self.assertEqual(autoscaling.get_busy_workers(self.settings, 4, 50.0), 4)
+    self.assertEqual(autoscaling.get_busy_workers(self.settings, 4, 90.0), 7)
+
+  def test_decide(self):
+    decide = lambda current, demand, last_scale_time=None: autoscaling.decide(
+        self.settings, current, demand, last_scale_time, now=10000)
+    self.assertEqual(
+        decide(2, 5), autoscaling.Decision(2, 5, 5, "scale up"))
+    self.assertEqual(
+        decide(2, 20, last_scale_time=9999),
+        autoscaling.Decision(2, 20, 8, "scale up"))
+    self.assertEqual(
+        decide(0, 0), autoscaling.Decision(0, 0, 1, "scale up"))
+    self.assertEqual(decide(3, 3), autoscaling.Decision(3, 3, 3, "steady"))
+    self.assertEqual(
+        decide(3, 2), autoscaling.Decision(3, 2, 3, "within hysteresis"))
+    self.assertEqual(
+        decide(5, 2, last_scale_time=9500),
+        autoscaling.Decision(5, 2, 5, "cooldown"))
+    self.assertEqual(
+        decide(5, 2, last_scale_time=9000),
+        autoscaling.Decision(5, 2, 2, "scale down"))
+    self.assertEqual(
+        decide(9, 8, last_scale_time=9999),
+        autoscaling.Decision(9, 8, 8, "above maximum"))
+
+
+if __name__ == '__main__':
+  unittest.main()
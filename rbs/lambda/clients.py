@@ -0,0 +1,42 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Registry of the AWS clients used by the Lambda function.
+
+AWS Lambda reuses the execution environment of a function between invocations,
+so the clients are created once per "warm" container instead of once per call.
+"""
+import threading
+
+import boto3
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region):
+  """Returns the boto3 client for a given service and region."""
+  key = (service_name, region)
+  with _clients_lock:
+    client = _clients.get(key)
+    if client is None:
+      # The default boto3 session is not thread-safe: it is only used under the lock.
+      client = boto3.client(service_name, region_name=region)
+      _clients[key] = client
+    return client
+
+
+def clear():
+  """Forgets all the clients."""
+  with _clients_lock:
+    _clients.clear()
@@ -0,0 +1,38 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import clients
+
+
+class ClientsTest(unittest.TestCase):
+
+  def setUp(self):
+    clients.clear()
+
+  def test_get_client(self):
+    ecs = clients.get_client("ecs", "eu-west-1")
+    self.assertIs(clients.get_client("ecs", "eu-west-1"), ecs)
+    self.assertIsNot(clients.get_client("ecs", "us-east-1"), ecs)
+    self.assertIsNot(clients.get_client("ec2", "eu-west-1"), ecs)
+
+  def test_clear(self):
+    ecs = clients.get_client("ecs", "eu-west-1")
+    clients.clear()
+    self.assertIsNot(clients.get_client("ecs", "eu-west-1"), ecs)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,7 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Communicates with the AWS Elastic Container Service (ECS)."""
+import threading
+import time
+
+from concurrent import futures
 import boto3
+from botocore.exceptions import ClientError
 import attr
 
 
@@ -24,31 +29,118 @@ class Network(object):
   public_dns_name = attr.ib()
 
 
+# Maximum number of network interface IDs per `describe_network_interfaces` call.
+ENI_BATCH_SIZE = 200
+# Maximum number of task ARNs per `describe_tasks` call (this is an ECS limit).
+DESCRIBE_TASKS_BATCH_SIZE = 100
+# Maximum number of concurrent `describe_tasks` calls.
+DESCRIBE_TASKS_MAX_WORKERS = 4
+# Error code of EC2 when a network interface does not exist.
+ENI_NOT_FOUND = "InvalidNetworkInterfaceID.NotFound"
+
+_UNRESOLVED = object()
+
+
+def _network_from_interface(interface):
+  """Returns the `Network` for a raw network interface description, or `None` if
+  the interface has no public association."""
+  if interface.get("Association") is None:
+    return None
+  return Network(
+      public_ip=interface["Association"]["PublicIp"],
+      public_dns_name=interface["Association"]["PublicDnsName"],
+  )
+
+
+def describe_network_interfaces(ec2, network_interface_ids):
+  """Returns the raw descriptions of network interfaces, leaving out those that do
+  not exist.
+
+  The network interface of a task is only attached after the task is
+  provisioned, and is deleted once the task is stopped.
+  """
+  try:
+    return ec2.describe_network_interfaces(
+        NetworkInterfaceIds=network_interface_ids)["NetworkInterfaces"]
+  except ClientError as e:
+    if e.response["Error"]["Code"] != ENI_NOT_FOUND:
+      raise e
+  if len(network_interface_ids) <= 1:
+    return []
+  # A single missing interface fails the whole call: describe them one by one.
+  return [
+      interface for network_interface_id in network_interface_ids
+      for interface in describe_network_interfaces(ec2, [network_interface_id])
+  ]
+
+
+def _network_interface_id(task):
+  """Gets the ID of the network interface attached to a raw ECS task description,
+  or `None`."""
+  if not task.get("attachments"):
+    return None
+  attachment_details = task["attachments"][0]["details"]
+  network_interface_ids = [
+      att for att in attachment_details if att["name"] == "networkInterfaceId"
+  ]
+  if not network_interface_ids:
+    return None
+  return network_interface_ids[0]["value"]
+
+
+def _task_id(task_arn):
+  """Returns the task ID for a task ARN (the ECS API accepts both)."""
+  return task_arn.split("/")[-1]
+
+
+# pylint: disable=too-few-public-methods
+@attr.s
+class TaskFailure(object):
+  """Represents a task that the ECS API failed to describe."""
+  arn = attr.ib()
+  reason = attr.ib()
+
+  def network(self):  # pylint: disable=no-self-use
+    """A failed task has no network info."""
+    return None
+
+  def is_running(self):  # pylint: disable=no-self-use
+    """A failed task is not known to be running."""
+    return False
+
+
 class Task(object):
   """Represents a ECS stack."""
 
-  def __init__(self, task, region="eu-west-1", ec2=None):
-    """Initializes the representation from the raw description given by the ECS API."""
-    self.ec2 = ec2 or boto3.client('ec2', region_name=region)
+  def __init__(self, task, region="eu-west-1", ec2=None, network=_UNRESOLVED):
+    """Initializes the representation from the raw description given by the ECS API.
+
+    The network info can be given if it has already been resolved, e.g. by
+    `ContainerService.describe_tasks_with_network`.
+    """
+    self.region = region
+    self._ec2 = ec2
+    self._network = network
     self.task = task
 
+  @property
+  def ec2(self):
+    """The EC2 client, created on first use."""
+    if self._ec2 is None:
+      self._ec2 = boto3.client('ec2', region_name=self.region)
+    return self._ec2
+
   def network(self):
     """Gets the network info for this ECS task."""
-    attachment_details = self.task["attachments"][0]["details"]
-    network_interface_ids = [
-        att for att in attachment_details if att["name"] == "networkInterfaceId"
-    ]
-    if not network_interface_ids:
+    if self._network is not _UNRESOLVED:
+      return self._network
+    network_interface_id = _network_interface_id(self.task)
+    if network_interface_id is None:
       return None
-    desc = self.ec2.describe_network_interfaces(
-        NetworkInterfaceIds=[network_interface_ids[0]["value"]])
-    interface = desc["NetworkInterfaces"][0]
-    if interface.get("Association") is None:
+    interfaces = describe_network_interfaces(self.ec2, [network_interface_id])
+    if not interfaces:
       return None
-    return Network(
-        public_ip=interface["Association"]["PublicIp"],
-        public_dns_name=interface["Association"]["PublicDnsName"],
-    )
+    return _network_from_interface(interfaces[0])
 
   def is_running(self):
     """Whether the task is running."""
@@ -58,12 +150,20 @@ class Task(object):
 class ContainerService(object):
   """Interface to the Elastic Container Service."""
 
-  def __init__(self, cluster, region="eu-west-1", ecs=None):
+  def __init__(self, cluster, region="eu-west-1", ecs=None, ec2=None):
     """Initializes the interface for a given ECS cluster."""
     self.ecs = ecs or boto3.client('ecs', region_name=region)
+    self._ec2 = ec2
     self.region = region
     self.cluster = cluster
 
+  @property
+  def ec2(self):
+    """The EC2 client shared by all the tasks, created on first use."""
+    if self._ec2 is None:
+      self._ec2 = boto3.client('ec2', region_name=self.region)
+    return self._ec2
+
   def list_tasks(self, **kwargs):
     """Lists all the task ARNs in this cluster.
 
@@ -82,9 +182,123 @@ class ContainerService(object):
     """
     return len(self.list_tasks(**kwargs))
 
+  def _describe_chunk(self, task_arns):
+    """Describes at most `DESCRIBE_TASKS_BATCH_SIZE` tasks.
+
+    Returns, in the order of `task_arns`, either the raw ECS description of each
+    task or a `TaskFailure`.
+    """
+    desc = self.ecs.describe_tasks(cluster=self.cluster, tasks=task_arns)
+    by_id = {}
+    for task in desc["tasks"]:
+      by_id[_task_id(task["taskArn"])] = task
+    for failure in desc.get("failures", []):
+      by_id[_task_id(failure["arn"])] = TaskFailure(
+          arn=failure["arn"], reason=failure.get("reason"))
+    return [
+        by_id.get(_task_id(arn)) or TaskFailure(arn=arn, reason="MISSING")
+        for arn in task_arns
+    ]
+
+  def _describe_raw_tasks(self, task_arns):
+    """Generates, in order, the raw ECS descriptions (or `TaskFailure`) of the
+    tasks given in a list of task ARNs.
+
+    The ARNs are split into chunks accepted by the ECS API, and the chunks are
+    described concurrently.
+    """
+    chunks = [
+        task_arns[i:i + DESCRIBE_TASKS_BATCH_SIZE]
+        for i in range(0, len(task_arns), DESCRIBE_TASKS_BATCH_SIZE)
+    ]
+    if len(chunks) <= 1:
+      for chunk in chunks:
+        for task in self._describe_chunk(chunk):
+          yield task
+      return
+    with futures.ThreadPoolExecutor(
+        max_workers=min(len(chunks), DESCRIBE_TASKS_MAX_WORKERS)) as executor:
+      for tasks in executor.map(self._describe_chunk, chunks):
+        for task in tasks:
+          yield task
+
   def describe_tasks(self, task_arns):
-    """Describes the tasks given in a list of task ARNs."""
-    if task_arns:
-      tasks = self.ecs.describe_tasks(cluster=self.cluster, tasks=task_arns)
-      for task in tasks["tasks"]:
-        yield Task(task, region=self.region)
+    """Describes the tasks given in a list of task ARNs.
+
+    The tasks are generated in the order of `task_arns`.  A `TaskFailure` is
+    generated for the tasks that cannot be described.
+    """
+    for task in self._describe_raw_tasks(task_arns):
+      if isinstance(task, TaskFailure):
+        yield task
+      else:
+        yield Task(task, region=self.region, ec2=self.ec2)
+
+  def describe_networks(self, network_interface_ids):
+    """Returns a dictionary of network interface IDs to `Network` objects (or
+    `None` when an interface has no public association).  The interfaces that
+    do not exist are left out."""
+    ans = {}
+    for i in range(0, len(network_interface_ids), ENI_BATCH_SIZE):
+      for interface in describe_network_interfaces(
+          self.ec2, network_interface_ids[i:i + ENI_BATCH_SIZE]):
+        ans[interface["NetworkInterfaceId"]] = _network_from_interface(
+            interface)
+    return ans
+
+  def describe_tasks_with_network(self, task_arns):
+    """Describes the tasks given in a list of task ARNs, with their network info.
+
+    The network interfaces of the running tasks are resolved together, instead
+    of one EC2 call per task.  The other tasks have no network info: their
+    interface may still be attaching or already be detached.
+    """
+    tasks = list(self._describe_raw_tasks(task_arns))
+    network_interface_ids = [
+        _network_interface_id(task)
+        if not isinstance(task, TaskFailure) and
+        task.get("lastStatus") == "RUNNING" else None for task in tasks
+    ]
+    networks = self.describe_networks(
+        [eni for eni in network_interface_ids if eni is not None])
+    return [
+        task if isinstance(task, TaskFailure) else Task(
+            task,
+            region=self.region,
+            ec2=self.ec2,
+            network=networks.get(eni) if eni is not None else None)
+        for (task, eni) in zip(tasks, network_interface_ids)
+    ]
+
+
+_stopped_counts = {}
+_stopped_counts_lock = threading.Lock()
+
+
+def count_stopped_tasks(cont, family, ttl=0):
+  """Counts the tasks of a family with a "STOPPED" desired status.
+
+  If `ttl` is positive, a count for the same cluster and family that is less than
+  `ttl` seconds old is reused.  ECS keeps the stopped tasks for an hour, and
+  listing them is the slowest part of the status, while their count is only
+  informative.  The running tasks, on the other hand, are never cached.
+  """
+  if ttl <= 0:
+    return cont.count_tasks(family=family, desiredStatus="STOPPED")
+  key = (cont.cluster, family)
+  with _stopped_counts_lock:
+    cached = _stopped_counts.get(key)
+  if cached is not None and time.time() - cached[0] < ttl:
+    return cached[1]
+  # The lock is not held during the call, so that a slow call does not hold up
+  # the other families.
+  count = cont.count_tasks(family=family, desiredStatus="STOPPED")
+  with _stopped_counts_lock:
+    _stopped_counts[key] = (time.time(), count)
+  return count
+
+
+def clear_stopped_counts():
+  """Forgets the cached counts of stopped tasks."""
+  with _stopped_counts_lock:
+    _stopped_counts.clear()
@@ -51,7 +51,8 @@ class ContainersTest(unittest.TestCase):
     self.assertEqual(tasks, ["task1", "task2", "task3", "task4"])
 
   @mock.patch(
-      "containers.Task", side_effect=lambda task, region: {"processed": task})
+      "containers.Task",
+      side_effect=lambda task, **_kwargs: {"processed": task})
   def test_describe_tasks(self, _containers_task):
     ecs = boto3.client('ecs', region_name="eu-west-1")
     stubber = Stubber(ecs)
@@ -63,9 +64,11 @@ class ContainersTest(unittest.TestCase):
         },
         service_response={
             "tasks": [{
-                "taskDefinitionArn": "a"
-            }, {
+                "taskArn": "task_id2",
                 "taskDefinitionArn": "b"
+            }, {
+                "taskArn": "task_id1",
+                "taskDefinitionArn": "a"
             }]
         })
     stubber.activate()
@@ -74,14 +77,173 @@ class ContainersTest(unittest.TestCase):
     tasks = list(inst.describe_tasks(["task_id1", "task_id2"]))
     self.assertEqual(tasks, [{
         "processed": {
+            "taskArn": "task_id1",
             "taskDefinitionArn": "a"
         }
     }, {
         "processed": {
+            "taskArn": "task_id2",
             "taskDefinitionArn": "b"
         }
     }])
 
+  def test_describe_tasks_chunks(self):
+
+    def _describe_tasks(cluster, tasks):
+      self.assertEqual(cluster, "my_cluster")
+      self.assertLessEqual(len(tasks), 100)
+      return {
+          "tasks": [{
+              "taskArn": "arn:aws:ecs:eu-west-1:0:task/" + task_id,
+              "lastStatus": "RUNNING",
+          } for task_id in tasks if task_id != "task_42"],
+          "failures": [{
+              "arn": "arn:aws:ecs:eu-west-1:0:task/task_42",
+              "reason": "MISSING",
+          }] if "task_42" in tasks else [],
+      }
+
+    ecs = mock.Mock()
+    ecs.describe_tasks.side_effect = _describe_tasks
+    inst = containers.ContainerService(cluster="my_cluster", ecs=ecs)
+    task_ids = ["task_%d" % i for i in range(250)]
+    tasks = list(inst.describe_tasks(task_ids))
+    self.assertEqual(ecs.describe_tasks.call_count, 3)
+    self.assertEqual([task.is_running() for task in tasks],
+                     [i != 42 for i in range(250)])
+    self.assertEqual(tasks[42],
+                     containers.TaskFailure(
+                         arn="arn:aws:ecs:eu-west-1:0:task/task_42",
+                         reason="MISSING"))
+    self.assertEqual(tasks[249].task["taskArn"],
+                     "arn:aws:ecs:eu-west-1:0:task/task_249")
+
+  def test_describe_tasks_with_network(self):
+    ecs = boto3.client('ecs', region_name="eu-west-1")
+    ecs_stubber = Stubber(ecs)
+    ecs_stubber.add_response(
+        'describe_tasks',
+        expected_params={
+            "cluster": "my_cluster",
+            "tasks": ["task_id1", "task_id2", "task_id3", "task_id4"]
+        },
+        service_response={
+            "tasks": [{
+                "taskArn": "task_id1",
+                "lastStatus": "RUNNING",
+                "attachments": [{
+                    "details": [{
+                        "name": "networkInterfaceId",
+                        "value": "eni_1",
+                    }]
+                }],
+            }, {
+                "taskArn": "task_id2",
+                "lastStatus": "RUNNING",
+                "attachments": [],
+            }, {
+                "taskArn": "task_id3",
+                "lastStatus": "RUNNING",
+                "attachments": [{
+                    "details": [{
+                        "name": "networkInterfaceId",
+                        "value": "eni_3",
+                    }]
+                }],
+            }, {
+                # The interface of a pending task is not resolved.
+                "taskArn": "task_id4",
+                "lastStatus": "PROVISIONING",
+                "attachments": [{
+                    "details": [{
+                        "name": "networkInterfaceId",
+                        "value": "eni_4",
+                    }]
+                }],
+            }]
+        })
+    ecs_stubber.activate()
+    ec2 = boto3.client('ec2', region_name="eu-west-1")
+    ec2_stubber = Stubber(ec2)
+    ec2_stubber.add_response(
+        'describe_network_interfaces',
+        expected_params={"NetworkInterfaceIds": ["eni_1", "eni_3"]},
+        service_response={
+            "NetworkInterfaces": [{
+                "NetworkInterfaceId": "eni_3",
+            }, {
+                "NetworkInterfaceId": "eni_1",
+                "Association": {
+                    "PublicIp": "my_public_ip",
+                    "PublicDnsName": "my_public_dns_name",
+                },
+            }],
+        })
+    ec2_stubber.activate()
+
+    inst = containers.ContainerService(cluster="my_cluster", ecs=ecs, ec2=ec2)
+    tasks = inst.describe_tasks_with_network(
+        ["task_id1", "task_id2", "task_id3", "task_id4"])
+    self.assertEqual([task.network() for task in tasks], [
+        containers.Network(
+            public_ip="my_public_ip",
+            public_dns_name="my_public_dns_name",
+        ),
+        None,
+        None,
+        None,
+    ])
+    ec2_stubber.assert_no_pending_responses()
+
+  def test_describe_networks_not_found(self):
+    ec2 = boto3.client('ec2', region_name="eu-west-1")
+    stubber = Stubber(ec2)
+    stubber.add_client_error(
+        'describe_network_interfaces',
+        service_error_code="InvalidNetworkInterfaceID.NotFound",
+        expected_params={"NetworkInterfaceIds": ["eni_1", "eni_2"]})
+    stubber.add_response(
+        'describe_network_interfaces',
+        expected_params={"NetworkInterfaceIds": ["eni_1"]},
+        service_response={
+            "NetworkInterfaces": [{
+                "NetworkInterfaceId": "eni_1",
+                "Association": {
+                    "PublicIp": "my_public_ip",
+                    "PublicDnsName": "my_public_dns_name",
+                },
+            }],
+        })
+    stubber.add_client_error(
+        'describe_network_interfaces',
+        service_error_code="InvalidNetworkInterfaceID.NotFound",
+        expected_params={"NetworkInterfaceIds": ["eni_2"]})
+    stubber.add_client_error(
+        'describe_network_interfaces',
+        service_error_code="InvalidNetworkInterfaceID.NotFound",
+        expected_params={"NetworkInterfaceIds": ["eni_2"]})
+    stubber.activate()
+
+    inst = containers.ContainerService(cluster="my_cluster", ec2=ec2)
+    self.assertEqual(
+        inst.describe_networks(["eni_1", "eni_2"]), {
+            "eni_1":
+                containers.Network(
+                    public_ip="my_public_ip",
+                    public_dns_name="my_public_dns_name",
+                )
+        })
+    task = {
+        "attachments": [{
+            "details": [{
+                "name": "networkInterfaceId",
+                "value": "eni_2",
+            }]
+        }]
+    }
+    self.assertIsNone(containers.Task(task, ec2=ec2).network())
+    stubber.assert_no_pending_responses()
+
   def test_task_network(self):
     ec2 = boto3.client('ec2', region_name="eu-west-1")
     stubber = Stubber(ec2)
@@ -117,6 +279,25 @@ class ContainersTest(unittest.TestCase):
                          public_dns_name="my_public_dns_name",
                      ))
 
+  @mock.patch("time.time")
+  def test_count_stopped_tasks(self, time_time):
+    containers.clear_stopped_counts()
+    cont = mock.Mock()
+    cont.cluster = "my_cluster"
+    cont.count_tasks.return_value = 3
+    time_time.return_value = 100
+    self.assertEqual(containers.count_stopped_tasks(cont, "foo", ttl=10), 3)
+    cont.count_tasks.assert_called_once_with(
+        family="foo", desiredStatus="STOPPED")
+    cont.count_tasks.return_value = 4
+    time_time.return_value = 105
+    self.assertEqual(containers.count_stopped_tasks(cont, "foo", ttl=10), 3)
+    self.assertEqual(containers.count_stopped_tasks(cont, "bar", ttl=10), 4)
+    self.assertEqual(containers.count_stopped_tasks(cont, "foo"), 4)
+    time_time.return_value = 110
+    self.assertEqual(containers.count_stopped_tasks(cont, "foo", ttl=10), 4)
+    self.assertEqual(cont.count_tasks.call_count, 4)
+
 
 if __name__ == '__main__':
   unittest.main()
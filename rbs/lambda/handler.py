@@ -14,11 +14,15 @@
 """Entrypoint for the AWS Lambda handler."""
 import os
 import json
+import time
 import traceback
 import attr
 
 import api_util
 import actions
+import autoscaling
+import warm_pool
+import worker_pools
 
 
 def get_config_from_env():
@@ -46,8 +50,41 @@ def respond(err, res=None):
   }
 
 
+def is_scheduled_event(event):
+  """Whether an event comes from a CloudWatch Events schedule."""
+  return event.get("source") == "aws.events"
+
+
+def scheduled_handler(config):
+  """Runs the scheduled actions that are enabled.
+
+  The autoscaler does not run while the remote build system is idle, so that it
+  does not undo the idle shutdown.  When enabled, the autoscaler also keeps the
+  warm pool running.
+  """
+  ans = {}
+  idle_shutdown = actions.get_idle_shutdown_settings(config)["enabled"]
+  autoscale = autoscaling.get_settings(config)["enabled"]
+  pool = warm_pool.get_settings(config) is not None
+  if not idle_shutdown and not autoscale and not pool:
+    return ans
+  status = actions.do_status(config)
+  if idle_shutdown:
+    ans["idle_shutdown"] = actions.do_idle_shutdown(config, status)
+    if ans["idle_shutdown"]["idle_shutdown"]["idle"]:
+      return ans
+  if autoscale:
+    ans["autoscale"] = actions.do_autoscale(config, status)
+  elif pool:
+    ans["warm_pool"] = actions.do_warm_pool(config, status)
+  return ans
+
+
 def handler(event, config=None):
   """Actual handling."""
+  started = time.time()
+  if is_scheduled_event(event):
+    return scheduled_handler(config)
   if event["httpMethod"] != "GET":
     raise api_util.InvalidArgumentException("invalid HTTP method")
   params = api_util.Params(event.get("queryStringParameters", dict()))
@@ -61,10 +98,30 @@ def handler(event, config=None):
         config,
         status,
         worker_count=params.get_positive_int("up", 2),
-        force_update=params.get_bool("force_update", False))
+        force_update=params.get_bool("force_update", False),
+        pools=params.get_counts("pools",
+                                worker_pools.get_pool_names(config)))
+  elif action == "wait":
+    return actions.do_wait(
+        config,
+        status,
+        worker_count=params.get_positive_int("up", 2),
+        timeout=params.get_positive_int("timeout", actions.WAIT_MAX_TIMEOUT),
+        started=started,
+        pools=params.get_counts("pools", worker_pools.get_pool_names(config)))
   elif action == "down":
     return actions.do_down(
         config, status, worker_count=params.get_positive_int("to"))
+  elif action == "autoscale":
+    if not autoscaling.get_settings(config)["enabled"]:
+      raise api_util.InvalidArgumentException("autoscaling is not enabled")
+    return actions.do_autoscale(
+        config,
+        status,
+        queued=params.get_positive_int("queued", optional=True))
+  elif action == "idle_shutdown":
+    return actions.do_idle_shutdown(
+        config, status, dry_run=params.get_bool("dry_run", True))
   else:
     raise AssertionError("unexpected action %s" % action)
 
@@ -68,7 +68,33 @@ class HandlerTest(unittest.TestCase):
     actions_do_connect.assert_called_once_with(
         {
             "some": "config"
-        }, _EXAMPLE_STATUS, worker_count=10, force_update=True)
+        }, _EXAMPLE_STATUS, worker_count=10, force_update=True, pools={})
+
+  @mock.patch("time.time", return_value=1000)
+  @mock.patch("actions.do_wait", return_value={"foo": "bar"})
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_wait(self, _actions_do_status, actions_do_wait, _time_time):
+    event = {
+        "httpMethod": "GET",
+        "pathParameters": {
+            "action": "wait",
+        },
+        "queryStringParameters": {
+            "up": "10",
+            "timeout": "15",
+        },
+    }
+    resp = handler.handler(event, config={"some": "config"})
+    self.assertEqual(resp, {"foo": "bar"})
+    actions_do_wait.assert_called_once_with(
+        {
+            "some": "config"
+        },
+        _EXAMPLE_STATUS,
+        worker_count=10,
+        timeout=15,
+        started=1000,
+        pools={})
 
   @mock.patch("actions.do_down", return_value={"foo": "bar"})
   @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
@@ -89,6 +115,98 @@ class HandlerTest(unittest.TestCase):
             "some": "config"
         }, _EXAMPLE_STATUS, worker_count=10)
 
+  @mock.patch("actions.do_autoscale", return_value={"foo": "bar"})
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_autoscale(self, _actions_do_status, actions_do_autoscale):
+    event = {
+        "httpMethod": "GET",
+        "pathParameters": {
+            "action": "autoscale",
+        },
+        "queryStringParameters": {
+            "queued": "7",
+        },
+    }
+    with self.assertRaises(api_util.InvalidArgumentException):
+      handler.handler(event, config={"some": "config"})
+    actions_do_autoscale.assert_not_called()
+
+    config = {"autoscaling": {"enabled": True}}
+    resp = handler.handler(event, config=config)
+    self.assertEqual(resp, {"foo": "bar"})
+    actions_do_autoscale.assert_called_once_with(
+        config, _EXAMPLE_STATUS, queued=7)
+
+  @mock.patch("actions.do_autoscale", return_value={"foo": "bar"})
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_scheduled(self, actions_do_status, actions_do_autoscale):
+    event = {
+        "source": "aws.events",
+        "detail-type": "Scheduled Event",
+    }
+    self.assertEqual(handler.handler(event, config={"some": "config"}), {})
+    actions_do_status.assert_not_called()
+
+    config = {"autoscaling": {"enabled": True}}
+    resp = handler.handler(event, config=config)
+    self.assertEqual(resp, {"autoscale": {"foo": "bar"}})
+    actions_do_autoscale.assert_called_once_with(config, _EXAMPLE_STATUS)
+
+  @mock.patch("actions.do_autoscale", return_value={"foo": "bar"})
+  @mock.patch("actions.do_idle_shutdown")
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_scheduled_idle_shutdown(self, _actions_do_status,
+                                   actions_do_idle_shutdown,
+                                   actions_do_autoscale):
+    event = {
+        "source": "aws.events",
+        "detail-type": "Scheduled Event",
+    }
+    config = {
+        "autoscaling": {
+            "enabled": True
+        },
+        "idle_shutdown": {
+            "enabled": True
+        },
+    }
+    actions_do_idle_shutdown.return_value = {"idle_shutdown": {"idle": True}}
+    resp = handler.handler(event, config=config)
+    self.assertEqual(resp, {"idle_shutdown": {"idle_shutdown": {"idle": True}}})
+    actions_do_autoscale.assert_not_called()
+
+    actions_do_idle_shutdown.return_value = {"idle_shutdown": {"idle": False}}
+    resp = handler.handler(event, config=config)
+    self.assertEqual(resp["autoscale"], {"foo": "bar"})
+
+  @mock.patch("actions.do_warm_pool", return_value={"foo": "bar"})
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_scheduled_warm_pool(self, _actions_do_status, actions_do_warm_pool):
+    event = {
+        "source": "aws.events",
+        "detail-type": "Scheduled Event",
+    }
+    config = {"warm_pool": {"min_workers": 2}}
+    resp = handler.handler(event, config=config)
+    self.assertEqual(resp, {"warm_pool": {"foo": "bar"}})
+    actions_do_warm_pool.assert_called_once_with(config, _EXAMPLE_STATUS)
+
+  @mock.patch("actions.do_idle_shutdown", return_value={"foo": "bar"})
+  @mock.patch("actions.do_status", return_value=_EXAMPLE_STATUS)
+  def test_idle_shutdown(self, _actions_do_status, actions_do_idle_shutdown):
+    event = {
+        "httpMethod": "GET",
+        "pathParameters": {
+            "action": "idle_shutdown",
+        },
+    }
+    resp = handler.handler(event, config={"some": "config"})
+    self.assertEqual(resp, {"foo": "bar"})
+    actions_do_idle_shutdown.assert_called_once_with(
+        {
+            "some": "config"
+        }, _EXAMPLE_STATUS, dry_run=True)
+
   def test_http_success(self):
     with mock.patch("handler.handler", return_value={"some": "response"}) as m:
       resp = handler.lambda_handler({"some": "event"}, None, {"some": "config"})
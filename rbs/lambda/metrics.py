@@ -0,0 +1,45 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Load of the remote build system, from the CloudWatch metrics of ECS.
+
+Unlike the `/connect` requests, which `bazel_bf` skips when it uses its status
+cache, the CPU utilization of the build workers reflects the builds actually
+running on them.
+"""
+import datetime
+
+# Period, in seconds, of the datapoints.
+PERIOD = 60
+
+
+def get_cpu_utilization(cloudwatch, cluster, service_name, window, now):
+  """Returns the average CPU utilization, in percent, of an ECS service over
+  the last `window` seconds, or `None` if there is no datapoint."""
+  datapoints = cloudwatch.get_metric_statistics(
+      Namespace="AWS/ECS",
+      MetricName="CPUUtilization",
+      Dimensions=[{
+          "Name": "ClusterName",
+          "Value": cluster
+      }, {
+          "Name": "ServiceName",
+          "Value": service_name
+      }],
+      StartTime=datetime.datetime.utcfromtimestamp(now - window),
+      EndTime=datetime.datetime.utcfromtimestamp(now),
+      Period=PERIOD,
+      Statistics=["Average"])["Datapoints"]
+  if not datapoints:
+    return None
+  return sum(point["Average"] for point in datapoints) / len(datapoints)
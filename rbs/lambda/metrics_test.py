@@ -0,0 +1,70 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+  def test_get_cpu_utilization(self):
+    cloudwatch = boto3.client("cloudwatch", region_name="eu-west-1")
+    stubber = Stubber(cloudwatch)
+    expected_params = {
+        "Namespace": "AWS/ECS",
+        "MetricName": "CPUUtilization",
+        "Dimensions": [{
+            "Name": "ClusterName",
+            "Value": "my_cluster"
+        }, {
+            "Name": "ServiceName",
+            "Value": "my_service"
+        }],
+        "StartTime": datetime.datetime(2018, 1, 1, 9, 50),
+        "EndTime": datetime.datetime(2018, 1, 1, 10, 0),
+        "Period": 60,
+        "Statistics": ["Average"],
+    }
+    stubber.add_response(
+        "get_metric_statistics",
+        service_response={
+            "Datapoints": [{
+                "Average": 20.0
+            }, {
+                "Average": 40.0
+            }]
+        },
+        expected_params=expected_params)
+    stubber.add_response(
+        "get_metric_statistics",
+        service_response={"Datapoints": []},
+        expected_params=expected_params)
+    stubber.activate()
+
+    now = 1514800800
+    self.assertEqual(
+        metrics.get_cpu_utilization(
+            cloudwatch, "my_cluster", "my_service", window=600, now=now), 30.0)
+    self.assertIsNone(
+        metrics.get_cpu_utilization(
+            cloudwatch, "my_cluster", "my_service", window=600, now=now))
+    stubber.assert_no_pending_responses()
+
+
+if __name__ == '__main__':
+  unittest.main()
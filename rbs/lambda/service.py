@@ -13,8 +13,16 @@
 # limitations under the License.
 """Ensures a given service level for an AWS CloudFormation stack that describes an
 Elastic Container Service (ECS) task."""
+import hashlib
+
 from botocore.exceptions import ClientError
 
+# Stack tag holding the digest of the template body and parameters of the last
+# update.
+DIGEST_TAG = "bazel_bf:digest"
+# Value returned by CloudFormation for the parameters declared with `NoEcho`.
+NO_ECHO_VALUE = "****"
+
 
 def describe_stack(cfn, stack_name):
   """Returns a description of an ECS stack, or `None` if the stack cannot be found."""
@@ -69,6 +77,83 @@ def get_stack_args(stack_name, template_body, desired_count, parameters):
   }
 
 
+def get_digest(template_body, parameters):
+  """Returns a digest of a template body and parameters (the desired count aside)."""
+  sha256 = hashlib.sha256()
+  sha256.update(template_body)
+  for key in sorted(parameters):
+    sha256.update("\0%s=%s" % (key, parameters[key]))
+  return sha256.hexdigest()
+
+
+def get_changed_parameters(desc, desired_count, parameters):
+  """Returns the keys of the parameters whose desired value differs from the value
+  found in the stack description.
+
+  The parameters declared with `NoEcho` cannot be compared and are skipped.
+  """
+  current = {}
+  for parameter in desc.get("Parameters", []):
+    current[parameter["ParameterKey"]] = parameter.get("ParameterValue")
+  changed = []
+  for parameter in get_stack_args("", "", desired_count,
+                                  parameters)["Parameters"]:
+    key = parameter["ParameterKey"]
+    if current.get(key) not in (parameter["ParameterValue"], NO_ECHO_VALUE):
+      changed.append(key)
+  return changed
+
+
+def has_same_definition(desc, template_body, parameters):
+  """Whether a stack already conforms to a template body and parameters, whatever
+  its desired count."""
+  tags = {}
+  for tag in desc.get("Tags", []):
+    tags[tag["Key"]] = tag["Value"]
+  changed = [
+      key for key in get_changed_parameters(desc, None, parameters)
+      if key != "InstanceDesiredCount"
+  ]
+  return (not changed and
+          tags.get(DIGEST_TAG) == get_digest(template_body, parameters))
+
+
+def is_up_to_date(desc, template_body, desired_count, parameters):
+  """Whether a stack already conforms to a template body, desired count and
+  parameters, so that updating it would be a no-op."""
+  return (has_same_definition(desc, template_body, parameters) and
+          not get_changed_parameters(desc, desired_count, parameters))
+
+
+class EcsScaler(object):
+  """Scales the ECS service of a stack directly, bypassing CloudFormation.
+
+  This only changes the desired count of the service: CloudFormation is still used
+  when the template body or the other parameters change.
+  """
+
+  def __init__(self, ecs, cluster, service_name):
+    self.ecs = ecs
+    self.cluster = cluster
+    self.service_name = service_name
+
+  def get_counts(self):
+    """Returns the desired and running counts of the service, or `None` if the
+    service cannot be found."""
+    services = self.ecs.describe_services(
+        cluster=self.cluster, services=[self.service_name])["services"]
+    if not services or services[0]["status"] != "ACTIVE":
+      return None
+    return (services[0]["desiredCount"], services[0]["runningCount"])
+
+  def scale(self, desired_count):
+    """Sets the desired count of the service."""
+    self.ecs.update_service(
+        cluster=self.cluster,
+        service=self.service_name,
+        desiredCount=desired_count)
+
+
 class Response(object):  # pylint: disable=too-few-public-methods
   """Response to a call to `ensure`."""
   UpToDate = 'Response.UpToDate'  # The service is up-to-date
@@ -76,6 +161,7 @@ class Response(object):  # pylint: disable=too-few-public-methods
   # so we cannot touch it
   Creating = 'Response.Creating'  # The service is being created
   Updating = 'Response.Updating'  # The service is being updated
+  Scaling = 'Response.Scaling'  # The service is being scaled, bypassing CloudFormation
   WaitingForPrecondition = 'Response.WaitingForPrecondition'
 
 
@@ -87,24 +173,48 @@ def ensure(cfn,
            current_count,
            lower_count=-1,
            upper_count=-1,
-           force_update=False):
-  """Ensures a given level of service for a CloudFormation stack that describes an ECS task."""
+           force_update=False,
+           scaler=None):
+  """Ensures a given level of service for a CloudFormation stack that describes an ECS task.
+
+  If an `EcsScaler` is given and only the desired count changes, the ECS service is
+  scaled directly instead of updating the stack.  The desired count is then compared
+  with that of the ECS service itself rather than with the stack parameter, which
+  direct scaling leaves behind: this reconciles the drift after the next stack
+  update.  The service is only up-to-date once all its desired tasks are running.
+  """
   desired_count = get_desired_count(current_count, lower_count, upper_count)
   if not force_update and desired_count == current_count:
     return Response.UpToDate
   desc = describe_stack(cfn, stack_name)
   state = get_state(desc)
+  stack_args = get_stack_args(stack_name, template_body, desired_count,
+                              parameters)
+  stack_args["Tags"] = [{
+      "Key": DIGEST_TAG,
+      "Value": get_digest(template_body, parameters),
+  }]
   if state == State.Missing:
     assert current_count == 0
-    cfn.create_stack(
-        **get_stack_args(stack_name, template_body, desired_count, parameters))
+    cfn.create_stack(**stack_args)
     return Response.Creating
   elif state == State.Updating:
     return Response.AlreadyUpdating
   elif state == State.Stable:
+    if scaler and has_same_definition(desc, template_body, parameters):
+      service_counts = scaler.get_counts()
+      if service_counts is not None:
+        (service_desired_count, service_running_count) = service_counts
+        if service_desired_count != desired_count:
+          scaler.scale(desired_count)
+          return Response.Scaling
+        if service_running_count < desired_count:
+          return Response.Scaling
+        return Response.UpToDate
+    if is_up_to_date(desc, template_body, desired_count, parameters):
+      return Response.UpToDate
     try:
-      cfn.update_stack(**get_stack_args(stack_name, template_body,
-                                        desired_count, parameters))
+      cfn.update_stack(**stack_args)
     except ClientError as e:
       if "No updates are to be performed." in e.response["Error"]["Message"]:
         return Response.UpToDate
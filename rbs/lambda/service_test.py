@@ -17,23 +17,49 @@ import unittest
 
 from botocore.stub import Stubber
 import boto3
+import mock
 
 import service
 
 
-def _add_describe_stacks_response(stubber, StackStatus):
+def _add_describe_stacks_response(stubber, StackStatus, **kwargs):
+  stack = {
+      "StackStatus": StackStatus,
+      "CreationTime": datetime.datetime.today(),
+      "StackName": "my_stack_name",
+  }
+  stack.update(kwargs)
   stubber.add_response(
       'describe_stacks',
-      service_response={
-          "Stacks": [{
-              "StackStatus": StackStatus,
-              "CreationTime": datetime.datetime.today(),
-              "StackName": "my_stack_name",
-          }]
-      },
+      service_response={"Stacks": [stack]},
       expected_params={"StackName": "my_stack_name"})
 
 
+def _add_up_to_date_describe_stacks_response(stubber, desired_count, secret):
+  _add_describe_stacks_response(
+      stubber,
+      StackStatus="UPDATE_COMPLETE",
+      Parameters=[{
+          "ParameterKey": "InstanceDesiredCount",
+          "ParameterValue": str(desired_count),
+      }, {
+          "ParameterKey": "Image",
+          "ParameterValue": "my_image",
+      }, {
+          "ParameterKey": "Secret",
+          "ParameterValue": "****",
+      }],
+      Tags=[{
+          "Key":
+              service.DIGEST_TAG,
+          "Value":
+              service.get_digest("my_template_body", {
+                  "Image": "my_image",
+                  "Secret": secret,
+              }),
+      }])
+
+
 class ServiceTest(unittest.TestCase):
 
   def test_get_stack_args(self):
@@ -126,6 +152,137 @@ class ServiceTest(unittest.TestCase):
     self.assertEqual(resp, service.Response.UpToDate)
     stubber.assert_no_pending_responses()
 
+  def test_no_op_update_is_skipped(self):
+    cfn = boto3.client('cloudformation', region_name="eu-west-1")
+    stubber = Stubber(cfn)
+    _add_up_to_date_describe_stacks_response(
+        stubber, desired_count=10, secret="my_secret")
+    stubber.activate()
+
+    resp = service.ensure(
+        cfn=cfn,
+        stack_name="my_stack_name",
+        template_body="my_template_body",
+        parameters={
+            "Image": "my_image",
+            "Secret": "my_secret"
+        },
+        current_count=5,
+        lower_count=10,
+        force_update=True)
+    self.assertEqual(resp, service.Response.UpToDate)
+    stubber.assert_no_pending_responses()
+
+  def test_changed_parameters(self):
+    for (desired_count, secret) in [(5, "my_secret"), (10, "other_secret")]:
+      cfn = boto3.client('cloudformation', region_name="eu-west-1")
+      stubber = Stubber(cfn)
+      _add_up_to_date_describe_stacks_response(
+          stubber, desired_count=desired_count, secret=secret)
+      stubber.add_response('update_stack', service_response={})
+      stubber.activate()
+
+      resp = service.ensure(
+          cfn=cfn,
+          stack_name="my_stack_name",
+          template_body="my_template_body",
+          parameters={
+              "Image": "my_image",
+              "Secret": "my_secret"
+          },
+          current_count=5,
+          lower_count=10)
+      self.assertEqual(resp, service.Response.Updating)
+      stubber.assert_no_pending_responses()
+
+  def test_fast_scaling(self):
+    for (service_counts, expected_resp, expected_scale) in [
+        ((5, 5), service.Response.Scaling, True),
+        ((10, 7), service.Response.Scaling, False),
+        ((10, 10), service.Response.UpToDate, False),
+    ]:
+      cfn = boto3.client('cloudformation', region_name="eu-west-1")
+      stubber = Stubber(cfn)
+      _add_up_to_date_describe_stacks_response(
+          stubber, desired_count=5, secret="my_secret")
+      stubber.activate()
+      scaler = mock.Mock()
+      scaler.get_counts.return_value = service_counts
+
+      resp = service.ensure(
+          cfn=cfn,
+          stack_name="my_stack_name",
+          template_body="my_template_body",
+          parameters={
+              "Image": "my_image",
+              "Secret": "my_secret"
+          },
+          current_count=5,
+          lower_count=10,
+          scaler=scaler)
+      self.assertEqual(resp, expected_resp)
+      if expected_scale:
+        scaler.scale.assert_called_once_with(10)
+      else:
+        scaler.scale.assert_not_called()
+      stubber.assert_no_pending_responses()
+
+  def test_fast_scaling_with_changed_definition(self):
+    cfn = boto3.client('cloudformation', region_name="eu-west-1")
+    stubber = Stubber(cfn)
+    _add_up_to_date_describe_stacks_response(
+        stubber, desired_count=5, secret="other_secret")
+    stubber.add_response('update_stack', service_response={})
+    stubber.activate()
+    scaler = mock.Mock()
+
+    resp = service.ensure(
+        cfn=cfn,
+        stack_name="my_stack_name",
+        template_body="my_template_body",
+        parameters={
+            "Image": "my_image",
+            "Secret": "my_secret"
+        },
+        current_count=5,
+        lower_count=10,
+        scaler=scaler)
+    self.assertEqual(resp, service.Response.Updating)
+    scaler.scale.assert_not_called()
+    stubber.assert_no_pending_responses()
+
+  def test_ecs_scaler(self):
+    ecs = boto3.client('ecs', region_name="eu-west-1")
+    stubber = Stubber(ecs)
+    stubber.add_response(
+        'describe_services',
+        service_response={
+            "services": [{
+                "status": "ACTIVE",
+                "desiredCount": 3,
+                "runningCount": 2,
+            }],
+        },
+        expected_params={
+            "cluster": "my_cluster",
+            "services": ["my_service"],
+        })
+    stubber.add_response(
+        'update_service',
+        service_response={},
+        expected_params={
+            "cluster": "my_cluster",
+            "service": "my_service",
+            "desiredCount": 7,
+        })
+    stubber.activate()
+
+    scaler = service.EcsScaler(
+        ecs, cluster="my_cluster", service_name="my_service")
+    self.assertEqual(scaler.get_counts(), (3, 2))
+    scaler.scale(7)
+    stubber.assert_no_pending_responses()
+
 
 if __name__ == '__main__':
   unittest.main()
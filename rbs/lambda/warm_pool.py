@@ -0,0 +1,87 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pool of build workers kept running during working hours.
+
+Starting the build server and workers takes minutes.  With a warm pool, a
+baseline of `min_workers` workers (and the server) is kept running during the
+windows of the `schedule`, so that builds start immediately.  Outside of these
+windows, the pool is inactive, and the workers are stopped by the idle shutdown
+or the autoscaler, if enabled.
+
+The windows are given in local time, `utc_offset` hours from UTC, for instance:
+
+  warm_pool:
+    min_workers: 2
+    utc_offset: 1
+    schedule:
+      - days: [mon, tue, wed, thu, fri]
+        start: "08:00"
+        end: "19:00"
+"""
+import datetime
+import time
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def get_settings(config):
+  """Returns the warm pool settings of a configuration object, or `None` if there
+  is no warm pool."""
+  return config.get("warm_pool")
+
+
+def parse_time(value):
+  """Parses a time of the day ("HH:MM") into a number of minutes."""
+  (hours, minutes) = value.split(":")
+  return int(hours) * 60 + int(minutes)
+
+
+def is_active(settings, now=None):
+  """Whether the warm pool is active at a given time."""
+  if not settings or not settings.get("min_workers"):
+    return False
+  if "schedule" not in settings:
+    return True
+  local = (datetime.datetime.utcfromtimestamp(now or time.time()) +
+           datetime.timedelta(hours=settings.get("utc_offset", 0)))
+  day = DAYS[local.weekday()]
+  minutes = local.hour * 60 + local.minute
+  for window in settings["schedule"]:
+    if (day in window.get("days", DAYS) and
+        parse_time(window.get("start", "00:00")) <= minutes <
+        parse_time(window.get("end", "24:00"))):
+      return True
+  return False
+
+
+def get_baseline(config, now=None):
+  """Returns the number of workers the warm pool keeps running at a given time."""
+  settings = get_settings(config)
+  if not is_active(settings, now=now):
+    return 0
+  return settings["min_workers"]
+
+
+def get_state(config, running_workers, now=None):
+  """Returns the state of the warm pool, as reported in the status, or `None` if
+  there is no warm pool."""
+  settings = get_settings(config)
+  if not settings:
+    return None
+  active = is_active(settings, now=now)
+  return {
+      "active": active,
+      "min_workers": settings.get("min_workers", 0),
+      "ready": active and running_workers >= settings["min_workers"],
+  }
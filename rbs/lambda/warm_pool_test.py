@@ -0,0 +1,85 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import warm_pool
+
+# Monday 2018-01-01, 10:00 UTC.
+_MONDAY_10AM = 1514800800
+_HOUR = 3600
+
+
+class WarmPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.config = {
+        "warm_pool": {
+            "min_workers": 2,
+            "utc_offset": -1,
+            "schedule": [{
+                "days": ["mon", "tue", "wed", "thu", "fri"],
+                "start": "08:00",
+                "end": "19:00",
+            }],
+        },
+    }
+
+  def test_parse_time(self):
+    self.assertEqual(warm_pool.parse_time("00:00"), 0)
+    self.assertEqual(warm_pool.parse_time("08:30"), 510)
+    self.assertEqual(warm_pool.parse_time("24:00"), 1440)
+
+  def test_is_active(self):
+    settings = self.config["warm_pool"]
+    self.assertFalse(warm_pool.is_active(None))
+    self.assertTrue(warm_pool.is_active({"min_workers": 1}))
+    self.assertFalse(warm_pool.is_active({"min_workers": 0}))
+    # 09:00 local time.
+    self.assertTrue(warm_pool.is_active(settings, now=_MONDAY_10AM))
+    # 07:59 local time.
+    self.assertFalse(
+        warm_pool.is_active(settings, now=_MONDAY_10AM - 61 * 60))
+    # 19:00 local time.
+    self.assertFalse(
+        warm_pool.is_active(settings, now=_MONDAY_10AM + 10 * _HOUR))
+    # Saturday.
+    self.assertFalse(
+        warm_pool.is_active(settings, now=_MONDAY_10AM + 5 * 24 * _HOUR))
+
+  def test_get_baseline(self):
+    self.assertEqual(warm_pool.get_baseline(self.config, now=_MONDAY_10AM), 2)
+    self.assertEqual(
+        warm_pool.get_baseline(self.config, now=_MONDAY_10AM + 10 * _HOUR), 0)
+    self.assertEqual(warm_pool.get_baseline({}), 0)
+
+  def test_get_state(self):
+    self.assertIsNone(warm_pool.get_state({}, running_workers=3))
+    self.assertEqual(
+        warm_pool.get_state(self.config, running_workers=1, now=_MONDAY_10AM),
+        {
+            "active": True,
+            "min_workers": 2,
+            "ready": False,
+        })
+    self.assertEqual(
+        warm_pool.get_state(self.config, running_workers=2, now=_MONDAY_10AM),
+        {
+            "active": True,
+            "min_workers": 2,
+            "ready": True,
+        })
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,154 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pools of build workers.
+
+The workers of a pool share the same size (CPU and memory of the Fargate task,
+number of actions executed concurrently) and platform properties.  Each pool
+has its own CloudFormation stack.
+
+The "default" pool is sized by the "workers" key of the configuration and uses
+the "workers" stack.  The additional pools, from the "worker_pools" key, use the
+"<workers stack>-<pool name>" stacks.  On top of their own platform properties,
+their workers advertise the `pool` platform property, so that actions can be
+routed to them with, for instance, the following Bazel platform:
+
+  platform(
+      name = "large",
+      parents = [...],
+      remote_execution_properties = \"\"\"
+          {PARENT_REMOTE_EXECUTION_PROPERTIES}
+          properties: {
+            name: "pool"
+            value: "large"
+          }
+      \"\"\",
+  )
+"""
+import os
+import re
+import string
+import argparse
+
+import attr
+
+DEFAULT_POOL = "default"
+# Default sizing of the workers (see `cfn/worker.yaml`).
+DEFAULT_SIZING = {
+    "cpu": 256,
+    "memory": 512,
+    "execute_stage_width": 1,
+}
+# Platform properties advertised by all the workers.
+DEFAULT_PLATFORM_PROPERTIES = {
+    "cpu": "k8",
+}
+
+
+# pylint: disable=too-few-public-methods
+@attr.s
+class WorkerPool(object):
+  """Pool of build workers."""
+  name = attr.ib()
+  stack_name = attr.ib()
+  cpu = attr.ib()
+  memory = attr.ib()
+  execute_stage_width = attr.ib()
+  platform_properties = attr.ib()
+
+  def family(self):
+    """Returns the ECS task family of the workers."""
+    return self.stack_name + "-BuildFarm-Worker"
+
+
+def _new_pool(name, stack_name, spec, platform_properties):
+  """Creates a pool from its specification in the configuration."""
+  sizing = dict(DEFAULT_SIZING)
+  sizing.update((key, spec[key]) for key in DEFAULT_SIZING if key in spec)
+  properties = dict(DEFAULT_PLATFORM_PROPERTIES)
+  properties.update(platform_properties)
+  properties.update(spec.get("platform_properties", {}))
+  return WorkerPool(
+      name=name,
+      stack_name=stack_name,
+      platform_properties=properties,
+      **sizing)
+
+
+def get_pools(config):
+  """Returns the worker pools of a configuration object, the default pool
+  first."""
+  pools = [
+      _new_pool(DEFAULT_POOL, config["stacks"]["workers"],
+                config.get("workers") or {}, {})
+  ]
+  for spec in config.get("worker_pools") or []:
+    pools.append(
+        _new_pool(spec["name"],
+                  config["stacks"]["workers"] + "-" + spec["name"], spec,
+                  {"pool": spec["name"]}))
+  return pools
+
+
+def get_pool_names(config):
+  """Returns the names of the pools other than the default one."""
+  return [spec["name"] for spec in config.get("worker_pools") or []]
+
+
+def get_pool(config, name=DEFAULT_POOL):
+  """Returns a worker pool by name, or `None` if there is no such pool."""
+  for pool in get_pools(config):
+    if pool.name == name:
+      return pool
+  return None
+
+
+def format_platform_properties(properties):
+  """Formats platform properties for the buildfarm configuration."""
+  return "\n".join('  properties: {\n    name: "%s"\n    value: "%s"\n  }' %
+                   (key, properties[key]) for key in sorted(properties))
+
+
+def render_config(template_body, pool, strip=True):
+  """Renders the buildfarm configuration of the workers of a pool.
+
+  With `strip`, the comments and blank lines are removed, so that the
+  configuration fits in a CloudFormation parameter.
+  """
+  body = string.Template(template_body).substitute(
+      execute_stage_width=pool.execute_stage_width,
+      platform_properties=format_platform_properties(pool.platform_properties))
+  if strip:
+    lines = [re.sub(r"\s*#.*$", "", line) for line in body.splitlines()]
+    body = "\n".join(line for line in lines if line.strip()) + "\n"
+  return body
+
+
+def main():
+  """Writes the buildfarm configuration of the default pool, for the default
+  configuration of the worker image."""
+  parser = argparse.ArgumentParser(
+      description="Render the buildfarm configuration of the workers.")
+  parser.add_argument("output", help="Path to the configuration.")
+  args = parser.parse_args()
+  path = os.path.join(
+      os.path.dirname(os.path.abspath(__file__)), "cfn", "worker.config")
+  with open(path) as f:
+    template_body = f.read()
+  pool = _new_pool(DEFAULT_POOL, "", {}, {})
+  with open(args.output, 'w') as f:
+    f.write(render_config(template_body, pool, strip=False))
+
+
+if __name__ == "__main__":
+  main()
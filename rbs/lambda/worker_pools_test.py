@@ -0,0 +1,111 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import worker_pools
+
+
+class WorkerPoolsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.config = {
+        "stacks": {
+            "workers": "workers_stack",
+        },
+        "workers": {
+            "cpu": 1024,
+            "memory": 2048,
+        },
+        "worker_pools": [{
+            "name": "large",
+            "cpu": 4096,
+            "memory": 16384,
+            "execute_stage_width": 4,
+            "platform_properties": {
+                "os": "linux"
+            },
+        }],
+    }
+
+  def test_get_pools(self):
+    self.assertEqual(
+        worker_pools.get_pools(self.config), [
+            worker_pools.WorkerPool(
+                name="default",
+                stack_name="workers_stack",
+                cpu=1024,
+                memory=2048,
+                execute_stage_width=1,
+                platform_properties={"cpu": "k8"}),
+            worker_pools.WorkerPool(
+                name="large",
+                stack_name="workers_stack-large",
+                cpu=4096,
+                memory=16384,
+                execute_stage_width=4,
+                platform_properties={
+                    "cpu": "k8",
+                    "os": "linux",
+                    "pool": "large"
+                }),
+        ])
+    self.assertEqual(
+        worker_pools.get_pools({
+            "stacks": {
+                "workers": "workers_stack"
+            }
+        })[0].cpu, 256)
+
+  def test_get_pool(self):
+    self.assertEqual(
+        worker_pools.get_pool(self.config, "large").family(),
+        "workers_stack-large-BuildFarm-Worker")
+    self.assertEqual(worker_pools.get_pool(self.config).name, "default")
+    self.assertIsNone(worker_pools.get_pool(self.config, "unknown"))
+    self.assertEqual(worker_pools.get_pool_names(self.config), ["large"])
+
+  def test_render_config(self):
+    template_body = """# comment
+execute_stage_width: ${execute_stage_width}  # trailing comment
+
+platform: {
+${platform_properties}
+}
+"""
+    pool = worker_pools.get_pool(self.config, "large")
+    self.assertEqual(
+        worker_pools.render_config(template_body, pool), """\
+execute_stage_width: 4
+platform: {
+  properties: {
+    name: "cpu"
+    value: "k8"
+  }
+  properties: {
+    name: "os"
+    value: "linux"
+  }
+  properties: {
+    name: "pool"
+    value: "large"
+  }
+}
+""")
+    self.assertTrue(
+        worker_pools.render_config(template_body, pool,
+                                   strip=False).startswith("# comment\n"))
+
+
+if __name__ == '__main__':
+  unittest.main()
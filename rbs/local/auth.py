@@ -14,9 +14,24 @@
 """Deals with authentication with the remote execution server."""
 import subprocess
 import os
-import random
+import json
+import time
+import fcntl
+import select
+import socket
+import hashlib
 
 import rbs.common.runfiles as runfiles
+import status_cache
+
+# Address the proxy listens to: the port is assigned by the OS.
+LISTEN = "localhost:0"
+# Timeout, in seconds, for the commands sent to the control socket of a daemon.
+CONTROL_TIMEOUT = 2
+# Maximum time, in seconds, to wait for the proxy to listen.
+READY_TIMEOUT = 10
+# What the proxy prints on stdout once it listens, followed by the address.
+READY_LINE = "listening on "
 
 
 def auth_proxy_bin():
@@ -37,40 +52,199 @@ def auth_proxy_bin():
     return os.path.join(test_srcdir, proxy_bin_runfile)
 
 
+def daemon_dir():
+  """Returns the directory in which the state of the auth_proxy daemon is kept."""
+  return os.getenv(
+      "AUTH_PROXY_DIR", default=os.path.expanduser("~/.bazel_bf"))
+
+
+def auth_info_digest(auth_info, backend):
+  """Digest of the backend and of the content of the certificates, to decide
+  whether a running daemon can be reused."""
+  h = hashlib.sha256()
+  h.update(backend + "\n")
+  for item in sorted(auth_info):
+    with open(auth_info[item], 'r') as f:
+      h.update("%s %s\n" % (item, hashlib.sha256(f.read()).hexdigest()))
+  return h.hexdigest()
+
+
+def control(command, path=None, timeout=CONTROL_TIMEOUT):
+  """Sends a command to the control socket of the auth_proxy daemon.
+
+  Returns the answer, or `None` if the daemon cannot be reached.
+  """
+  path = path or os.path.join(daemon_dir(), "auth_proxy.sock")
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.settimeout(timeout)
+  try:
+    sock.connect(path)
+    sock.sendall(command + "\n")
+    answer = ""
+    while not answer.endswith("\n"):
+      chunk = sock.recv(1024)
+      if not chunk:
+        break
+      answer += chunk
+    return answer.strip()
+  except socket.error:
+    return None
+  finally:
+    sock.close()
+
+
+def wait_ready(process, timeout=READY_TIMEOUT, log_path=None):
+  """Waits for a proxy process to listen, and returns the address it listens to.
+
+  Raises an exception if the proxy exits or does not listen in time.
+  """
+  start = time.time()
+  deadline = start + timeout
+  fd = process.stdout.fileno()
+  output = ""
+  while "\n" not in output:
+    remaining = deadline - time.time()
+    if remaining <= 0:
+      process.kill()
+      raise Exception("auth_proxy did not listen within %ds" % timeout)
+    (readable, _, _) = select.select([fd], [], [], remaining)
+    if readable:
+      chunk = os.read(fd, 1024)
+      if not chunk:
+        break
+      output += chunk
+  process.stdout.close()
+
+  line = output.split("\n")[0]
+  if not line.startswith(READY_LINE):
+    process.wait()
+    raise Exception("auth_proxy exited with code %d before listening%s" %
+                    (process.returncode,
+                     " (see %s)" % log_path if log_path else ""))
+  print "Auth proxy: listening after %.2fs" % (time.time() - start)
+  return line[len(READY_LINE):].strip()
+
+
+def read_pidfile(path=None):
+  """Reads the state of the auth_proxy daemon, or returns `None`."""
+  path = path or os.path.join(daemon_dir(), "auth_proxy.pid")
+  try:
+    with open(path, 'r') as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return None
+
+
+def write_pidfile(state, path=None):
+  """Writes the state of the auth_proxy daemon."""
+  path = path or os.path.join(daemon_dir(), "auth_proxy.pid")
+  with open(path + ".tmp", 'w') as f:
+    json.dump(state, f, sort_keys=True)
+  os.rename(path + ".tmp", path)
+
+
 # pylint: disable=too-few-public-methods
 class AuthProxy(object):
-  """Proxies the remote executor endpoint to add authentication."""
+  """Proxies the remote executor endpoint to add authentication.
 
-  def __init__(self, auth_info, backend, verbose=False):
+  With a positive `idle_timeout`, in seconds, the proxy is a daemon that is
+  shared by subsequent invocations with the same backend and certificates, so
+  that the connection to the backend stays warm.  The daemon shuts down after
+  being idle for `idle_timeout`.  Otherwise, the proxy is stopped on exit.
+  """
+
+  def __init__(self,
+               auth_info,
+               backend,
+               verbose=False,
+               idle_timeout=0,
+               ready_timeout=READY_TIMEOUT):
     self.auth_proxy_bin = auth_proxy_bin()
     self.auth_info = auth_info
     self.backend = backend
     self.verbose = verbose
+    self.idle_timeout = idle_timeout
+    self.ready_timeout = ready_timeout
     self.process = None
 
     if not self.auth_info:
       raise Exception("expected an auth_info when using AuthProxy")
 
-  def __enter__(self):
-    # NOTE: This does not account for when there is a port clash.
-    listen = "localhost:%d" % random.randint(50000, 60000)
+  def _cmd(self):
     cmd = [
-        auth_proxy_bin(),
+        self.auth_proxy_bin,
         "-crt=" + self.auth_info["tls_client_certificate"],
         "-key=" + self.auth_info["tls_client_key"],
         "-ca=" + self.auth_info["tls_certificate"],
         "-backend=" + self.backend,
-        "-listen=" + listen,
+        "-listen=" + LISTEN,
     ]
     if self.verbose:
       cmd.append("-verbose")
+    return cmd
+
+  def _start(self, cmd, log_path=None, **kwargs):
+    """Starts the proxy and returns `(process, listen)`, where `listen` is the
+    address the proxy listens to, once it listens."""
     try:
-      self.process = subprocess.Popen(cmd)
+      process = subprocess.Popen(cmd, stdout=subprocess.PIPE, **kwargs)
     except OSError as e:
       if e.errno == 2:  # No such file or directory
         raise Exception("%s: %s" % (e, cmd[0]))
+      raise
+    return (process,
+            wait_ready(
+                process, timeout=self.ready_timeout, log_path=log_path))
+
+  def _ensure_daemon(self):
+    """Reuses the running daemon if it matches, else starts a new one."""
+    digest = auth_info_digest(self.auth_info, self.backend)
+    control_path = os.path.join(daemon_dir(), "auth_proxy.sock")
+    state = read_pidfile()
+    if state:
+      answer = control("ping", path=control_path)
+      if answer and answer.startswith("ok "):
+        if (state["digest"] == digest and
+            status_cache.is_reachable(state["listen"])):
+          print "Auth proxy: reusing %s (pid %d)" % (state["listen"],
+                                                      state["pid"])
+          return state["listen"]
+        control("stop", path=control_path)
+
+    log_path = os.path.join(daemon_dir(), "auth_proxy.log")
+    with open(os.devnull, 'r') as devnull, open(log_path, 'a') as log:
+      (process, listen) = self._start(
+          self._cmd() + [
+              "-control=" + control_path,
+              "-idle_timeout=%ds" % self.idle_timeout,
+          ],
+          log_path=log_path,
+          stdin=devnull,
+          stderr=log,
+          close_fds=True,
+          # Not in the process group of bazel_bf, so as to survive it.
+          preexec_fn=os.setsid)
+    write_pidfile({
+        "pid": process.pid,
+        "listen": listen,
+        "backend": self.backend,
+        "digest": digest,
+    })
+    print "Auth proxy: started %s (pid %d)" % (listen, process.pid)
     return listen
 
+  def __enter__(self):
+    if not self.idle_timeout:
+      (self.process, listen) = self._start(self._cmd())
+      return listen
+
+    if not os.path.isdir(daemon_dir()):
+      os.makedirs(daemon_dir())
+    # Concurrent invocations must not start several daemons.
+    with open(os.path.join(daemon_dir(), "auth_proxy.lock"), 'a') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      return self._ensure_daemon()
+
   def __exit__(self, *args):
     if self.process:
       self.process.terminate()
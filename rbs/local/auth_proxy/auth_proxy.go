@@ -16,6 +16,7 @@
 package main
 
 import (
+	"bufio"
 	"context"
 	"crypto/tls"
 	"crypto/x509"
@@ -25,6 +26,10 @@ import (
 	"io/ioutil"
 	"log"
 	"net"
+	"os"
+	"strings"
+	"sync"
+	"time"
 
 	"github.com/mwitkow/grpc-proxy/proxy"
 	"google.golang.org/grpc"
@@ -43,9 +48,112 @@ var (
 	ca      = flag.String("ca", "ca.key", "certificate authority")
 	verbose = flag.Bool("verbose", false, "verbosity")
 	backend = flag.String("backend", "localhost:8098", "backend address")
-	listen  = flag.String("listen", ":50051", "address to listen to")
+	listen  = flag.String("listen", ":50051", "address to listen to (use port 0 for an OS-assigned port)")
+	control = flag.String("control", "", "path to a Unix socket to control the proxy from (none if empty)")
+	idle    = flag.Duration("idle_timeout", 0, "shut down after being idle for this long (0 to disable)")
 )
 
+// activity tracks the calls going through the proxy, for idle shutdown.
+type activity struct {
+	mu         sync.Mutex
+	active     int
+	lastActive time.Time
+}
+
+func (a *activity) begin() {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+	a.active++
+	a.lastActive = time.Now()
+}
+
+func (a *activity) end() {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+	a.active--
+	a.lastActive = time.Now()
+}
+
+func (a *activity) touch() {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+	a.lastActive = time.Now()
+}
+
+func (a *activity) idleFor() time.Duration {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+	if a.active > 0 {
+		return 0
+	}
+	return time.Since(a.lastActive)
+}
+
+// watchIdle stops the server once it has been idle for longer than the idle timeout.
+func watchIdle(a *activity, server *grpc.Server) {
+	period := *idle / 10
+	if period > 10*time.Second {
+		period = 10 * time.Second
+	}
+	// time.Tick returns nil, which blocks forever, for a non-positive period.
+	if period < time.Second {
+		period = time.Second
+	}
+	for range time.Tick(period) {
+		if a.idleFor() > *idle {
+			if *verbose {
+				log.Printf("idle for more than %s: shutting down", *idle)
+			}
+			server.Stop()
+			return
+		}
+	}
+}
+
+// serveControl answers the commands sent on the control socket: "ping" returns the
+// address the proxy listens to and the backend address, "stop" shuts down the proxy.
+func serveControl(lis net.Listener, a *activity, server *grpc.Server) {
+	for {
+		conn, err := lis.Accept()
+		if err != nil {
+			return
+		}
+		go func(conn net.Conn) {
+			defer conn.Close()
+			conn.SetDeadline(time.Now().Add(5 * time.Second))
+			line, err := bufio.NewReader(conn).ReadString('\n')
+			if err != nil {
+				return
+			}
+			switch strings.TrimSpace(line) {
+			case "ping":
+				// A ping means that a build is about to use the proxy.
+				a.touch()
+				fmt.Fprintf(conn, "ok %s %s\n", *listen, *backend)
+			case "stop":
+				fmt.Fprintf(conn, "ok\n")
+				server.Stop()
+			default:
+				fmt.Fprintf(conn, "error unknown command\n")
+			}
+		}(conn)
+	}
+}
+
+// removeStaleControl removes the control socket left behind by a proxy that is
+// gone.  It fails if a proxy still answers on the socket.
+func removeStaleControl(path string) error {
+	conn, err := net.DialTimeout("unix", path, time.Second)
+	if err == nil {
+		conn.Close()
+		return errors.New("another proxy is listening to it")
+	}
+	if err := os.Remove(path); err != nil && !os.IsNotExist(err) {
+		return err
+	}
+	return nil
+}
+
 func loadCredentials() (credentials.TransportCredentials, error) {
 	// Load the client certificates from disk
 	certificate, err := tls.LoadX509KeyPair(*crt, *key)
@@ -81,12 +189,24 @@ func main() {
 	if err != nil {
 		log.Fatalf("failed to listen to %s: %v", *listen, err)
 	}
+	*listen = lis.Addr().String()
 
 	creds, err := loadCredentials()
 	if err != nil {
 		log.Fatalf("failed to load credentials: %v", err)
 	}
 
+	// All the calls share the same connection to the backend, so that it stays
+	// warm (no TLS handshake per call).
+	conn, err := grpc.Dial(
+		*backend,
+		grpc.WithTransportCredentials(creds),
+		grpc.WithCodec(proxy.Codec()))
+	if err != nil {
+		log.Fatalf("failed to dial %s: %v", *backend, err)
+	}
+	defer conn.Close()
+
 	director := func(ctx context.Context, fullMethodName string) (context.Context, *grpc.ClientConn, error) {
 		md, ok := metadata.FromIncomingContext(ctx)
 		if !ok {
@@ -100,21 +220,54 @@ func main() {
 		}
 		outCtx, _ := context.WithCancel(ctx)
 		outCtx = metadata.NewOutgoingContext(outCtx, md.Copy())
-		conn, err := grpc.DialContext(
-			ctx,
-			*backend,
-			grpc.WithTransportCredentials(creds),
-			grpc.WithCodec(proxy.Codec()))
-		return outCtx, conn, err
+		return outCtx, conn, nil
 	}
 
 	if *verbose {
 		log.Printf("proxy %s -> %s", *listen, *backend)
 	}
 
+	a := &activity{lastActive: time.Now()}
 	server := grpc.NewServer(
 		grpc.CustomCodec(proxy.Codec()),
-		grpc.UnknownServiceHandler(proxy.TransparentHandler(director)))
+		grpc.UnknownServiceHandler(proxy.TransparentHandler(director)),
+		grpc.StreamInterceptor(func(srv interface{}, ss grpc.ServerStream, info *grpc.StreamServerInfo, handler grpc.StreamHandler) error {
+			a.begin()
+			defer a.end()
+			return handler(srv, ss)
+		}))
+
+	if *control != "" {
+		if err := removeStaleControl(*control); err != nil {
+			log.Fatalf("failed to take over %s: %v", *control, err)
+		}
+		controlLis, err := net.Listen("unix", *control)
+		if err != nil {
+			log.Fatalf("failed to listen to %s: %v", *control, err)
+		}
+		// The socket is only removed on exit if it is still this one: a daemon
+		// replacing this one could already be listening to it.
+		controlLis.(*net.UnixListener).SetUnlinkOnClose(false)
+		socket, err := os.Stat(*control)
+		if err != nil {
+			log.Fatalf("failed to stat %s: %v", *control, err)
+		}
+		defer func() {
+			controlLis.Close()
+			if current, err := os.Stat(*control); err == nil && os.SameFile(current, socket) {
+				os.Remove(*control)
+			}
+		}()
+		go serveControl(controlLis, a, server)
+	}
+	if *idle > 0 {
+		go watchIdle(a, server)
+	}
+
+	// The address is printed once the proxy listens, so that callers can use
+	// an OS-assigned port.
+	fmt.Printf("listening on %s\n", *listen)
+
 	if err := server.Serve(lis); err != nil {
 		log.Fatalf("failed to serve: %v", err)
 	}
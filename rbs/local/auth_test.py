@@ -14,9 +14,48 @@
 
 import unittest
 import subprocess
+import tempfile
+import sys
+import os
+
+import mock
 
 import auth
 
+# Stands in for the auth_proxy binary: it listens, and answers the commands
+# sent to its control socket.
+FAKE_AUTH_PROXY = """#!{python}
+import socket
+import sys
+import os
+
+args = dict(arg[1:].split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+lis = socket.socket()
+lis.bind(("localhost", 0))
+lis.listen(1)
+listen = "localhost:%d" % lis.getsockname()[1]
+if "control" in args:
+  if os.path.exists(args["control"]):
+    os.remove(args["control"])
+  control = socket.socket(socket.AF_UNIX)
+  control.bind(args["control"])
+  control.listen(1)
+sys.stdout.write("listening on %s\\n" % listen)
+sys.stdout.flush()
+if "control" not in args:
+  lis.accept()
+  sys.exit(0)
+while True:
+  conn, _ = control.accept()
+  command = conn.recv(1024).strip()
+  if command == "ping":
+    conn.sendall("ok %s %s\\n" % (listen, args["backend"]))
+  elif command == "stop":
+    conn.sendall("ok\\n")
+    sys.exit(0)
+  conn.close()
+"""
+
 
 class AuthTest(unittest.TestCase):
 
@@ -28,5 +67,68 @@ class AuthTest(unittest.TestCase):
       self.fail("expected returncode to be '2'; got %d" % returncode)
 
 
+class AuthProxyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp(dir=os.getenv("TEST_TMPDIR"))
+    os.environ["AUTH_PROXY_DIR"] = self.tmpdir
+    proxy_bin = os.path.join(self.tmpdir, "auth_proxy")
+    with open(proxy_bin, 'w') as f:
+      f.write(FAKE_AUTH_PROXY.format(python=sys.executable))
+    os.chmod(proxy_bin, 0755)
+    patcher = mock.patch("auth.auth_proxy_bin", return_value=proxy_bin)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.addCleanup(auth.control, "stop")
+    self.auth_info = {}
+    for item in ["tls_certificate", "tls_client_certificate", "tls_client_key"]:
+      self.auth_info[item] = os.path.join(self.tmpdir, item)
+      with open(self.auth_info[item], 'w') as f:
+        f.write(item)
+
+  def test_auth_proxy(self):
+    proxy = auth.AuthProxy(auth_info=self.auth_info, backend="foo:1")
+    with proxy as listen:
+      self.assertRegexpMatches(listen, r"^localhost:\d+$")
+    proxy.process.wait()
+
+  def _replace_proxy_bin(self, content):
+    with open(auth.auth_proxy_bin(), 'w') as f:
+      f.write("#!%s\n%s" % (sys.executable, content))
+
+  def test_auth_proxy_exits_early(self):
+    self._replace_proxy_bin("import sys\nsys.exit(3)\n")
+    proxy = auth.AuthProxy(auth_info=self.auth_info, backend="foo:1")
+    with self.assertRaisesRegexp(Exception, "exited with code 3"):
+      proxy.__enter__()
+
+  def test_auth_proxy_not_ready(self):
+    self._replace_proxy_bin("import time\ntime.sleep(60)\n")
+    proxy = auth.AuthProxy(
+        auth_info=self.auth_info, backend="foo:1", ready_timeout=0.5)
+    with self.assertRaisesRegexp(Exception, "did not listen"):
+      proxy.__enter__()
+
+  def test_auth_proxy_daemon(self):
+    with auth.AuthProxy(
+        auth_info=self.auth_info, backend="foo:1", idle_timeout=60) as listen:
+      pid = auth.read_pidfile()["pid"]
+      self.assertEqual(auth.control("ping"), "ok %s foo:1" % listen)
+
+    # Reused.
+    with auth.AuthProxy(
+        auth_info=self.auth_info, backend="foo:1",
+        idle_timeout=60) as next_listen:
+      self.assertEqual(next_listen, listen)
+      self.assertEqual(auth.read_pidfile()["pid"], pid)
+
+    # Replaced, as the backend changed.
+    with auth.AuthProxy(
+        auth_info=self.auth_info, backend="foo:2",
+        idle_timeout=60) as next_listen:
+      self.assertNotEqual(auth.read_pidfile()["pid"], pid)
+      self.assertEqual(auth.control("ping"), "ok %s foo:2" % next_listen)
+
+
 if __name__ == '__main__':
   unittest.main()
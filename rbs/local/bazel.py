@@ -12,18 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Calls bazel with the appropriate options for remote and docker execution strategies."""
-import pprint
+import random
 import time
 import subprocess
 import tempfile
-import atexit
 import shutil
 import os
+import hashlib
 
 import attr
 
-import infra_api
 import auth
+import status_cache
 
 BAZEL_TOOLCHAINS_SNIPPET = """
 http_archive(
@@ -53,18 +53,145 @@ def check_workspace():
     )
 
 
-def remote_setup_loop(remote, up=None, force_update=False):
-  """Waits until the remote build system is up."""
+# Bounds, in seconds, of the delay between two polls of the remote build system.
+SETUP_MIN_DELAY = 1
+SETUP_MAX_DELAY = 30
+# How long, in seconds, a long-polling request blocks on the server side.
+SETUP_WAIT_TIMEOUT = 20
+
+
+def is_remote_ready(status):
+  """Whether the remote build system is ready, given the status returned by
+  `/connect`."""
+  return (status["remote_executor"] != "NULL" and
+          status["running_workers"] > 0 and
+          status["server_status"] == "Response.UpToDate" and
+          status["workers_status"] == "Response.UpToDate" and all(
+              pool_status == "Response.UpToDate" for pool_status in status.get(
+                  "worker_pools_status", {}).values()))
+
+
+def format_status(status):
+  """Formats the status returned by `/connect` on one line."""
+  return "Remote build system: executor %s (%s), %s running worker(s) (%s)" % (
+      status.get("remote_executor"), status.get("server_status"),
+      status.get("running_workers"), status.get("workers_status"))
+
+
+def remote_setup_loop(remote,
+                      up=None,
+                      force_update=False,
+                      timeout=None,
+                      long_poll=False,
+                      pools=None):
+  """Waits until the remote build system is up.
+
+  Between two calls to `/connect`, either the server is long-polled with `/wait`
+  (if `long_poll` is true and the server supports it), or the client sleeps with
+  an exponential backoff and jitter.  The client also backs off when `/connect`
+  is still not ready after `/wait` returned.  An exception is raised if the
+  remote build system is not up after `timeout` seconds.
+  """
+  deadline = None if timeout is None else time.time() + timeout
+  delay = SETUP_MIN_DELAY
+  waited = False
   while True:
-    response = remote.connect(up, force_update=force_update)
+    response = remote.connect(up, force_update=force_update, pools=pools)
     status = response["status"]
-    pprint.pprint(status)
-    if (status["remote_executor"] != "NULL" and
-        status["running_workers"] > 0 and
-        status["server_status"] == "Response.UpToDate" and
-        status["workers_status"] == "Response.UpToDate"):
+    print format_status(status)
+    if is_remote_ready(status):
       return (status, response.get("auth_info"))
-    time.sleep(5)
+
+    remaining = SETUP_WAIT_TIMEOUT if deadline is None else deadline - time.time()
+    if remaining <= 0:
+      raise Exception(
+          "the remote build system is still not up after %ss" % timeout)
+    if long_poll:
+      if waited:
+        # `/wait` returned, but `/connect` does not agree: never call them again
+        # in a tight loop.
+        time.sleep(min(remaining, random.uniform(delay / 2.0, delay)))
+        delay = min(delay * 2, SETUP_MAX_DELAY)
+      try:
+        remote.wait(
+            up,
+            timeout=int(max(1, min(remaining, SETUP_WAIT_TIMEOUT))),
+            pools=pools)
+        waited = True
+        continue
+      except Exception as e:  # pylint: disable=broad-except
+        print "Cannot long-poll the remote build system (%s): polling instead" % e
+        long_poll = False
+    time.sleep(min(remaining, random.uniform(delay / 2.0, delay)))
+    delay = min(delay * 2, SETUP_MAX_DELAY)
+
+
+# When to build the crosstool before the Bazel command:
+#   - "always": every time;
+#   - "once": once per workspace and crosstool, until the WORKSPACE file changes
+#     or the output base is cleaned;
+#   - "fold": as an additional target of "build" and "test" commands ("once" for
+#     the other commands);
+#   - "never".
+CROSSTOOL_PREFETCH_MODES = ["always", "once", "fold", "never"]
+# Commands the crosstool can be added as a target to.
+CROSSTOOL_FOLD_COMMANDS = ["build", "test"]
+
+
+def crosstool_marker_filename(crosstool_top, workspace_dir=None):
+  """Returns the name of the marker file recording that the crosstool has been
+  built in the workspace."""
+  workspace_dir = os.path.abspath(workspace_dir or os.getcwd())
+  key = hashlib.sha1(workspace_dir + "\n" + crosstool_top).hexdigest()
+  return os.path.join(
+      os.getenv(
+          "CROSSTOOL_MARKERS",
+          default=os.path.expanduser("~/.bazel_bf/crosstool_markers")), key)
+
+
+def workspace_digest(workspace_dir=None):
+  """Digest of the WORKSPACE file."""
+  with open(os.path.join(workspace_dir or os.getcwd(), "WORKSPACE"), 'r') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+
+def is_crosstool_built(crosstool_top, workspace_dir=None):
+  """Whether the crosstool has already been built in the workspace, with the
+  same WORKSPACE file, and the output base has not been cleaned since."""
+  # "bazel-out" dangles once the output base is cleaned.
+  if not os.path.exists(os.path.join(workspace_dir or os.getcwd(), "bazel-out")):
+    return False
+  try:
+    with open(crosstool_marker_filename(crosstool_top, workspace_dir),
+              'r') as f:
+      return f.read() == workspace_digest(workspace_dir)
+  except IOError:
+    return False
+
+
+def mark_crosstool_built(crosstool_top, workspace_dir=None):
+  """Records that the crosstool has been built in the workspace."""
+  path = crosstool_marker_filename(crosstool_top, workspace_dir)
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, 'w') as f:
+    f.write(workspace_digest(workspace_dir))
+
+
+def is_crosstool_folded(crosstool_prefetch, command):
+  """Whether the crosstool is built as part of the Bazel command itself."""
+  return (crosstool_prefetch == "fold" and
+          command in CROSSTOOL_FOLD_COMMANDS)
+
+
+def should_prefetch_crosstool(crosstool_prefetch, command, crosstool_top):
+  """Whether the crosstool must be built before the Bazel command."""
+  if crosstool_prefetch == "always":
+    return True
+  if crosstool_prefetch == "never" or is_crosstool_folded(
+      crosstool_prefetch, command):
+    return False
+  return not is_crosstool_built(crosstool_top)
 
 
 def local_bazel_options(worker_image, crosstool_top, privileged=False):
@@ -98,21 +225,116 @@ def remote_bazel_options(crosstool_top):
   ]
 
 
+# How many versions of the TLS material to keep in the TLS store.
+MAX_AUTH_INFOS = 3
+
+
+def tls_store_dir():
+  """Returns the directory in which the PEM files are stored."""
+  return os.getenv(
+      "TLS_STORE", default=os.path.expanduser("~/.bazel_bf/tls"))
+
+
+def auth_info_digest(auth_info):
+  """Digest of an `auth_info` given as PEM content."""
+  h = hashlib.sha256()
+  for item in sorted(auth_info):
+    h.update("%s %s\n" % (item, hashlib.sha256(auth_info[item]).hexdigest()))
+  return h.hexdigest()
+
+
 def filesystem_auth_info(auth_info):
-  """Takes the `auth_info` given as PEM content, write the PEM content to temporary
-  files, and returns an `auth_info` given as PEM files."""
-  auth_info_dir = tempfile.mkdtemp()
-  atexit.register(lambda: shutil.rmtree(auth_info_dir, ignore_errors=True))
-
-  ans = {}
-  for item in auth_info:
-    path = os.path.join(auth_info_dir, item)
-    ans[item] = path
-    with open(path, 'w') as f:
-      f.write(auth_info[item])
+  """Takes the `auth_info` given as PEM content, write the PEM content to files,
+  and returns an `auth_info` given as PEM files.
+
+  The files are content-addressed: they are written once (readable only by the
+  user) and are reused until the certificates change.  The least recently used
+  versions are then removed (see `gc_tls_store`).
+  """
+  auth_info_dir = os.path.join(tls_store_dir(), auth_info_digest(auth_info))
+  ans = {item: os.path.join(auth_info_dir, item) for item in auth_info}
+  if os.path.isdir(auth_info_dir):
+    # The modification time of the directories is used for LRU eviction.
+    os.utime(auth_info_dir, None)
+    return ans
+
+  if not os.path.isdir(tls_store_dir()):
+    os.makedirs(tls_store_dir(), 0700)
+  # The files are written in a temporary directory that is then renamed into
+  # place, so that they are never seen partially written.
+  tmpdir = tempfile.mkdtemp(prefix=".tmp", dir=tls_store_dir())
+  try:
+    for item in auth_info:
+      fd = os.open(
+          os.path.join(tmpdir, item), os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+          0600)
+      with os.fdopen(fd, 'w') as f:
+        f.write(auth_info[item])
+    try:
+      os.rename(tmpdir, auth_info_dir)
+    except OSError:
+      # Another process was faster.
+      if not os.path.isdir(auth_info_dir):
+        raise
+  finally:
+    shutil.rmtree(tmpdir, ignore_errors=True)
+  gc_tls_store()
   return ans
 
 
+def gc_tls_store(keep=MAX_AUTH_INFOS):
+  """Removes the least recently used versions of the TLS material, keeping
+  `keep` of them.
+
+  The temporary directories of the writes in progress are never removed.
+  """
+  root = tls_store_dir()
+  dirs = [
+      os.path.join(root, name)
+      for name in os.listdir(root)
+      if not name.startswith(".") and os.path.isdir(os.path.join(root, name))
+  ]
+  dirs.sort(key=os.path.getmtime, reverse=True)
+  for dirname in dirs[keep:]:
+    shutil.rmtree(dirname, ignore_errors=True)
+
+
+def connect(bazel_bf_options, lambda_config):
+  """Ensures that the remote build system is up and returns `(status, auth_info)`.
+
+  The connection info is taken from the local status cache when possible (see
+  `status_cache.read` and `status_cache.get_ttl`).
+  """
+  infra_endpoint = lambda_config["infra_endpoint"]
+  ttl = status_cache.get_ttl(bazel_bf_options["status_cache_ttl"],
+                             lambda_config)
+  # The status cache does not record the additional worker pools.
+  if (ttl > 0 and not bazel_bf_options["force_update"] and
+      not bazel_bf_options.get("worker_pools")):
+    cached = status_cache.read(
+        infra_endpoint, workers=bazel_bf_options["workers"], ttl=ttl)
+    if cached:
+      print "Remote build system: using cached executor %s" % cached[0][
+          "remote_executor"]
+      return cached
+
+  # Imported lazily because it pulls in `requests` and the AWS libraries.
+  import infra_api
+  remote = infra_api.ControlBuildInfra(
+      endpoint=infra_endpoint,
+      auth=infra_api.iam_auth(region=lambda_config["region"]))
+  (status, auth_info) = remote_setup_loop(
+      remote,
+      up=bazel_bf_options["workers"],
+      force_update=bazel_bf_options["force_update"],
+      timeout=bazel_bf_options["setup_timeout"],
+      long_poll=True,
+      pools=bazel_bf_options.get("worker_pools"))
+  if ttl > 0:
+    status_cache.write(infra_endpoint, status, auth_info)
+  return (status, auth_info)
+
+
 # pylint: disable=too-few-public-methods
 @attr.s
 class CommandInfo(object):
@@ -141,18 +363,16 @@ def build_command(bazel_bf_options, lambda_config, command, command_args):
     fs_auth_info = filesystem_auth_info(auth_info) if auth_info else None
     bazel_options = remote_bazel_options(crosstool_top=crosstool_top)
   else:
-    remote = infra_api.ControlBuildInfra(
-        endpoint=lambda_config["infra_endpoint"], auth=infra_api.iam_auth())
-    (status, auth_info) = remote_setup_loop(
-        remote,
-        up=bazel_bf_options["workers"],
-        force_update=bazel_bf_options["force_update"])
+    (status, auth_info) = connect(bazel_bf_options, lambda_config)
     remote_executor = status["remote_executor"]
     crosstool_top = lambda_config["crosstool_top"]
     fs_auth_info = filesystem_auth_info(auth_info) if auth_info else None
     bazel_options = remote_bazel_options(crosstool_top=crosstool_top)
 
-  cmd = [command] + command_args + bazel_options
+  cmd = [command] + command_args
+  if is_crosstool_folded(bazel_bf_options["crosstool_prefetch"], command):
+    cmd.append(crosstool_top)
+  cmd += bazel_options
 
   return CommandInfo(
       crosstool_top=crosstool_top,
@@ -167,13 +387,17 @@ def call(bazel_bf_options, lambda_config, command, command_args):
   check_workspace()
   cmd_info = build_command(bazel_bf_options, lambda_config, command,
                            command_args)
-  subprocess.check_call(
-      [bazel_bf_options["bazel_bin"], "build", cmd_info.crosstool_top])
+  if should_prefetch_crosstool(bazel_bf_options["crosstool_prefetch"], command,
+                               cmd_info.crosstool_top):
+    subprocess.check_call(
+        [bazel_bf_options["bazel_bin"], "build", cmd_info.crosstool_top])
+    mark_crosstool_built(cmd_info.crosstool_top)
   print "Bazel command: %s" % " ".join(cmd_info.cmd)
   if cmd_info.fs_auth_info:
     with auth.AuthProxy(
         auth_info=cmd_info.fs_auth_info,
-        backend=cmd_info.remote_executor) as proxy:
+        backend=cmd_info.remote_executor,
+        idle_timeout=bazel_bf_options["auth_proxy_idle_timeout"]) as proxy:
       return subprocess.call([bazel_bf_options["bazel_bin"]] + cmd_info.cmd +
                              ["--remote_executor=" + proxy])
   elif cmd_info.remote_executor:
@@ -11,25 +11,39 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Command-line interface for the remote build system."""
+"""Command-line interface for the remote build system.
+
+To keep startup fast, the modules that pull in the AWS libraries, `requests`
+or the schema validation are imported only by the subcommands that need them.
+"""
 
 import os
 import sys
-import pprint
 import argparse
 import json
 
-import rbs.common.config as config
 import rbs.common.runfiles as runfiles
-import setup
+import status_cache
 import bazel
-import infra_api
 
 
 class CommandLineException(Exception):
   """Raised when the command-mine arguments are invalid."""
 
 
+def read_config():
+  """Reads the remote configuration, after making the AWS libraries usable."""
+  runfiles.extract_botocore_data()
+  import rbs.common.config as config
+  return config.read_config()
+
+
+def write_config(next_config):
+  """Writes the remote configuration."""
+  import rbs.common.config as config
+  return config.write_config(next_config)
+
+
 def cli_remote(argv, remote=None):
   """Command-line interface for the `remote` command (control of the remote environment)."""
   parser = argparse.ArgumentParser(
@@ -64,21 +78,26 @@ def cli_remote(argv, remote=None):
   args = parser.parse_args(argv)
 
   if not remote:
-    lambda_config = config.read_config()
+    import infra_api
+    lambda_config = read_config()
     if os.getenv("TEST_ONLY__NO_IAM_AUTH"):
       print "Authentication has been disabled for testing purposes"
       auth = None
     else:
-      auth = infra_api.iam_auth()
+      auth = infra_api.iam_auth(region=lambda_config["region"])
     remote = infra_api.ControlBuildInfra(
         endpoint=lambda_config["infra_endpoint"], auth=auth)
 
   if args.subparsers_name == "status":
     result = remote.status()
+    status_cache.observe(result)
   elif args.subparsers_name == "down":
+    status_cache.clear()
     result = remote.down(to=args.to)
   elif args.subparsers_name == "up":
     result = remote.connect(up=args.to, force_update=args.force_update)
+    status_cache.observe(result["status"])
+  import pprint
   pprint.pprint(result)
 
 
@@ -95,11 +114,36 @@ def cli_bazel_bf_options(argv):
       type=int,
       default=os.getenv("BUILD_WORKERS", None),
       help="minimum number of workers")
+  parser.add_argument(
+      "--worker_pools",
+      type=str,
+      default=os.getenv("BUILD_WORKER_POOLS", None),
+      help="minimum number of workers of additional worker pools, as " +
+      "'pool1=count1,pool2=count2'")
   parser.add_argument(
       "--force_update",
       action='store_true',
       help="update the remote build system even if the worker count is the same"
   )
+  parser.add_argument(
+      "--setup_timeout",
+      type=int,
+      default=1200,
+      help="maximum time, in seconds, to wait for the remote build system to be up"
+  )
+  parser.add_argument(
+      "--status_cache_ttl",
+      type=int,
+      default=status_cache.DEFAULT_TTL,
+      help="how long, in seconds, to reuse the connection info to the remote " +
+      "build system (0 to disable; at most half of the idle timeout when the " +
+      "idle shutdown is enabled)")
+  parser.add_argument(
+      "--auth_proxy_idle_timeout",
+      type=int,
+      default=1800,
+      help="how long, in seconds, to keep the authentication proxy running " +
+      "for subsequent builds once idle (0 to stop it when Bazel exits)")
   parser.add_argument(
       "--local",
       action='store_true',
@@ -117,6 +161,13 @@ def cli_bazel_bf_options(argv):
       "--crosstool_top",
       type=str,
       help="an explicit crosstool top to use (else derived from config)")
+  parser.add_argument(
+      "--crosstool_prefetch",
+      choices=bazel.CROSSTOOL_PREFETCH_MODES,
+      default="once",
+      help="when to build the crosstool before the command: 'always', " +
+      "'once' per workspace and crosstool, 'fold' it into the targets of " +
+      "build and test commands, or 'never'")
   parser.add_argument(
       "--bazel_bin", type=str, default="bazel", help="path to the Bazel binary")
 
@@ -129,11 +180,16 @@ def cli_bazel_bf_options(argv):
 
   return {
       "workers": args.workers,
+      "worker_pools": args.worker_pools,
       "force_update": args.force_update,
+      "setup_timeout": args.setup_timeout,
+      "status_cache_ttl": args.status_cache_ttl,
+      "auth_proxy_idle_timeout": args.auth_proxy_idle_timeout,
       "local": args.local,
       "privileged": args.privileged,
       "remote_executor": args.remote_executor,
       "crosstool_top": args.crosstool_top,
+      "crosstool_prefetch": args.crosstool_prefetch,
       "bazel_bin": args.bazel_bin,
   }
 
@@ -159,13 +215,15 @@ def cli_setup(argv):
       raise CommandLineException(
           "for initial setup, --region, --s3_bucket and --s3_key are all mandatory"
       )
+    import rbs.common.config as config
     config.write_local_config(
         region=args.region, s3_bucket=args.s3_bucket, s3_key=args.s3_key)
 
-  lambda_config = config.read_config()
+  lambda_config = read_config()
 
+  import setup
   next_lambda_config = setup.setup(lambda_config)
-  config.write_config(next_lambda_config)
+  write_config(next_lambda_config)
 
 
 def cli_teardown(argv):
@@ -177,7 +235,7 @@ def cli_teardown(argv):
 
   args = parser.parse_args(argv)
 
-  lambda_config = config.read_config()
+  lambda_config = read_config()
 
   if not args.force:
     print "Configuration is: " + json.dumps(
@@ -189,8 +247,10 @@ def cli_teardown(argv):
     else:
       raise CommandLineException("Abort!")
 
+  status_cache.clear()
+  import setup
   (next_lambda_config, err) = setup.teardown(lambda_config)
-  config.write_config(next_lambda_config)
+  write_config(next_lambda_config)
 
   if err:
     raise CommandLineException(
@@ -201,7 +261,12 @@ def cli_teardown(argv):
 def cli_bazel(command, command_args, bazel_bf_args):
   """Command-line interface that wraps bazel for remote or docker execution."""
   bazel_bf_options = cli_bazel_bf_options(bazel_bf_args)
-  lambda_config = config.read_config()
+  if bazel_bf_options["remote_executor"] and not bazel_bf_options["local"]:
+    # The remote build system is given explicitly: no need for the remote
+    # configuration.
+    lambda_config = None
+  else:
+    lambda_config = read_config()
 
   return bazel.call(
       bazel_bf_options=bazel_bf_options,
@@ -227,7 +292,6 @@ options     Show the remote execution options.
 
 def main(argv):
   """Entrypoint."""
-  runfiles.extract_botocore_data()
   try:
     if len(argv) < 2 or argv[1] in ["--help", "-h"]:
       print USAGE
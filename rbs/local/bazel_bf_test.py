@@ -13,10 +13,17 @@
 # limitations under the License.
 
 import unittest
-import mock
+import sys
+import os
 
 import bazel_bf
 
+# Modules that are slow to import, and that `bazel_bf` should import lazily.
+HEAVY_MODULES = ["boto3", "botocore", "requests", "jsonschema", "yaml"]
+EAGERLY_IMPORTED_MODULES = [m for m in HEAVY_MODULES if m in sys.modules]
+
+import mock  # pylint: disable=wrong-import-position
+
 
 def _test_cli_remote(method, argv, *args, **kwargs):
   remote = lambda: 0
@@ -28,6 +35,23 @@ def _test_cli_remote(method, argv, *args, **kwargs):
 
 class CliTest(unittest.TestCase):
 
+  def setUp(self):
+    os.environ["INFRA_STATUS_CACHE"] = os.path.join(
+        os.getenv("TEST_TMPDIR"), "status_cache.json")
+
+  def test_lazy_imports(self):
+    self.assertEqual(EAGERLY_IMPORTED_MODULES, [])
+
+  @mock.patch("bazel_bf.read_config")
+  def test_cli_bazel_explicit_remote_executor(self, read_config):
+    with mock.patch.object(bazel_bf.bazel, "call", return_value=0) as call:
+      self.assertEqual(
+          bazel_bf.cli_bazel("build", ["//..."], [
+              "--remote_executor=foo:bar", "--crosstool_top=@crosstool"
+          ]), 0)
+    read_config.assert_not_called()
+    self.assertIsNone(call.call_args[1]["lambda_config"])
+
   def test_cli_remote_status(self):  # pylint: disable=no-self-use
     _test_cli_remote("status", ["status"])
 
@@ -40,10 +64,15 @@ class CliTest(unittest.TestCase):
         bazel_bf.cli_bazel_bf_options([]), {
             "bazel_bin": "bazel",
             "workers": None,
+            "worker_pools": None,
             "local": False,
             "privileged": False,
             "force_update": False,
+            "setup_timeout": 1200,
+            "status_cache_ttl": 3600,
+            "auth_proxy_idle_timeout": 1800,
             "crosstool_top": None,
+            "crosstool_prefetch": "once",
             "remote_executor": None,
         })
     self.assertEqual(bazel_bf.cli_bazel_bf_options(["--local"])["local"], True)
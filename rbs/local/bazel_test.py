@@ -13,6 +13,8 @@
 # limitations under the License.
 
 import unittest
+import tempfile
+import os
 import mock
 
 import bazel
@@ -46,8 +48,270 @@ class BazelTest(unittest.TestCase):
             "workers_status": "Response.UpToDate",
         })
     m.assert_has_calls(
-        [mock.call(10, force_update=False),
-         mock.call(10, force_update=False)])
+        [mock.call(10, force_update=False, pools=None),
+         mock.call(10, force_update=False, pools=None)])
+
+  def test_is_remote_ready(self):
+    status = {
+        "remote_executor": "foo:bar",
+        "running_workers": 1,
+        "server_status": "Response.UpToDate",
+        "workers_status": "Response.UpToDate",
+    }
+    self.assertTrue(bazel.is_remote_ready(status))
+    status["worker_pools_status"] = {"large": "Response.Creating"}
+    self.assertFalse(bazel.is_remote_ready(status))
+    status["worker_pools_status"] = {"large": "Response.UpToDate"}
+    self.assertTrue(bazel.is_remote_ready(status))
+
+  @mock.patch('time.sleep', return_value=None)
+  def test_remote_setup_loop_long_poll(self, time_sleep):
+    remote = mock.Mock()
+    remote.connect.side_effect = [{
+        "status": {
+            "remote_executor": "NULL",
+        },
+    }, {
+        "status": {
+            "remote_executor": "foo:bar",
+            "running_workers": 1,
+            "server_status": "Response.UpToDate",
+            "workers_status": "Response.UpToDate",
+        },
+        "auth_info": "some_auth_info",
+    }]
+    (_, auth_info) = bazel.remote_setup_loop(remote, up=10, long_poll=True)
+    self.assertEqual(auth_info, "some_auth_info")
+    remote.wait.assert_called_once_with(10, timeout=20, pools=None)
+    time_sleep.assert_not_called()
+
+  @mock.patch('time.sleep', return_value=None)
+  def test_remote_setup_loop_long_poll_backoff(self, time_sleep):
+    # `/wait` returns at once, but `/connect` is not ready yet, e.g. while the
+    # stacks are being updated.
+    remote = mock.Mock()
+    remote.connect.side_effect = [{
+        "status": {
+            "remote_executor": "foo:bar",
+            "running_workers": 1,
+            "server_status": "Response.UpToDate",
+            "workers_status": "Response.AlreadyUpdating",
+        },
+    }] * 3 + [{
+        "status": {
+            "remote_executor": "foo:bar",
+            "running_workers": 1,
+            "server_status": "Response.UpToDate",
+            "workers_status": "Response.UpToDate",
+        },
+    }]
+    bazel.remote_setup_loop(remote, up=1, long_poll=True, pools="large=1")
+    self.assertEqual(remote.wait.call_count, 3)
+    remote.wait.assert_called_with(1, timeout=20, pools="large=1")
+    self.assertEqual(time_sleep.call_count, 2)
+    self.assertTrue(0.5 <= time_sleep.call_args_list[0][0][0] <= 1)
+    self.assertTrue(1 <= time_sleep.call_args_list[1][0][0] <= 2)
+
+  @mock.patch('time.sleep', return_value=None)
+  def test_remote_setup_loop_long_poll_unsupported(self, time_sleep):
+    remote = mock.Mock()
+    remote.connect.side_effect = [{
+        "status": {
+            "remote_executor": "NULL",
+        },
+    }] * 2 + [{
+        "status": {
+            "remote_executor": "foo:bar",
+            "running_workers": 1,
+            "server_status": "Response.UpToDate",
+            "workers_status": "Response.UpToDate",
+        },
+    }]
+    remote.wait.side_effect = Exception("non-200 status code (502)")
+    bazel.remote_setup_loop(remote, up=10, long_poll=True)
+    remote.wait.assert_called_once_with(10, timeout=20, pools=None)
+    self.assertEqual(time_sleep.call_count, 2)
+    # Exponential backoff with jitter
+    self.assertTrue(0.5 <= time_sleep.call_args_list[0][0][0] <= 1)
+    self.assertTrue(1 <= time_sleep.call_args_list[1][0][0] <= 2)
+
+  @mock.patch('time.sleep', return_value=None)
+  @mock.patch('time.time')
+  def test_remote_setup_loop_timeout(self, time_time, _time_sleep):
+    time_time.side_effect = [0, 5, 10]
+    remote = mock.Mock()
+    remote.connect.return_value = {
+        "status": {
+            "remote_executor": "NULL",
+        },
+    }
+    self.assertRaises(Exception, bazel.remote_setup_loop, remote, timeout=10)
+    self.assertEqual(remote.connect.call_count, 2)
+
+  @mock.patch("bazel.remote_setup_loop")
+  @mock.patch(
+      "status_cache.read", return_value=({
+          "remote_executor": "foo:bar"
+      }, None))
+  def test_connect_cached(self, status_cache_read, remote_setup_loop):
+    options = {
+        "status_cache_ttl": 60,
+        "force_update": False,
+        "workers": 3,
+    }
+    lambda_config = {"infra_endpoint": "my_endpoint", "region": "eu-west-1"}
+    self.assertEqual(
+        bazel.connect(options, lambda_config), ({
+            "remote_executor": "foo:bar"
+        }, None))
+    status_cache_read.assert_called_once_with("my_endpoint", workers=3, ttl=60)
+    remote_setup_loop.assert_not_called()
+
+    # The cache expires before the remote build system can become idle.
+    status_cache_read.reset_mock()
+    lambda_config["idle_shutdown"] = {"enabled": True, "idle_timeout": 100}
+    bazel.connect(options, lambda_config)
+    status_cache_read.assert_called_once_with("my_endpoint", workers=3, ttl=50)
+
+  @mock.patch("status_cache.write")
+  @mock.patch("bazel.remote_setup_loop", return_value=({"some": "status"}, None))
+  @mock.patch("status_cache.read")
+  def test_connect_force_update(self, status_cache_read, _remote_setup_loop,
+                                status_cache_write):
+    options = {
+        "status_cache_ttl": 60,
+        "force_update": True,
+        "workers": 3,
+        "setup_timeout": 10,
+    }
+    lambda_config = {"infra_endpoint": "my_endpoint", "region": "eu-west-1"}
+    bazel.connect(options, lambda_config)
+    status_cache_read.assert_not_called()
+    status_cache_write.assert_called_once_with("my_endpoint", {"some": "status"},
+                                               None)
+
+
+
+class FilesystemAuthInfoTest(unittest.TestCase):
+
+  def setUp(self):
+    os.environ["TLS_STORE"] = os.path.join(
+        tempfile.mkdtemp(dir=os.getenv("TEST_TMPDIR")), "tls")
+
+  def test_filesystem_auth_info(self):
+    auth_info = {
+        "tls_certificate": "ca",
+        "tls_client_certificate": "crt",
+        "tls_client_key": "key",
+    }
+    fs_auth_info = bazel.filesystem_auth_info(auth_info)
+    self.assertEqual(sorted(fs_auth_info.keys()), sorted(auth_info.keys()))
+    for item in auth_info:
+      with open(fs_auth_info[item]) as f:
+        self.assertEqual(f.read(), auth_info[item])
+      self.assertEqual(os.stat(fs_auth_info[item]).st_mode & 0777, 0600)
+
+    # Reused.
+    with mock.patch("tempfile.mkdtemp") as mkdtemp:
+      self.assertEqual(bazel.filesystem_auth_info(auth_info), fs_auth_info)
+      mkdtemp.assert_not_called()
+
+    # The certificates were rotated.
+    auth_info["tls_client_key"] = "other_key"
+    next_fs_auth_info = bazel.filesystem_auth_info(auth_info)
+    self.assertNotEqual(
+        os.path.dirname(next_fs_auth_info["tls_client_key"]),
+        os.path.dirname(fs_auth_info["tls_client_key"]))
+    self.assertEqual(len(os.listdir(os.environ["TLS_STORE"])), 2)
+
+  def test_gc_tls_store(self):
+    root = os.environ["TLS_STORE"]
+    dirs = [os.path.join(root, str(i)) for i in range(5)]
+    for i, dirname in enumerate(dirs):
+      os.makedirs(dirname)
+      os.utime(dirname, (1000 + i, 1000 + i))
+    os.makedirs(os.path.join(root, ".tmp_in_progress"))
+    os.utime(os.path.join(root, ".tmp_in_progress"), (0, 0))
+
+    bazel.gc_tls_store(keep=2)
+    self.assertEqual(sorted(os.listdir(root)), [".tmp_in_progress", "3", "4"])
+
+  def test_filesystem_auth_info_gc(self):
+    fs_auth_infos = [
+        bazel.filesystem_auth_info({"tls_client_key": str(i)})
+        for i in range(bazel.MAX_AUTH_INFOS)
+    ]
+    for i, fs_auth_info in enumerate(fs_auth_infos):
+      os.utime(
+          os.path.dirname(fs_auth_info["tls_client_key"]), (1000 + i, 1000 + i))
+    # The least recently used version is marked as used again.
+    bazel.filesystem_auth_info({"tls_client_key": "0"})
+
+    bazel.filesystem_auth_info({"tls_client_key": "other"})
+    self.assertEqual(
+        len(os.listdir(os.environ["TLS_STORE"])), bazel.MAX_AUTH_INFOS)
+    self.assertTrue(os.path.exists(fs_auth_infos[0]["tls_client_key"]))
+    self.assertFalse(os.path.exists(fs_auth_infos[1]["tls_client_key"]))
+
+
+class CrosstoolPrefetchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.workspace_dir = tempfile.mkdtemp(dir=os.getenv("TEST_TMPDIR"))
+    os.environ["CROSSTOOL_MARKERS"] = os.path.join(self.workspace_dir,
+                                                   "markers")
+    with open(os.path.join(self.workspace_dir, "WORKSPACE"), 'w') as f:
+      f.write("# bazel_toolchains")
+    os.mkdir(os.path.join(self.workspace_dir, "bazel-out"))
+    cwd = os.getcwd()
+    os.chdir(self.workspace_dir)
+    self.addCleanup(os.chdir, cwd)
+
+  def test_crosstool_marker(self):
+    self.assertFalse(bazel.is_crosstool_built("@crosstool"))
+    bazel.mark_crosstool_built("@crosstool")
+    self.assertTrue(bazel.is_crosstool_built("@crosstool"))
+    self.assertFalse(bazel.is_crosstool_built("@other_crosstool"))
+
+    # The WORKSPACE changed.
+    with open("WORKSPACE", 'a') as f:
+      f.write("\n")
+    self.assertFalse(bazel.is_crosstool_built("@crosstool"))
+    bazel.mark_crosstool_built("@crosstool")
+
+    # The output base was cleaned.
+    os.rmdir("bazel-out")
+    self.assertFalse(bazel.is_crosstool_built("@crosstool"))
+
+  def test_should_prefetch_crosstool(self):
+    self.assertTrue(
+        bazel.should_prefetch_crosstool("always", "build", "@crosstool"))
+    self.assertFalse(
+        bazel.should_prefetch_crosstool("never", "build", "@crosstool"))
+    self.assertFalse(
+        bazel.should_prefetch_crosstool("fold", "test", "@crosstool"))
+    self.assertTrue(
+        bazel.should_prefetch_crosstool("fold", "run", "@crosstool"))
+    self.assertTrue(
+        bazel.should_prefetch_crosstool("once", "build", "@crosstool"))
+    bazel.mark_crosstool_built("@crosstool")
+    self.assertFalse(
+        bazel.should_prefetch_crosstool("once", "build", "@crosstool"))
+    self.assertTrue(
+        bazel.should_prefetch_crosstool("always", "build", "@crosstool"))
+
+  def test_build_command_fold(self):
+    options = {
+        "local": False,
+        "remote_executor": "foo:bar",
+        "crosstool_top": "@crosstool",
+        "crosstool_prefetch": "fold",
+    }
+    cmd_info = bazel.build_command(options, None, "test", ["//..."])
+    self.assertEqual(cmd_info.cmd[:3], ["test", "//...", "@crosstool"])
+    cmd_info = bazel.build_command(options, None, "run", ["//:bin"])
+    self.assertEqual(cmd_info.cmd[:2], ["run", "//:bin"])
+    self.assertNotIn("@crosstool", cmd_info.cmd)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,112 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs tasks concurrently, as soon as the tasks they depend on are done.
+
+It is used to set up and tear down the CloudFormation stacks, where most of the
+time is spent waiting on AWS.
+"""
+import time
+
+from concurrent import futures
+import attr
+
+
+# pylint: disable=too-few-public-methods
+@attr.s
+class TaskResult(object):
+  """Result of a task."""
+  # Return value of the task.
+  value = attr.ib(default=None)
+  # Exception raised by the task, if any.
+  error = attr.ib(default=None)
+  # Whether the task was skipped because one of its dependencies failed.
+  skipped = attr.ib(default=False)
+  # Time, in seconds, the task took.
+  elapsed = attr.ib(default=0)
+
+  def ok(self):
+    """Whether the task succeeded."""
+    return not self.error and not self.skipped
+
+
+def _timed(task, dependency_values):
+  start = time.time()
+  try:
+    return TaskResult(value=task(dependency_values), elapsed=time.time() - start)
+  except Exception as e:  # pylint: disable=broad-except
+    print "Error: %s" % e
+    return TaskResult(error=e, elapsed=time.time() - start)
+
+
+def run(tasks, dependencies=None, max_workers=4):
+  """Runs tasks concurrently.
+
+  `tasks` is a dictionary of task names to functions.  A function is called with
+  a dictionary of the names of the tasks it depends on to their return values.
+  `dependencies` is a dictionary of task names to the list of the names of the
+  tasks they depend on.  A task is skipped if one of its dependencies failed.
+
+  Returns a dictionary of task names to `TaskResult` objects.
+  """
+  dependencies = dependencies or {}
+  for name in tasks:
+    for dependency in dependencies.get(name, []):
+      if dependency not in tasks:
+        raise Exception("task '%s' depends on unknown task '%s'" %
+                        (name, dependency))
+
+  results = {}
+  pending = {}
+  executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+  try:
+    while len(results) < len(tasks):
+      progress = False
+      for name in sorted(tasks):
+        if name in results or name in pending.values():
+          continue
+        deps = dependencies.get(name, [])
+        if any(dep in results and not results[dep].ok() for dep in deps):
+          results[name] = TaskResult(skipped=True)
+          progress = True
+        elif all(dep in results for dep in deps):
+          pending[executor.submit(_timed, tasks[name],
+                                  {dep: results[dep].value
+                                   for dep in deps})] = name
+          progress = True
+      if not pending:
+        if not progress:
+          raise Exception("circular dependencies between tasks: %s" %
+                          sorted(set(tasks) - set(results)))
+        continue
+      (done, _) = futures.wait(
+          pending.keys(), return_when=futures.FIRST_COMPLETED)
+      for future in done:
+        results[pending.pop(future)] = future.result()
+  finally:
+    executor.shutdown(wait=True)
+  return results
+
+
+def print_summary(title, results):
+  """Prints how long each task took, slowest first."""
+  print "%s:" % title
+  for (name, result) in sorted(
+      results.items(), key=lambda item: -item[1].elapsed):
+    if result.skipped:
+      state = "skipped"
+    elif result.error:
+      state = "failed"
+    else:
+      state = "ok"
+    print "  %-20s %7.1fs  %s" % (name, result.elapsed, state)
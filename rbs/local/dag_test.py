@@ -0,0 +1,84 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import threading
+
+import dag
+
+
+class DagTest(unittest.TestCase):
+
+  def test_run(self):
+    started = threading.Event()
+
+    def first(_):
+      # "second" runs concurrently, as it does not depend on "first".
+      self.assertTrue(started.wait(5))
+      return 1
+
+    def second(_):
+      started.set()
+      return 2
+
+    results = dag.run(
+        {
+            "first": first,
+            "second": second,
+            "third": lambda deps: deps["first"] + deps["second"],
+        },
+        dependencies={"third": ["first", "second"]})
+    self.assertEqual(results["third"].value, 3)
+    self.assertTrue(all(result.ok() for result in results.values()))
+
+  def test_run_error(self):
+
+    def fail(_):
+      raise Exception("failed")
+
+    results = dag.run(
+        {
+            "fail": fail,
+            "other": lambda _: "other",
+            "dependent": lambda _: "dependent",
+            "transitive_dependent": lambda _: "transitive_dependent",
+        },
+        dependencies={
+            "dependent": ["fail", "other"],
+            "transitive_dependent": ["dependent"],
+        })
+    self.assertEqual(results["fail"].error.message, "failed")
+    self.assertEqual(results["other"].value, "other")
+    self.assertTrue(results["dependent"].skipped)
+    self.assertTrue(results["transitive_dependent"].skipped)
+    dag.print_summary("Summary", results)
+
+  def test_run_invalid_dependencies(self):
+    self.assertRaises(
+        Exception,
+        dag.run, {"a": lambda _: None}, dependencies={"a": ["unknown"]})
+    self.assertRaises(
+        Exception,
+        dag.run, {
+            "a": lambda _: None,
+            "b": lambda _: None
+        },
+        dependencies={
+            "a": ["b"],
+            "b": ["a"]
+        })
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -14,9 +14,21 @@
 """API for the remote build system."""
 
 import requests
+import requests.auth
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from requests_aws4auth import AWS4Auth
 import boto3.session
 
+# HTTP status codes for which a request to the API is retried.
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# HTTP status codes for which a long-polling request is retried.  A server error
+# may come from the timeout of the API gateway, after about 29 seconds: retrying
+# would block the client for minutes.
+LONG_POLL_RETRY_STATUS_CODES = [429]
+# Paths of the long-polling requests.
+LONG_POLL_PATHS = ["/wait"]
+
 
 def requests_verbose():
   """Logs all the requests, for debugging."""
@@ -31,40 +43,116 @@ def requests_verbose():
   req_log.propagate = True
 
 
-def iam_auth(credentials=None):
+class IamAuth(requests.auth.AuthBase):
+  """`requests` auth object for IAM authentication (the SigV4 protocol).
+
+  The signing key is derived once, and derived again only when the credentials
+  change (temporary credentials are refreshed by `botocore` when they expire).
+  """
+
+  def __init__(self, credentials, region):
+    self.credentials = credentials
+    self.region = region
+    self._frozen_credentials = None
+    self._auth = None
+
+  def __call__(self, r):
+    frozen_credentials = self.credentials.get_frozen_credentials()
+    if frozen_credentials != self._frozen_credentials:
+      self._auth = AWS4Auth(
+          frozen_credentials.access_key,
+          frozen_credentials.secret_key,
+          self.region,
+          'execute-api',
+          session_token=frozen_credentials.token)
+      self._frozen_credentials = frozen_credentials
+    return self._auth(r)
+
+
+def iam_auth(region, credentials=None):
   """Returns a `requests` auth object for IAM authentication."""
   if credentials is None:
     # Gets the default AWS credentials
     credentials = boto3.session.Session().get_credentials()
-  return AWS4Auth(credentials.access_key, credentials.secret_key, 'eu-west-1',
-                  'execute-api')
+  return IamAuth(credentials, region)
+
+
+def retry_adapter(retries, status_forcelist):
+  """Returns a `requests` adapter that retries the requests on connection errors
+  and on the given HTTP status codes."""
+  return HTTPAdapter(max_retries=Retry(
+      total=retries,
+      backoff_factor=0.5,
+      status_forcelist=status_forcelist,
+      raise_on_status=False))
+
+
+def session(retries=3, endpoint=None):
+  """Returns a `requests` session that keeps the connections alive and retries
+  the requests on throttling and server errors.
+
+  If `endpoint` is given, the long-polling requests to the endpoint are only
+  retried on throttling.
+  """
+  ans = requests.Session()
+  adapter = retry_adapter(retries, RETRY_STATUS_CODES)
+  ans.mount("https://", adapter)
+  ans.mount("http://", adapter)
+  if endpoint:
+    long_poll_adapter = retry_adapter(retries, LONG_POLL_RETRY_STATUS_CODES)
+    for path in LONG_POLL_PATHS:
+      ans.mount(endpoint + path, long_poll_adapter)
+  return ans
 
 
 class ControlBuildInfra(object):
   """API for the remote build system."""
 
-  def __init__(self, endpoint, auth=None):
+  def __init__(self, endpoint, auth=None, http_session=None):
     self.endpoint = endpoint
     self.auth = auth
+    self.session = http_session or session(endpoint=endpoint)
 
   def _get(self, path, payload=None):
     if not payload:
       payload = {}
     url = self.endpoint + path
-    r = requests.get(url, params=payload, auth=self.auth)
+    r = self.session.get(url, params=payload, auth=self.auth)
     if r.status_code != 200:
       raise Exception(
           "non-200 status code (%d):\nURL: %s\nParams: %s\nResponse: %s" %
           (r.status_code, url, payload, r.text))
     return r.json()
 
-  def connect(self, up=None, force_update=False):
-    """Gets connection info to the remote build system and ensure a service level."""
+  def connect(self, up=None, force_update=False, pools=None):
+    """Gets connection info to the remote build system and ensure a service level.
+
+    `pools` gives the minimum worker count of additional worker pools, as
+    "pool1=count1,pool2=count2".
+    """
     payload = {"force_update": "true" if force_update else "false"}
     if up:
       payload["up"] = up
+    if pools:
+      payload["pools"] = pools
     return self._get("/connect", payload)
 
+  def wait(self, up=None, timeout=None, pools=None):
+    """Waits until the remote build system is ready, the build server has just
+    started, or the timeout (in seconds) expires.
+
+    The wait happens on the server side (long polling).  `pools` is given as for
+    `connect`.
+    """
+    payload = {}
+    if up:
+      payload["up"] = up
+    if timeout is not None:
+      payload["timeout"] = timeout
+    if pools:
+      payload["pools"] = pools
+    return self._get("/wait", payload)
+
   def status(self):
     """Gets the status of the remote build system."""
     return self._get("/status")
@@ -14,6 +14,8 @@
 
 import unittest
 import requests_mock
+import requests
+from botocore.credentials import Credentials
 
 import infra_api
 
@@ -29,6 +31,20 @@ class SetupTest(unittest.TestCase):
       self.assertEqual(self.api.connect(), {"foo": "bar"})
       m.get('http://foo.bar/connect?up=2', json={"qux": "wobble"})
       self.assertEqual(self.api.connect(up=2), {"qux": "wobble"})
+      m.get(
+          'http://foo.bar/connect?up=2&pools=large%3D1', json={"pools": "large"})
+      self.assertEqual(
+          self.api.connect(up=2, pools="large=1"), {"pools": "large"})
+
+  def test_wait(self):
+    with requests_mock.Mocker() as m:
+      m.get('http://foo.bar/wait?up=2&timeout=20', json={"foo": "bar"})
+      self.assertEqual(self.api.wait(up=2, timeout=20), {"foo": "bar"})
+      m.get(
+          'http://foo.bar/wait?up=2&timeout=20&pools=large%3D1',
+          json={"foo": "baz"})
+      self.assertEqual(
+          self.api.wait(up=2, timeout=20, pools="large=1"), {"foo": "baz"})
 
   def test_status(self):
     with requests_mock.Mocker() as m:
@@ -40,6 +56,30 @@ class SetupTest(unittest.TestCase):
       m.get('http://foo.bar/down?to=10', json={"foo": "bar"})
       self.assertEqual(self.api.down(to=10), {"foo": "bar"})
 
+  def test_session_retries(self):
+    retries = self.api.session.get_adapter("https://foo.bar").max_retries
+    self.assertEqual(retries.total, 3)
+    self.assertItemsEqual(retries.status_forcelist, [429, 500, 502, 503, 504])
+    # The long-polling requests are not retried on server errors.
+    retries = self.api.session.get_adapter("http://foo.bar/wait").max_retries
+    self.assertEqual(retries.total, 3)
+    self.assertItemsEqual(retries.status_forcelist, [429])
+    retries = self.api.session.get_adapter("http://foo.bar/connect").max_retries
+    self.assertItemsEqual(retries.status_forcelist, [429, 500, 502, 503, 504])
+
+  def test_iam_auth(self):
+    credentials = Credentials("access_key", "secret_key", token="token")
+    auth = infra_api.iam_auth(region="us-east-1", credentials=credentials)
+    r = auth(requests.Request("GET", "https://foo.bar/status").prepare())
+    self.assertIn("/us-east-1/execute-api/", r.headers["Authorization"])
+    self.assertEqual(r.headers["X-Amz-Security-Token"], "token")
+    signer = auth._auth  # pylint: disable=protected-access
+    auth(requests.Request("GET", "https://foo.bar/status").prepare())
+    self.assertIs(auth._auth, signer)  # pylint: disable=protected-access
+    credentials.token = "next_token"
+    r = auth(requests.Request("GET", "https://foo.bar/status").prepare())
+    self.assertEqual(r.headers["X-Amz-Security-Token"], "next_token")
+
 
 if __name__ == '__main__':
   unittest.main()
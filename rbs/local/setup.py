@@ -26,6 +26,24 @@ from botocore.exceptions import ClientError
 
 import rbs.common.runfiles as runfiles
 import rbs.common.aws_util as aws_util
+import dag
+
+
+# Bounds, in seconds, of the delay between two polls of a change set or a stack.
+POLL_MIN_DELAY = 1
+POLL_MAX_DELAY = 15
+# Maximum time, in seconds, to wait for a change set to be created.
+CHANGE_SET_TIMEOUT = 600
+# Maximum time, in seconds, to wait for a stack to be stable.
+STACK_TIMEOUT = 3600
+
+
+def poll_delays(min_delay=POLL_MIN_DELAY, max_delay=POLL_MAX_DELAY):
+  """Generates the delays between two polls: they increase exponentially."""
+  delay = min_delay
+  while True:
+    yield delay
+    delay = min(delay * 1.5, max_delay)
 
 
 def template_body(filename):
@@ -66,12 +84,128 @@ class CfnStackDesc(object):
                                 self.desc["StackStatus"])
 
 
+def is_stack_event(event):
+  """Whether a stack event is about the stack itself (and not one of its
+  resources)."""
+  return (event["ResourceType"] == "AWS::CloudFormation::Stack" and
+          event["LogicalResourceId"] == event["StackName"])
+
+
+def is_terminal_status(status):
+  """Whether a stack in this status is not going to change by itself."""
+  return status.endswith("_COMPLETE") or status.endswith("_FAILED")
+
+
+class StackWatcher(object):
+  """Watches a stack through its events.
+
+  The events are read incrementally, using the ID of the last seen event as a
+  cursor.  They are used to build a per-resource timeline.
+  """
+
+  def __init__(self, cfn, stack_name):
+    self.cfn = cfn
+    self.stack_name = stack_name
+    self.last_event_id = None
+    # Logical resource ID to a dictionary with the resource type, the status,
+    # and the timestamps of the first and last events.
+    self.timeline = {}
+    self._seed()
+
+  def _seed(self):
+    """Sets the cursor to the latest event, so that only the events to come are
+    watched."""
+    try:
+      events = self.cfn.describe_stack_events(
+          StackName=self.stack_name)["StackEvents"]
+    except ClientError as e:
+      if "does not exist" not in e.response["Error"]["Message"]:
+        raise e
+      return
+    if events:
+      self.last_event_id = events[0]["EventId"]
+
+  def poll(self):
+    """Returns the events that happened since the last poll, oldest first."""
+    events = []
+    kwargs = {}
+    while True:
+      response = self.cfn.describe_stack_events(
+          StackName=self.stack_name, **kwargs)
+      # The events are given newest first.
+      for event in response["StackEvents"]:
+        if event["EventId"] == self.last_event_id:
+          break
+        events.append(event)
+      else:
+        if response.get("NextToken"):
+          kwargs["NextToken"] = response["NextToken"]
+          continue
+      break
+    if events:
+      self.last_event_id = events[0]["EventId"]
+    events.reverse()
+    for event in events:
+      self._record(event)
+    return events
+
+  def _record(self, event):
+    entry = self.timeline.setdefault(
+        event["LogicalResourceId"], {
+            "type": event["ResourceType"],
+            "start": event["Timestamp"],
+        })
+    entry["status"] = event["ResourceStatus"]
+    entry["end"] = event["Timestamp"]
+
+  def durations(self):
+    """Returns `(logical_id, resource_type, status, seconds)` tuples, slowest
+    first."""
+    return sorted(
+        [(logical_id, entry["type"], entry["status"],
+          (entry["end"] - entry["start"]).total_seconds())
+         for (logical_id, entry) in self.timeline.items()],
+        key=lambda item: -item[3])
+
+  def wait(self, timeout=STACK_TIMEOUT):
+    """Waits for the stack to reach a terminal status, and returns the status.
+
+    The stack is polled more often while events keep coming.
+    """
+    deadline = time.time() + timeout
+    delay = POLL_MIN_DELAY
+    while True:
+      events = self.poll()
+      for event in events:
+        print "%s: %s %s %s%s" % (
+            self.stack_name, event["LogicalResourceId"],
+            event["ResourceType"], event["ResourceStatus"],
+            " - " + event["ResourceStatusReason"]
+            if event.get("ResourceStatusReason") else "")
+        if is_stack_event(event) and is_terminal_status(
+            event["ResourceStatus"]):
+          return event["ResourceStatus"]
+      delay = POLL_MIN_DELAY if events else min(delay * 1.5, POLL_MAX_DELAY)
+      if time.time() + delay > deadline:
+        raise Exception("stack %s is not stable after %ds" % (self.stack_name,
+                                                              timeout))
+      time.sleep(delay)
+
+  def print_timeline(self, count=5):
+    """Prints the resources that took the longest."""
+    for (logical_id, resource_type, status, seconds) in self.durations()[:count]:
+      print "%s: %7.1fs %s (%s): %s" % (self.stack_name, seconds, logical_id,
+                                         resource_type, status)
+
+
 class CfnStack(object):
   """Represents a CloudFormation stack."""
 
   def __init__(self, cfn, name):
     self.cfn = cfn
     self.stack_name = name
+    # Watches the execution of the last change set.
+    self.watcher = None
 
   def describe(self):
     """Returns a `CfnStackDesc` object to describe the stack."""
@@ -104,7 +238,8 @@ class CfnStack(object):
                                              aws_util.random_string()),
           **kwargs)["Id"]
 
-    while True:
+    deadline = time.time() + CHANGE_SET_TIMEOUT
+    for delay in poll_delays():
       desc = self.cfn.describe_change_set(ChangeSetName=change_set_id)
       status = desc["Status"]
       status_reason = desc.get("StatusReason", "<empty info>")
@@ -119,17 +254,41 @@ class CfnStack(object):
           return None
         raise Exception("Change set in unexpected state for stack %s: %s - %s" %
                         (self.stack_name, status, status_reason))
-      time.sleep(2)
+      if time.time() + delay > deadline:
+        raise Exception("change set for stack %s not created after %ds" %
+                        (self.stack_name, CHANGE_SET_TIMEOUT))
+      time.sleep(delay)
+    # Only the events caused by the change set are watched.
+    self.watcher = StackWatcher(self.cfn, self.stack_name)
     return self.cfn.execute_change_set(ChangeSetName=change_set_id)
 
-  def wait_for_stack(self):
+  def wait_for_stack(self, timeout=STACK_TIMEOUT):
     """Waits for a stack to be "complete"/"stable"."""
-    while True:
+    watcher = self.watcher
+    if not watcher:
+      watcher = StackWatcher(self.cfn, self.stack_name)
       desc = self.describe()
       if desc.complete():
         return desc
-      print str(desc)
-      time.sleep(2)
+    status = watcher.wait(timeout=timeout)
+    watcher.print_timeline()
+    self.watcher = None
+    desc = self.describe()
+    if not desc.complete():
+      raise Exception("stack %s is in status %s" % (self.stack_name, status))
+    return desc
+
+
+def activity_location(lambda_config):
+  """Returns the S3 bucket and key where the Lambda function logs its activity.
+
+  This must be kept in sync with `get_location` in `rbs/lambda/activity.py`.
+  """
+  if lambda_config.get("activity"):
+    return (lambda_config["activity"]["bucket"],
+            lambda_config["activity"]["key"])
+  return (lambda_config["lambda"]["code_bucket"],
+          lambda_config["lambda"]["code_key"] + ".activity.json")
 
 
 def setup_infra(lambda_config, cfn):
@@ -155,6 +314,12 @@ def setup_infra(lambda_config, cfn):
           "ParameterKey": "WorkersStack",
           "ParameterValue": lambda_config["stacks"]["workers"],
       },
+      {
+          "ParameterKey":
+              "ActivityS3ObjectArn",
+          "ParameterValue":
+              "arn:aws:s3:::%s/%s" % activity_location(lambda_config),
+      },
   ]
   if vpc_keys[0] == "new":
     parameters += [
@@ -219,13 +384,15 @@ def setup_lambda_code(lambda_config, s3):
       desc="Lambda code")
 
 
-def main_setup_lambda(lambda_config, cfn, s3, lambda_role):
+def main_setup_lambda(lambda_config, cfn, s3, lambda_role, code_version=None):
   """Sets up the "lambda" CloudFormation stack.
 
   This stack depends on the "infra" CloudFormation stack and sets up the backend
-  for the remote build system API.
+  for the remote build system API.  The code is uploaded first, unless its
+  version is given.
   """
-  code_version = setup_lambda_code(lambda_config, s3)
+  if code_version is None:
+    code_version = setup_lambda_code(lambda_config, s3)
   lambda_stack = CfnStack(cfn, name=lambda_config["stacks"]["lambda"])
   lambda_stack.update_or_create(
       TemplateBody=template_body("lambda.yaml"),
@@ -279,59 +446,149 @@ def maybe_create_log_group(log_group, logs):
     print "Log group %s: already exists" % log_group
 
 
+# Steps of `setup`, with the steps they depend on.
+SETUP_DEPENDENCIES = {
+    "log_group": [],
+    "lambda_code": [],
+    "infra": [],
+    "lambda": ["log_group", "lambda_code", "infra"],
+}
+
+
 def setup(lambda_config):
   """Sets up the "infra" and "lambda" stacks.
 
-  These stacks are the foundations for the remote build system.
+  These stacks are the foundations for the remote build system.  The steps that
+  do not depend on each other run concurrently.
   """
   cfn = boto3.client('cloudformation', region_name=lambda_config["region"])
   s3 = boto3.client('s3', region_name=lambda_config["region"])
   logs = boto3.client('logs', region_name=lambda_config["region"])
 
-  maybe_create_log_group(lambda_config["awslogs_group"], logs)
-
-  infra_stack_outputs = setup_infra(lambda_config, cfn)
-  lambda_role = infra_stack_outputs["LambdaRole"]
-
   next_lambda_config = {}
   next_lambda_config.update(lambda_config)
-  next_lambda_config.update({
-      "cluster": infra_stack_outputs["ClusterName"],
-  })
-  lambda_stack_outputs = main_setup_lambda(next_lambda_config, cfn, s3,
-                                           lambda_role)
+
+  def setup_lambda(deps):
+    infra_stack_outputs = deps["infra"]
+    next_lambda_config.update({
+        "cluster": infra_stack_outputs["ClusterName"],
+    })
+    return main_setup_lambda(
+        next_lambda_config,
+        cfn,
+        s3,
+        lambda_role=infra_stack_outputs["LambdaRole"],
+        code_version=deps["lambda_code"])
+
+  results = dag.run(
+      {
+          "log_group":
+              lambda _: maybe_create_log_group(lambda_config["awslogs_group"],
+                                               logs),
+          "lambda_code":
+              lambda _: setup_lambda_code(lambda_config, s3),
+          "infra":
+              lambda _: setup_infra(lambda_config, cfn),
+          "lambda":
+              setup_lambda,
+      },
+      dependencies=SETUP_DEPENDENCIES)
+  dag.print_summary("Setup", results)
+  failed = sorted(name for name in results if not results[name].ok())
+  if failed:
+    raise Exception("setup failed: %s" % ", ".join(failed))
 
   next_lambda_config.update({
       "infra_endpoint":
           infra_endpoint(
-              restapi_id=lambda_stack_outputs["RestapiId"],
+              restapi_id=results["lambda"].value["RestapiId"],
               region=lambda_config["region"],
               stage="Prod"),
   })
   return next_lambda_config
 
 
+# Stacks deleted by `teardown`, with the stacks that must be deleted before them.
+TEARDOWN_DEPENDENCIES = {
+    "workers": [],
+    "server": [],
+    "lambda": [],
+    "infra": ["workers", "server", "lambda"],
+}
+# Maximum time, in seconds, to wait for a stack to be deletable or deleted.
+DELETE_TIMEOUT = 3600
+# Delay, in seconds, between two polls of a stack being deleted.
+DELETE_POLL_PERIOD = 5
+
+
+def delete_stack(cfn, stack_name, timeout=DELETE_TIMEOUT):
+  """Deletes a stack and waits for the deletion to complete."""
+  deadline = time.time() + timeout
+  delay = 2
+  while True:
+    try:
+      cfn.delete_stack(StackName=stack_name)
+      break
+    except ClientError as e:
+      if "cannot be deleted while in status" not in e.response["Error"][
+          "Message"] or time.time() + delay > deadline:
+        raise e
+      print "%s: %s" % (stack_name, e.response["Error"]["Message"])
+    time.sleep(delay)
+    delay = min(delay * 2, 30)
+  print "%s: deleting" % stack_name
+  cfn.get_waiter("stack_delete_complete").wait(
+      StackName=stack_name,
+      WaiterConfig={
+          "Delay": DELETE_POLL_PERIOD,
+          "MaxAttempts": int(max(deadline - time.time(), 0)) //
+                         DELETE_POLL_PERIOD + 1,
+      })
+  print "%s: deleted" % stack_name
+
+
+def teardown_stacks(lambda_config):
+  """Returns the stacks deleted by `teardown`, by task name, and the dependencies
+  of the tasks.
+
+  The stacks of the additional worker pools are named after the "workers" stack
+  and, like it, must be deleted before the "infra" stack.
+  """
+  stacks = {
+      stack: lambda_config["stacks"][stack] for stack in TEARDOWN_DEPENDENCIES
+  }
+  dependencies = {
+      stack: list(dependencies)
+      for (stack, dependencies) in TEARDOWN_DEPENDENCIES.items()
+  }
+  for pool in lambda_config.get("worker_pools") or []:
+    task = "workers-" + pool["name"]
+    stacks[task] = lambda_config["stacks"]["workers"] + "-" + pool["name"]
+    dependencies[task] = []
+    dependencies["infra"].append(task)
+  return (stacks, dependencies)
+
+
 def teardown(lambda_config, cfn=None):
   """Tears down all the stacks associated with the remote build system.
 
+  The stacks are deleted concurrently, except for the "infra" stack, which is
+  deleted once all the other stacks are gone.
   The remote configuration file is left intact.
   """
   cfn = cfn or boto3.client(
       'cloudformation', region_name=lambda_config["region"])
-  # TODO: parallel delete
-  err = False
-  for stack in ["workers", "server", "lambda", "infra"]:
-    while True:
-      try:
-        cfn.delete_stack(StackName=lambda_config["stacks"][stack])
-        break
-      except ClientError as e:
-        print e
-        if "cannot be deleted while in status" not in e.response["Error"][
-            "Message"]:
-          err = True
-          break
-      time.sleep(2)
+
+  def delete_task(stack_name):
+    return lambda _: delete_stack(cfn, stack_name)
+
+  (stacks, dependencies) = teardown_stacks(lambda_config)
+  results = dag.run(
+      {task: delete_task(stack_name)
+       for (task, stack_name) in stacks.items()},
+      dependencies=dependencies)
+  dag.print_summary("Teardown", results)
+  err = any(not result.ok() for result in results.values())
 
   next_lambda_config = {}
   next_lambda_config.update(lambda_config)
@@ -18,10 +18,25 @@ import datetime
 
 import boto3
 from botocore.stub import Stubber
+from botocore.exceptions import ClientError
+import mock
 
 import setup
 
 
+def _event(i, logical_id, status="CREATE_IN_PROGRESS"):
+  return {
+      "EventId": str(i),
+      "StackId": "some_stack_id",
+      "StackName": "some_stack",
+      "LogicalResourceId": logical_id,
+      "ResourceType": "AWS::CloudFormation::Stack"
+                      if logical_id == "some_stack" else "AWS::ECS::Service",
+      "ResourceStatus": status,
+      "Timestamp": datetime.datetime(2018, 1, 1, 0, 0, i),
+  }
+
+
 class SetupTest(unittest.TestCase):
 
   def setUp(self):
@@ -92,26 +107,50 @@ class SetupTest(unittest.TestCase):
     stack = setup.CfnStack(cfn, "some_stack")
     self.assertRaises(Exception, stack.describe)
 
-  def test_wait_for_stack(self):
+  @mock.patch('time.sleep', return_value=None)
+  def test_wait_for_stack(self, _time_sleep):
     cfn = boto3.client('cloudformation', region_name="eu-west-1")
     stubber = Stubber(cfn)
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={"StackEvents": [_event(0, "some_stack")]},
+        expected_params={"StackName": "some_stack"})
     stubber.add_response(
         'describe_stacks',
         service_response={
             "Stacks": [{
                 "StackName": "some_stack",
                 "CreationTime": datetime.datetime.today(),
-                "StackStatus": "",
+                "StackStatus": "UPDATE_IN_PROGRESS",
             }],
         },
         expected_params={"StackName": "some_stack"})
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={
+            "StackEvents": [
+                _event(2, "Service", "CREATE_COMPLETE"),
+                _event(1, "Service"),
+                _event(0, "some_stack"),
+            ]
+        },
+        expected_params={"StackName": "some_stack"})
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={
+            "StackEvents": [
+                _event(3, "some_stack", "UPDATE_COMPLETE"),
+                _event(2, "Service", "CREATE_COMPLETE"),
+            ]
+        },
+        expected_params={"StackName": "some_stack"})
     stubber.add_response(
         'describe_stacks',
         service_response={
             "Stacks": [{
                 "StackName": "some_stack",
                 "CreationTime": datetime.datetime.today(),
-                "StackStatus": "CREATE_COMPLETE",
+                "StackStatus": "UPDATE_COMPLETE",
                 "Description": "bar",
             }],
         },
@@ -123,6 +162,203 @@ class SetupTest(unittest.TestCase):
     self.assertEqual(response["Description"], "bar")
     stubber.assert_no_pending_responses()
 
+  def test_stack_watcher(self):
+    cfn = boto3.client('cloudformation', region_name="eu-west-1")
+    stubber = Stubber(cfn)
+    stubber.add_client_error(
+        'describe_stack_events',
+        service_error_code="ValidationError",
+        service_message="Stack with id some_stack does not exist",
+        expected_params={"StackName": "some_stack"})
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={
+            "StackEvents": [_event(3, "Service", "CREATE_COMPLETE")],
+            "NextToken": "token",
+        },
+        expected_params={"StackName": "some_stack"})
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={
+            "StackEvents": [_event(1, "Service"),
+                            _event(0, "some_stack")],
+        },
+        expected_params={
+            "StackName": "some_stack",
+            "NextToken": "token"
+        })
+    stubber.add_response(
+        'describe_stack_events',
+        service_response={
+            "StackEvents": [
+                _event(3, "Service", "CREATE_COMPLETE"),
+                _event(1, "Service"),
+            ],
+            "NextToken": "token",
+        },
+        expected_params={"StackName": "some_stack"})
+    stubber.activate()
+
+    watcher = setup.StackWatcher(cfn, "some_stack")
+    self.assertEqual(
+        [event["EventId"] for event in watcher.poll()], ["0", "1", "3"])
+    self.assertEqual(watcher.poll(), [])
+    stubber.assert_no_pending_responses()
+    self.assertEqual(watcher.durations(), [
+        ("Service", "AWS::ECS::Service", "CREATE_COMPLETE", 2),
+        ("some_stack", "AWS::CloudFormation::Stack", "CREATE_IN_PROGRESS", 0),
+    ])
+
+  @mock.patch('time.sleep', return_value=None)
+  @mock.patch('time.time')
+  def test_stack_watcher_deadline(self, time_time, _time_sleep):
+    time_time.side_effect = [0, 50, 100]
+    cfn = mock.Mock()
+    cfn.describe_stack_events.return_value = {"StackEvents": []}
+    watcher = setup.StackWatcher(cfn, "some_stack")
+    self.assertRaises(Exception, watcher.wait, timeout=60)
+
+  @mock.patch("setup.main_setup_lambda", return_value={"RestapiId": "api"})
+  @mock.patch(
+      "setup.setup_infra",
+      return_value={
+          "ClusterName": "some_cluster",
+          "LambdaRole": "some_role"
+      })
+  @mock.patch("setup.setup_lambda_code", return_value="some_version")
+  @mock.patch("setup.maybe_create_log_group")
+  @mock.patch("boto3.client")
+  def test_setup(self, _boto3_client, maybe_create_log_group,
+                 setup_lambda_code, setup_infra, main_setup_lambda):
+    lambda_config = {"region": "eu-west-1", "awslogs_group": "some_group"}
+    next_lambda_config = setup.setup(lambda_config)
+    self.assertEqual(
+        next_lambda_config, {
+            "region": "eu-west-1",
+            "awslogs_group": "some_group",
+            "cluster": "some_cluster",
+            "infra_endpoint": setup.infra_endpoint("api", "eu-west-1", "Prod"),
+        })
+    self.assertEqual(maybe_create_log_group.call_count, 1)
+    self.assertEqual(setup_lambda_code.call_count, 1)
+    self.assertEqual(setup_infra.call_count, 1)
+    self.assertEqual(main_setup_lambda.call_args[1]["lambda_role"],
+                     "some_role")
+    self.assertEqual(main_setup_lambda.call_args[1]["code_version"],
+                     "some_version")
+    self.assertEqual(main_setup_lambda.call_args[0][0]["cluster"],
+                     "some_cluster")
+
+  @mock.patch("setup.main_setup_lambda")
+  @mock.patch("setup.setup_infra", side_effect=Exception("infra failed"))
+  @mock.patch("setup.setup_lambda_code")
+  @mock.patch("setup.maybe_create_log_group")
+  @mock.patch("boto3.client")
+  def test_setup_error(self, _boto3_client, _maybe_create_log_group,
+                       _setup_lambda_code, _setup_infra, main_setup_lambda):
+    lambda_config = {"region": "eu-west-1", "awslogs_group": "some_group"}
+    with self.assertRaisesRegexp(Exception, "infra, lambda"):
+      setup.setup(lambda_config)
+    main_setup_lambda.assert_not_called()
+
+  @mock.patch('time.sleep', return_value=None)
+  def test_delete_stack(self, _time_sleep):
+    cfn = mock.Mock()
+    cfn.delete_stack.side_effect = [
+        ClientError({
+            "Error": {
+                "Code": "ValidationError",
+                "Message": "Stack cannot be deleted while in status " +
+                           "UPDATE_IN_PROGRESS",
+            }
+        }, "DeleteStack"),
+        {},
+    ]
+    setup.delete_stack(cfn, "some_stack")
+    self.assertEqual(cfn.delete_stack.call_count, 2)
+    cfn.get_waiter.assert_called_once_with("stack_delete_complete")
+    self.assertEqual(cfn.get_waiter.return_value.wait.call_args[1]["StackName"],
+                     "some_stack")
+
+  def test_teardown(self):
+    deleted = []
+    cfn = mock.Mock()
+
+    def delete_stack(StackName):  # pylint: disable=invalid-name
+      if StackName == "infra_stack":
+        # The other stacks are deleted first.
+        self.assertEqual(
+            sorted(deleted), ["lambda_stack", "server_stack", "workers_stack"])
+      deleted.append(StackName)
+
+    cfn.delete_stack.side_effect = delete_stack
+    lambda_config = {
+        "stacks": {
+            "infra": "infra_stack",
+            "lambda": "lambda_stack",
+            "server": "server_stack",
+            "workers": "workers_stack",
+        },
+        "infra_endpoint": "some_endpoint",
+        "cluster": "some_cluster",
+    }
+    (next_lambda_config, err) = setup.teardown(lambda_config, cfn=cfn)
+    self.assertFalse(err)
+    self.assertEqual(deleted[-1], "infra_stack")
+    self.assertEqual(next_lambda_config, {"stacks": lambda_config["stacks"]})
+
+  def test_teardown_worker_pools(self):
+    deleted = []
+    cfn = mock.Mock()
+
+    def delete_stack(StackName):  # pylint: disable=invalid-name
+      if StackName == "infra_stack":
+        # The stacks of the worker pools are deleted first too.
+        self.assertEqual(
+            sorted(deleted), [
+                "lambda_stack", "server_stack", "workers_stack",
+                "workers_stack-large"
+            ])
+      deleted.append(StackName)
+
+    cfn.delete_stack.side_effect = delete_stack
+    lambda_config = {
+        "stacks": {
+            "infra": "infra_stack",
+            "lambda": "lambda_stack",
+            "server": "server_stack",
+            "workers": "workers_stack",
+        },
+        "worker_pools": [{
+            "name": "large"
+        }],
+        "infra_endpoint": "some_endpoint",
+        "cluster": "some_cluster",
+    }
+    (_, err) = setup.teardown(lambda_config, cfn=cfn)
+    self.assertFalse(err)
+    self.assertEqual(deleted[-1], "infra_stack")
+    self.assertEqual(setup.TEARDOWN_DEPENDENCIES["infra"],
+                     ["workers", "server", "lambda"])
+
+  def test_teardown_error(self):
+    cfn = mock.Mock()
+    cfn.get_waiter.return_value.wait.side_effect = Exception("timeout")
+    lambda_config = {
+        "stacks": {
+            "infra": "infra_stack",
+            "lambda": "lambda_stack",
+            "server": "server_stack",
+            "workers": "workers_stack",
+        },
+        "infra_endpoint": "some_endpoint",
+        "cluster": "some_cluster",
+    }
+    (_, err) = setup.teardown(lambda_config, cfn=cfn)
+    self.assertTrue(err)
+    # The "infra" stack is not deleted, as its dependents are not gone.
+    self.assertEqual(cfn.delete_stack.call_count, 3)
+
   def test_template_body(self):  # pylint: disable=no-self-use
     setup.template_body("infra.yaml")
 
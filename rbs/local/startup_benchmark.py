@@ -0,0 +1,84 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the startup time of `bazel_bf` for the commands that should not
+need the remote configuration.
+
+Example: "bazel run //rbs/local:startup_benchmark -- --runs=20"
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import rbs.common.runfiles as runfiles
+
+# Commands to benchmark (`bazel_bf` arguments).  `true` is used in place of
+# Bazel, so that only the startup of `bazel_bf` itself is measured.
+COMMANDS = [
+    ["--help"],
+    ["options"],
+    [
+        "--remote_executor=localhost:1", "--crosstool_top=@crosstool//:top",
+        "--bazel_bin=true", "build", "//..."
+    ],
+]
+
+
+def bazel_bf_par():
+  """Returns the path to the `bazel_bf` bundle."""
+  return runfiles.get_manifest()["bazel_cloud_infra/rbs/local/bazel_bf.par"]
+
+
+def run(bazel_bf, args, cwd):
+  """Runs `bazel_bf` once and returns the elapsed time, in seconds."""
+  with open(os.devnull, 'w') as devnull:
+    start = time.time()
+    subprocess.call([bazel_bf] + args, cwd=cwd, stdout=devnull, stderr=devnull)
+    return time.time() - start
+
+
+def main():
+  """Entrypoint."""
+  parser = argparse.ArgumentParser(
+      description="Measure the startup time of bazel_bf.")
+  parser.add_argument(
+      "--runs", type=int, default=10, help="number of runs per command")
+  parser.add_argument(
+      "--bazel_bf", type=str, help="path to bazel_bf (else the bundle)")
+  args = parser.parse_args()
+
+  bazel_bf = os.path.abspath(args.bazel_bf or bazel_bf_par())
+  workspace = tempfile.mkdtemp()
+  try:
+    with open(os.path.join(workspace, "WORKSPACE"), 'w') as f:
+      f.write("# bazel_toolchains\n")
+    # The first run extracts the bundle: do not measure it.
+    run(bazel_bf, COMMANDS[0], workspace)
+    for command in COMMANDS:
+      timings = sorted(
+          run(bazel_bf, command, workspace) for _ in range(args.runs))
+      print "%-100s median: %4dms  max: %4dms" % (
+          "bazel_bf " + " ".join(command),
+          timings[len(timings) // 2] * 1000, timings[-1] * 1000)
+  finally:
+    shutil.rmtree(workspace, ignore_errors=True)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,140 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local cache of the connection info to the remote build system.
+
+It lets `bazel_bf` skip the call to the Lambda function when the remote build
+system is known to be up.  Only the statuses of a remote build system that is
+up-to-date are cached: any other status clears the cache.
+"""
+import json
+import os
+import socket
+import time
+
+# How long, in seconds, the connection info is reused by default.
+DEFAULT_TTL = 3600
+# Timeout, in seconds, of the reachability probe of the remote executor.
+PROBE_TIMEOUT = 1
+# Default idle timeout of the remote build system (see the `idle_shutdown` key of
+# the main configuration).
+DEFAULT_IDLE_TIMEOUT = 3600
+# Status of the services of a remote build system that is up-to-date.
+UP_TO_DATE = "Response.UpToDate"
+
+
+def cache_filename():
+  """Returns the name of the file the connection info is cached in."""
+  return os.getenv(
+      "INFRA_STATUS_CACHE",
+      default=os.path.expanduser("~/.bazel_bf/status_cache.json"))
+
+
+def is_reachable(address, timeout=PROBE_TIMEOUT):
+  """Whether a TCP connection can be opened to an address given as "host:port"."""
+  (host, _, port) = address.rpartition(":")
+  try:
+    sock = socket.create_connection((host, int(port)), timeout=timeout)
+  except (socket.error, ValueError):
+    return False
+  sock.close()
+  return True
+
+
+def get_ttl(ttl, lambda_config):
+  """Returns the TTL to use with a remote build system.
+
+  When the idle shutdown is enabled, the TTL is capped to half of the idle timeout:
+  a build that reuses the cache then follows a `/connect` request recent enough
+  for the remote build system not to be stopped under it.
+  """
+  idle_shutdown = lambda_config.get("idle_shutdown") or {}
+  if not idle_shutdown.get("enabled"):
+    return ttl
+  return min(ttl,
+             int(idle_shutdown.get("idle_timeout", DEFAULT_IDLE_TIMEOUT) // 2))
+
+
+def is_up_to_date(status):
+  """Whether a status shows a remote build system that is up, with services that
+  are up-to-date."""
+  return (status.get("remote_executor", "NULL") != "NULL" and
+          status.get("running_workers", 0) > 0 and all(
+              status.get(key, UP_TO_DATE) == UP_TO_DATE
+              for key in ["server_status", "workers_status"]))
+
+
+def observe(status, path=None):
+  """Clears the cache if a status of the remote build system, obtained outside
+  of `connect`, is not up-to-date."""
+  if not is_up_to_date(status):
+    clear(path=path)
+
+
+def write(infra_endpoint, status, auth_info, path=None):
+  """Caches the connection info returned by `/connect`, or clears the cache if
+  the status is not up-to-date."""
+  path = path or cache_filename()
+  if not is_up_to_date(status):
+    clear(path=path)
+    return
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  entry = {
+      "infra_endpoint": infra_endpoint,
+      "status": status,
+      "auth_info": auth_info,
+      "time": time.time(),
+  }
+  # The auth info contains a private key.
+  fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+  with os.fdopen(fd, 'w') as f:
+    json.dump(entry, f, sort_keys=True)
+  os.rename(path + ".tmp", path)
+
+
+def read(infra_endpoint, workers=None, ttl=DEFAULT_TTL, path=None):
+  """Returns the cached `(status, auth_info)`, or `None` if there is no valid
+  cache entry.
+
+  An entry is valid if it is for the same endpoint, is less than `ttl` seconds old,
+  is up-to-date, has at least `workers` running workers, and if the remote
+  executor is reachable.
+  """
+  path = path or cache_filename()
+  try:
+    with open(path, 'r') as f:
+      entry = json.load(f)
+  except (IOError, ValueError):
+    return None
+  if (entry.get("infra_endpoint") != infra_endpoint or
+      time.time() - entry["time"] >= ttl):
+    return None
+  status = entry["status"]
+  if not is_up_to_date(status):
+    return None
+  if workers and status["running_workers"] < workers:
+    return None
+  if not is_reachable(status["remote_executor"]):
+    return None
+  return (status, entry["auth_info"])
+
+
+def clear(path=None):
+  """Forgets the cached connection info."""
+  path = path or cache_filename()
+  try:
+    os.remove(path)
+  except OSError as e:
+    if e.errno != 2:  # No such file or directory
+      raise
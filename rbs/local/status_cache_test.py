@@ -0,0 +1,104 @@
+# Copyright 2018 The Bazel Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import socket
+import stat
+import tempfile
+
+import mock
+
+import status_cache
+
+
+class StatusCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = os.path.join(
+        tempfile.mkdtemp(dir=os.getenv("TEST_TMPDIR")), "status_cache.json")
+    self.server = socket.socket()
+    self.server.bind(("localhost", 0))
+    self.server.listen(1)
+    self.status = {
+        "remote_executor": "localhost:%d" % self.server.getsockname()[1],
+        "running_workers": 2,
+    }
+
+  def tearDown(self):
+    self.server.close()
+
+  def test_read_missing(self):
+    self.assertIsNone(status_cache.read("my_endpoint", path=self.path))
+
+  def test_write_read(self):
+    status_cache.write(
+        "my_endpoint", self.status, {"some": "auth_info"}, path=self.path)
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+    self.assertEqual(
+        status_cache.read("my_endpoint", workers=2, path=self.path),
+        (self.status, {
+            "some": "auth_info"
+        }))
+    self.assertIsNone(status_cache.read("other_endpoint", path=self.path))
+    self.assertIsNone(
+        status_cache.read("my_endpoint", workers=3, path=self.path))
+    with mock.patch("time.time", return_value=1e12):
+      self.assertIsNone(status_cache.read("my_endpoint", path=self.path))
+    status_cache.clear(path=self.path)
+    self.assertIsNone(status_cache.read("my_endpoint", path=self.path))
+    status_cache.clear(path=self.path)
+
+  def test_not_up_to_date(self):
+    status_cache.write("my_endpoint", self.status, None, path=self.path)
+    status_cache.write(
+        "my_endpoint",
+        dict(self.status, workers_status="Response.Scaling"),
+        None,
+        path=self.path)
+    self.assertFalse(os.path.exists(self.path))
+
+    status_cache.write("my_endpoint", self.status, None, path=self.path)
+    status_cache.observe(self.status, path=self.path)
+    self.assertIsNotNone(status_cache.read("my_endpoint", path=self.path))
+    status_cache.observe(
+        dict(self.status, running_workers=0), path=self.path)
+    self.assertIsNone(status_cache.read("my_endpoint", path=self.path))
+
+  def test_get_ttl(self):
+    self.assertEqual(status_cache.get_ttl(3600, {}), 3600)
+    self.assertEqual(
+        status_cache.get_ttl(3600, {"idle_shutdown": {
+            "enabled": False
+        }}), 3600)
+    self.assertEqual(
+        status_cache.get_ttl(3600, {"idle_shutdown": {
+            "enabled": True
+        }}), 1800)
+    self.assertEqual(
+        status_cache.get_ttl(60, {
+            "idle_shutdown": {
+                "enabled": True,
+                "idle_timeout": 600
+            }
+        }), 60)
+
+  def test_unreachable_executor(self):
+    status_cache.write("my_endpoint", self.status, None, path=self.path)
+    self.server.close()
+    self.assertIsNone(status_cache.read("my_endpoint", path=self.path))
+
+
+if __name__ == '__main__':
+  unittest.main()
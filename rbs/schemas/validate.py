@@ -11,7 +11,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Validates configuration objects against JSON schemas."""
+"""Validates configuration objects against JSON schemas.
+
+The schemas are compiled into validators once per process.  At build time,
+they are also serialized to a JSON sidecar (see `main`) so that bundled
+executables do not have to parse YAML on startup.
+"""
+import argparse
+import json
+
 import jsonschema
 import yaml
 
@@ -24,22 +32,88 @@ SCHEMAS = [
     "test_config",
 ]
 
+SIDECAR = "schemas.json"
+
+# The C loader is an order of magnitude faster than the pure-Python one, but
+# it is only available when PyYAML was compiled against libyaml.
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def validate(instance, schema_name):
   """Validates an object against a pre-built schema."""
-  jsonschema.validate(instance, get_schema(schema_name))
+  get_validator(schema_name).validate(instance)
+
 
+_validators = {schema_name: None for schema_name in SCHEMAS}
 
-_schemas = {schema_name: None for schema_name in SCHEMAS}
+
+def get_validator(schema_name):
+  """Returns the compiled validator for the given schema name."""
+  global _validators  # pylint: disable=global-statement
+  if not _validators[schema_name]:
+    schema = get_schema(schema_name)
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    _validators[schema_name] = cls(schema)
+  return _validators[schema_name]
+
+
+_schemas = None
 
 
 def get_schema(schema_name):
   """Returns the JSON schema for the given schema name."""
   global _schemas  # pylint: disable=global-statement
-  if not _schemas[schema_name]:
-    _schemas[schema_name] = yaml.load(
-        runfiles.get_data(
-            schema_name + ".yaml",
-            pkg="rbs.schemas.validate",
-            prefix="bazel_cloud_infra/rbs/schemas/"))
+  if _schemas is None:
+    _schemas = read_sidecar() or {}
+  if schema_name not in _schemas:
+    _schemas[schema_name] = read_yaml_schema(schema_name)
   return _schemas[schema_name]
+
+
+def read_sidecar():
+  """Reads the JSON sidecar with all the schemas, or returns `None` if it
+  was not built."""
+  try:
+    content = runfiles.get_data(
+        SIDECAR,
+        pkg="rbs.schemas.validate",
+        prefix="bazel_cloud_infra/rbs/schemas/")
+  except (IOError, KeyError):
+    return None
+  if content is None:
+    return None
+  return json.loads(content)
+
+
+def read_yaml_schema(schema_name):
+  """Reads the YAML source of the JSON schema for the given schema name."""
+  return yaml.load(
+      runfiles.get_data(
+          schema_name + ".yaml",
+          pkg="rbs.schemas.validate",
+          prefix="bazel_cloud_infra/rbs/schemas/"),
+      Loader=YamlLoader)
+
+
+def compile_schemas():
+  """Returns all the schemas, checked, in the format of the JSON sidecar."""
+  schemas = {}
+  for schema_name in SCHEMAS:
+    schema = read_yaml_schema(schema_name)
+    jsonschema.validators.validator_for(schema).check_schema(schema)
+    schemas[schema_name] = schema
+  return schemas
+
+
+def main():
+  """Writes the JSON sidecar."""
+  parser = argparse.ArgumentParser(description="Compile the JSON schemas.")
+  parser.add_argument("output", help="Path to the JSON sidecar.")
+  args = parser.parse_args()
+  with open(args.output, 'w') as f:
+    json.dump(compile_schemas(), f, sort_keys=True)
+
+
+if __name__ == "__main__":
+  main()
@@ -44,6 +44,19 @@ class ValidateTest(unittest.TestCase):
   def test_test_config(self):
     _validate("test_config.json", "test_config")
 
+  def test_get_validator(self):
+    validator = validate.get_validator("local_config")
+    self.assertIs(validate.get_validator("local_config"), validator)
+    self.assertFalse(validator.is_valid({"foo": "bar"}))
+
+  def test_compile_schemas(self):
+    schemas = validate.compile_schemas()
+    self.assertEqual(sorted(schemas.keys()), sorted(validate.SCHEMAS))
+    for schema_name in validate.SCHEMAS:
+      self.assertEqual(
+          json.loads(json.dumps(schemas[schema_name])),
+          validate.read_yaml_schema(schema_name))
+
 
 if __name__ == '__main__':
   unittest.main()